@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from account.models import User
+from images.thumbnails import generate_thumbnails
 
 
 class SelfUserSerializer(serializers.ModelSerializer):
@@ -52,6 +53,8 @@ class UserRegisterationSerializer(serializers.ModelSerializer):
             image = image,
         )
         new_user.set_password(password)
+        if image:
+            generate_thumbnails(new_user.image.path)
 
         return new_user
 
@@ -62,11 +65,5 @@ class ChangePasswordSerializer(serializers.Serializer):
     new_password_confirmation = serializers.CharField(required=True)
 
 
-class EditImageSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ['image']
-
-
 class UserBookListSerializer(serializers.Serializer):
     pass
@@ -3,16 +3,15 @@ from datetime import datetime, timedelta
 
 from django.contrib.auth import authenticate
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage, send_mail
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
 from django.utils.encoding import force_bytes, force_text
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import (api_view, authentication_classes,
-                                       permission_classes)
+                                       permission_classes, renderer_classes)
 from rest_framework.generics import UpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -20,12 +19,21 @@ from rest_framework.views import APIView
 
 from account.models import User
 from account.tokens import account_activation_token
+from book.models import Book
+from bookshare.etags import get_etag_headers, get_not_modified_response, make_etag
 from bookshare.settings import (DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE,
                                 MEDIA_ROOT, MSG_LANGUAGE)
-
-from .serializers import (ChangePasswordSerializer, EditImageSerializer,
-                          EditUserSerializer, SelfUserSerializer,
-                          UserRegisterationSerializer, UserSerializer)
+from images.renderers import IMAGE_RENDERER_CLASSES
+from images.serializers import ImageUploadSerializer
+from images.serving import serve_image
+from images.thumbnails import parse_thumbnail_size
+from mailing.outbox import enqueue_email
+from mailing.rendering import render_email
+from sharing.models import BookExchange, duration_rank
+
+from .serializers import (ChangePasswordSerializer, EditUserSerializer,
+                          SelfUserSerializer, UserRegisterationSerializer,
+                          UserSerializer)
 
 # messages:
 MSG_NO_EMAIL =                  {'Persian': 'رایانامه ارائه نشده است', 'English': 'No email was provided!'}[MSG_LANGUAGE]
@@ -51,6 +59,7 @@ MSG_REGISTER_SUCCESS =          {'Persian': 'شما با موفقیت ثبت ن
 MSG_LOGIN_SUCCESS =             {'Persian': 'شما با موفقیت وارد حساب کاربری خود شدید', 'English': 'You successfully logged in to your account.'}[MSG_LANGUAGE]
 MSG_EDIT_ACCOUNT_SUCCESS =      {'Persian': 'شما با موفقیت اطلاعات حساب خود را تغییر دادید', 'English': 'You have successfully updated your account.'}[MSG_LANGUAGE]
 MSG_EDIT_IMAGE_SUCCESS =        {'Persian': 'شما با موفقیت تصویر را تغییر دادید', 'English': 'You have successfully updated your image.'}[MSG_LANGUAGE]
+MSG_INVALID_IMAGE_SIZE =        {'Persian': 'اندازه تصویر نامعتبر است', 'English': 'Invalid image size!'}[MSG_LANGUAGE]
 MSG_CHANGEPASSWORD_SUCCESS =    {'Persian': 'شما با موفقیت رمز عبور خود را تغییر دادید', 'English': 'You have successfully changed your password.'}[MSG_LANGUAGE]
 MSG_RESETPASSWORD_SUCCESS =     {'Persian': 'رمز عبور شما با موفقیت تغییر کرد.\n رمز عبور جدید به رایانامه شما فرستاده شده است.', 'English': 'Your password has successfully changed;\nWe sent your new password to your email account.'}[MSG_LANGUAGE]
 
@@ -114,17 +123,17 @@ def api_register_user_view(request):
             new_user.is_active = False
             new_user.save()
             current_site = get_current_site(request)
-            mail_subject = 'Activate Your BookShare Account'
             activation_token = account_activation_token.make_token(new_user)
-            mail_message = render_to_string('activate_email_email.html', {
-                        'user': new_user,
-                        'domain': current_site.domain,
-                        'uid': urlsafe_base64_encode(force_bytes(new_user.pk)),
-                        'token': activation_token,
-                    })
+            mail_subject, mail_message = render_email(
+                'activate_email',
+                user=new_user,
+                domain=current_site.domain,
+                uid=urlsafe_base64_encode(force_bytes(new_user.pk)),
+                token=activation_token,
+            )
            
             email_destination = email
-            EmailMessage(mail_subject, mail_message, to=[email_destination]).send()
+            enqueue_email(mail_subject, mail_message, [email_destination])
             return Response({'message': 'Please confirm your email address to complete the registration.'}, status=status.HTTP_200_OK)
         
         else:
@@ -258,10 +267,37 @@ def api_account_properties_view(request, username):
         requester = request.user
         is_outsider = (user != requester)
 
+        etag = make_etag(*get_account_version(user, is_outsider))
+        not_modified_response = get_not_modified_response(request, etag)
+        if not_modified_response is not None:
+            return not_modified_response
+
         serializer = UserSerializer(user)
         if not is_outsider:
             serializer = SelfUserSerializer(user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers=get_etag_headers(etag))
+
+
+def get_account_version(user, is_outsider):
+    """ returns the versions of everything the account properties depend on, without loading them:
+        the user, his/her books (with their authors) and, for the user him/herself, the exchanges
+        (with their books & users, and the time passed since their last change), each in one aggregate query. """
+
+    books_version = Book.objects.filter(owner=user).aggregate(count=Count('pk'), last_updated=Max('date_updated'))
+    version = ['account', user.pk, user.date_updated, is_outsider, books_version['count'], books_version['last_updated']]
+
+    if not is_outsider:
+        exchanges_version = BookExchange.objects.filter(Q(borrower=user) | Q(lender=user)).aggregate(
+            count=Count('pk'),
+            last_changed=Max('date_last_changed'),
+            book_updated=Max('book__date_updated'),
+            borrower_updated=Max('borrower__date_updated'),
+            lender_updated=Max('lender__date_updated'),
+            durations=Sum(duration_rank('date_last_changed', timezone.now())),
+        )
+        version += [exchanges_version[key] for key in sorted(exchanges_version)]
+
+    return version
 
 
 @api_view(['PUT', ])
@@ -291,15 +327,6 @@ def api_edit_account_view(request):
             return Response(data, status.HTTP_400_BAD_REQUEST)
 
 
-def remove_old_profile_image(user):
-    path = os.listdir(os.path.join(MEDIA_ROOT, 'profile_images'))
-    for profile_image_name in path:
-        if profile_image_name.startswith(str(user.pk) + '-'):
-            os.remove(os.path.join(MEDIA_ROOT, 'profile_images', profile_image_name))
-            break
-    return
-
-
 @api_view(['PUT', ])
 @permission_classes(())
 @authentication_classes((TokenAuthentication,))
@@ -314,10 +341,10 @@ def api_edit_image_view(request):
         
         user = request.user
 
-        serializer = EditImageSerializer(user, data={'image': image})
+        # (the image is set by the image worker):
+        serializer = ImageUploadSerializer(data={'image': image})
         if serializer.is_valid():
-            remove_old_profile_image(user)
-            serializer.save()
+            serializer.save(target='profile', object_id=user.pk)
             return Response(data={'message': MSG_EDIT_IMAGE_SUCCESS}, status=status.HTTP_200_OK)
         else:
             data = serializer.errors
@@ -326,6 +353,7 @@ def api_edit_image_view(request):
     
 
 @api_view(['GET', ])
+@renderer_classes(IMAGE_RENDERER_CLASSES)
 @permission_classes((IsAuthenticated,))
 def api_get_profile_image_view(request, username):
     if request.method == 'GET':
@@ -336,20 +364,20 @@ def api_get_profile_image_view(request, username):
         except User.DoesNotExist:
             return Response({'message': MSG_NONEXISTANT_USERNAME}, status=status.HTTP_404_NOT_FOUND)
 
-        DEFAULT_PROFILE_IMAGE_PATH = os.path.join(MEDIA_ROOT, DEFAULT_PROFILE_IMAGE)
-        image_path = DEFAULT_PROFILE_IMAGE_PATH
+        # the size of the thumbnail (the original image, if not given):
+        try:
+            size = parse_thumbnail_size(request.query_params.get('size', None))
+        except ValueError:
+            return Response({'message': MSG_INVALID_IMAGE_SIZE}, status=status.HTTP_400_BAD_REQUEST)
+
+        image_path = None
         try:
             if user.image is not None:
                 image_path = user.image.path
         except ValueError:
             pass
-    
-        try:
-            with open(image_path, "rb") as image_file:
-                return HttpResponse(image_file.read(), content_type="image/jpeg")
-        except IOError as e:
-            with open(DEFAULT_PROFILE_IMAGE_PATH, "rb") as image_file:
-                return HttpResponse(image_file.read(), content_type="image/jpeg")
+
+        return serve_image(request, image_path, os.path.join(MEDIA_ROOT, DEFAULT_PROFILE_IMAGE), is_private=True, size=size)
 
 
 class ChangePasswordView(UpdateAPIView):
@@ -432,14 +460,10 @@ def api_reset_password_view(request):
         user.save()
 
         # sending email with new password:
-        mail_subject = 'Retrieve your account'
-        mail_message = render_to_string('reset_password_email.html', {
-                    'user': user,
-                    'new_password': new_password,
-                })
+        mail_subject, mail_message = render_email('reset_password', user=user, new_password=new_password)
         
         email_destination = email
-        EmailMessage(mail_subject, mail_message, to=[email_destination]).send()
+        enqueue_email(mail_subject, mail_message, [email_destination])
         
         return Response({'message': MSG_RESETPASSWORD_SUCCESS}, status=status.HTTP_200_OK)
 
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0033_auto_20261018_0443'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='date updated'),
+        ),
+    ]
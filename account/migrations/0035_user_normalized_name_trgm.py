@@ -0,0 +1,47 @@
+# Generated by Django 3.0.5 on 2026-10-18 06:10
+
+from django.db import migrations
+
+# (the characters mapping of search.normalization.NormalizedText, when the indexes were created; the indexes
+# are used by the queries with the same TRANSLATE expression only):
+SQL_TRANSLATE_FROM = (
+    'يىئكةۀەأإٱؤ۰٠۱١۲٢۳٣'
+    '۴٤۵٥۶٦۷٧۸٨۹٩ًٌٍَُِّ'
+    'ْٰٕٖٜٟٓٔٗ٘ٙٚٛٝٞـ​‌‍'
+    '‎‏﻿'
+)
+SQL_TRANSLATE_TO = 'یییکهههاااو00112233445566778899'
+
+TRIGRAM_FIELDS = ['first_name', 'last_name', 'username']
+
+
+def create_index(field):
+    return migrations.RunSQL(
+        [(
+            'CREATE INDEX "user_{0}_norm_trgm" ON "account_user" USING gin (TRANSLATE("{0}", %s, %s) gin_trgm_ops)'.format(field),
+            [SQL_TRANSLATE_FROM, SQL_TRANSLATE_TO],
+        )],
+        'DROP INDEX "user_{0}_norm_trgm"'.format(field),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0034_user_date_updated'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_first_name_trgm',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_last_name_trgm',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_username_trgm',
+        ),
+    ] + [create_index(field) for field in TRIGRAM_FIELDS]
@@ -1,6 +1,3 @@
-import os
-from uuid import uuid4
-
 from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.core.validators import RegexValidator, MaxValueValidator, MinValueValidator
@@ -10,6 +7,8 @@ from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 import sharing
 
+from images.storage import get_sharded_image_name
+
 
 class UserManager(BaseUserManager):
     def create_user(self, username, first_name, last_name, email, password=None, image=None,):
@@ -63,10 +62,7 @@ def validate_persian_username(input_string=''):
 
 
 def create_profile_image_upload_path(instance, filename):
-    extension = filename.split('.')[-1]
-    file_name = '{}.{}'.format(str(instance.pk) + '-' + uuid4().hex, extension)
-
-    return os.path.join('profile_images/', file_name)
+    return get_sharded_image_name('profile_images', instance, filename)
 
 
 class User(AbstractBaseUser):
@@ -88,6 +84,8 @@ class User(AbstractBaseUser):
 
     date_joined =       models.DateTimeField(verbose_name='date joined', auto_now_add=True, editable=False)
     last_login =        models.DateTimeField(verbose_name='last login', auto_now=True, editable=False)
+    # the version of the user (for the etags):
+    date_updated =      models.DateTimeField(verbose_name='date updated', auto_now=True)
 
     last_retrieval =    models.DateTimeField(verbose_name='last retrieval', null=True)
 
@@ -102,6 +100,9 @@ class User(AbstractBaseUser):
     
     objects = UserManager()
 
+    # (the trigram indexes of the (typo tolerant) user search are on the normalized names, see search.normalization;
+    # as expression indexes, they are created in the migration 0035)
+
     def has_perm(self, perm, obj=None):
         #"Does the user have a specific permission?"
         # Simplest possible answer: Yes, always
@@ -116,6 +117,7 @@ class User(AbstractBaseUser):
     @property
     def books_list(self):
         """ returns a list of dictionaries {slug, title, authors, categories} of this user's books """
+        # the authors of all the books are fetched in one query:
         return [
             {
                 "slug": book.slug,
@@ -123,16 +125,24 @@ class User(AbstractBaseUser):
                 "authors": book.authors_list,
                 "categories": book.categories_list,
             } 
-            for book in self.book_set.all()
+            for book in self.book_set.defer('search_vector').prefetch_related('author_set')
         ]
 
     @property
     def books_count(self):
-        return len(self.books_list)
+        return self.book_set.count()
 
     @property
-    def borrow_list(self):
-        """ returns a list of all BookExchanges that this user is their borrower """
+    def borrow_exchanges(self):
+        """ returns a queryset of all BookExchanges that this user is their borrower (with their books & lenders),
+            sorted first by "time" (newest/largest first), then by "state" (least first) """
+        return sharing.models.BookExchange.objects.filter(borrower=self).select_related(
+            'book', 'lender',
+        ).defer('book__search_vector').order_by(*sharing.models.BOOK_EXCHANGE_LIST_ORDERING)
+
+    @staticmethod
+    def get_borrow_list(book_exchanges):
+        """ returns a list of the given BookExchanges (of their borrower) """
         return [
             {
                 "slug": book_exchange.slug,
@@ -146,18 +156,30 @@ class User(AbstractBaseUser):
                 "has_lender_rated": book_exchange.has_lender_rated,
                 "has_borrower_rated": book_exchange.has_borrower_rated,
             } 
-            for book_exchange in sharing.models.BookExchange.objects.filter(borrower=self)
+            for book_exchange in book_exchanges
         ]
 
+    @property
+    def borrow_list(self):
+        """ returns a list of all BookExchanges that this user is their borrower """
+        return self.get_borrow_list(self.borrow_exchanges)
+
     @property
     def borrow_list_to_show(self):
-        # the list is sorted here: 
-        #       first by "time" (newest/largest first), then by "state" (least first)
-        return sorted(self.borrow_list, key=lambda d: (d["date_last_changed"], -d["state"]), reverse=True)
+        # the list is sorted by the database (see borrow_exchanges)
+        return self.borrow_list
 
     @property
-    def lend_list(self):
-        """ returns a list of all BookExchanges that this user is their lender """
+    def lend_exchanges(self):
+        """ returns a queryset of all BookExchanges that this user is their lender (with their books & borrowers),
+            sorted first by "time" (newest/largest first), then by "state" (least first) """
+        return sharing.models.BookExchange.objects.filter(lender=self).select_related(
+            'book', 'borrower',
+        ).defer('book__search_vector').order_by(*sharing.models.BOOK_EXCHANGE_LIST_ORDERING)
+
+    @staticmethod
+    def get_lend_list(book_exchanges):
+        """ returns a list of the given BookExchanges (of their lender) """
         return [
             {
                 "slug": book_exchange.slug,
@@ -171,14 +193,18 @@ class User(AbstractBaseUser):
                 "has_lender_rated": book_exchange.has_lender_rated,
                 "has_borrower_rated": book_exchange.has_borrower_rated,
             } 
-            for book_exchange in sharing.models.BookExchange.objects.filter(lender=self)
+            for book_exchange in book_exchanges
         ]
 
+    @property
+    def lend_list(self):
+        """ returns a list of all BookExchanges that this user is their lender """
+        return self.get_lend_list(self.lend_exchanges)
+
     @property
     def lend_list_to_show(self):
-        # the list is sorted here: 
-        #       first by "time" (newest/largest first), then by "state" (least first)
-        return sorted(self.lend_list, key=lambda d: (d["date_last_changed"], -d["state"]), reverse=True)
+        # the list is sorted by the database (see lend_exchanges)
+        return self.lend_list
 
 
     @property
@@ -1,12 +1,16 @@
 import json
+from datetime import timedelta
+from unittest import mock
 
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
-from book.models import Book
+from book.models import Author, Book
 from account.models import User
+from sharing.models import BookExchange
 
 
 class GetAccountPropertiesAPITestCase(APITestCase):
@@ -85,3 +89,105 @@ class GetAccountPropertiesAPITestCase(APITestCase):
         # books_list field:
         self.assertEqual(set(book_dict['slug'] for book_dict in response.data['books_list']), set([book1_slug, book2_slug]))
         
+
+
+    def test_get_account_properties_etag(self):
+        owner = User.objects.create(username="test_owner", email="test_email1@gmail.com", is_active=True)
+        borrower = User.objects.create(username="test_borrower", email="test_email2@gmail.com", is_active=True)
+        client = APIClient()
+        client.force_authenticate(owner)
+        client.post(
+            reverse('book_api:add_book'),
+            data=self.first_book_json,
+            format='json'
+        )
+        BookExchange.objects.create(book=Book.objects.get(title='Test Book 1'), borrower=borrower)
+        url = reverse('account_api:account_properties', kwargs={'username': owner.username})
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # not modified: the user, the version of the books & the version of the exchanges:
+        with self.assertNumQueries(3):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # the borrower's name is in the lend list:
+        borrower.first_name = "new name"
+        borrower.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lend_list_to_show'][0]['borrower_firstname'], "new name")
+        etag = response['ETag']
+
+        # the time passed since the last change of an exchange is shown in days after a day:
+        with mock.patch('account.api.views.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # adding a book:
+        client.post(
+            reverse('book_api:add_book'),
+            data=self.second_book_json,
+            format='json'
+        )
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['books_count'], 2)
+
+class LoginAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(
+            username="test_user", first_name="test", last_name="user", email="user@alaki.com", password="password",
+        )
+        self.test_user.is_active = True
+        self.test_user.save()
+        self.other_user = User.objects.create_user(
+            username="other_user", first_name="other", last_name="user", email="other@alaki.com", password="password",
+        )
+
+    def add_history(self, num_books):
+        """ adds num_books books (each with 2 authors) to each of the users, and num_books exchanges in each direction """
+        books = Book.objects.bulk_create([
+            Book(title="book " + str(i), description="nothing", page_num=100, category_1='0',
+                 owner=(self.test_user if i % 2 else self.other_user), slug="book-" + str(i))
+            for i in range(Book.objects.count(), Book.objects.count() + 2 * num_books)
+        ])
+        Author.objects.bulk_create([Author(book=book, name=name) for book in books for name in ["author 1", "author 2"]])
+        BookExchange.objects.bulk_create([
+            BookExchange(
+                slug="exchange-" + book.slug, book=book,
+                borrower=(self.other_user if book.owner == self.test_user else self.test_user), lender=book.owner,
+            )
+            for book in books
+        ])
+
+    def login(self):
+        response = APIClient().post(
+            reverse('account_api:login'),
+            data={'username': "test_user", 'password': "password"},
+            format='json'
+        )
+        if response.status_code != status.HTTP_200_OK:
+            print("response json:", response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_login_fixed_number_of_queries(self):
+        # the user, the token, the books, their authors, the borrowed & the lent exchanges:
+        self.add_history(2)
+        with self.assertNumQueries(6):
+            self.login()
+
+        self.add_history(200)
+        with self.assertNumQueries(6):
+            response = self.login()
+
+        self.assertEqual(len(response.data['books_list']), 202)
+        self.assertEqual(response.data['books_list'][0]['authors'], ["author 1", "author 2"])
+        self.assertEqual(len(response.data['borrow_list_to_show']), 202)
+        self.assertEqual(response.data['borrow_list_to_show'][0]['lender_username'], "other_user")
+        self.assertEqual(len(response.data['lend_list_to_show']), 202)
+        self.assertEqual(response.data['lend_list_to_show'][0]['borrower_username'], "other_user")
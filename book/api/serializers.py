@@ -34,8 +34,3 @@ class EditBookSerializer(serializers.ModelSerializer):
         model = Book
         fields = [  'title', 'description', 'page_num', 'edition', 'publisher', 
                     'pub_year', 'category_1', 'category_2' ,'category_3']
-
-class EditBookImageSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Book
-        fields = ['image']
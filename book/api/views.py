@@ -1,7 +1,6 @@
 from django.contrib.auth import authenticate
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage, send_mail
-from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes, force_text
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
@@ -9,7 +8,7 @@ from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import (api_view, authentication_classes,
-                                       permission_classes)
+                                       permission_classes, renderer_classes)
 from rest_framework.generics import UpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -17,10 +16,15 @@ from rest_framework.views import APIView
 
 from account.models import User
 from book.models import Author, Book
+from bookshare.etags import get_etag_headers, get_not_modified_response, make_etag
 from bookshare.settings import (MSG_LANGUAGE, MEDIA_ROOT, DEFAULT_BOOK_IMAGE)
+from images.renderers import IMAGE_RENDERER_CLASSES
+from images.serializers import ImageUploadSerializer
+from images.serving import serve_image
+from images.thumbnails import parse_thumbnail_size
 
 from .serializers import (  AuthorSerializer, AddBookSerializer, BookSerializer, 
-                            SelfBookSerializer, EditBookSerializer, EditBookImageSerializer, )
+                            SelfBookSerializer, EditBookSerializer, )
 import os
 import json
 
@@ -42,6 +46,7 @@ MSG_NONEXISTANT_BOOK =          {'Persian': 'چنین کتابی وجود ندا
 MSG_NOTYOURS_BOOK =             {'Persian': 'این کتاب متعلق به شما نیست', 'English': 'This book is not yours!'}[MSG_LANGUAGE]
 
 MSG_EDIT_IMAGE_SUCCESS =        {'Persian': 'شما با موفقیت تصویر کتاب را تغییر دادید', 'English': 'You have successfully updated your book image.'}[MSG_LANGUAGE]
+MSG_INVALID_IMAGE_SIZE =        {'Persian': 'اندازه تصویر نامعتبر است', 'English': 'Invalid image size!'}[MSG_LANGUAGE]
 MSG_DELETE_BOOK_SUCCESS =       {'Persian': 'کتاب شما با موفقیت حذف شد', 'English': 'Your book was successfully deleted.'}[MSG_LANGUAGE]
 MSG_ADD_BOOK_SUCCESS =          {'Persian': 'کتاب شما با موفقیت ثبت شد', 'English': 'Your book was successfully added.'}[MSG_LANGUAGE]
 MSG_EDIT_BOOK_SUCCESS =         {'Persian': 'اطلاعات کتاب شما با موفقیت ویرایش شد', 'English': 'Your book was successfully edited.'}[MSG_LANGUAGE]
@@ -206,19 +211,27 @@ def api_get_book_properties_view(request, book_slug):
         
         requester = request.user
 
-        # checking if the book exists:
+        # checking if the book exists (with its owner, for the etag):
         try:
-            book = Book.objects.get(slug=book_slug)
+            book = Book.objects.select_related('owner').defer('search_vector').get(slug=book_slug)
         except Book.DoesNotExist:
             data['message'] = MSG_NONEXISTANT_BOOK
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
 
+        is_owner = (book.owner == requester)
+
+        # the response only changes with the book (& its authors), its owner, the requester & the time passed:
+        etag = make_etag('book', book.pk, book.date_updated, book.owner.date_updated, is_owner, book.when_added)
+        not_modified_response = get_not_modified_response(request, etag)
+        if not_modified_response is not None:
+            return not_modified_response
+
         # serializing:
         serializer = BookSerializer(book)
-        if book.owner == requester:
+        if is_owner:
             serializer = SelfBookSerializer(book)
 
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return Response(data=serializer.data, status=status.HTTP_200_OK, headers=get_etag_headers(etag))
 
 
 ################### image related api's ######################
@@ -234,16 +247,6 @@ def api_get_book_properties_view(request, book_slug):
     # return Response(data, status.HTTP_200_OK)
 
 
-def remove_old_book_image(book):
-    path = os.listdir(os.path.join(MEDIA_ROOT, 'book_images'))
-
-    for book_image_name in path:
-        if book_image_name.startswith(str(book.pk) + '-'):
-            os.remove(os.path.join(MEDIA_ROOT, 'book_images', book_image_name))
-            break
-    return
-
-
 @api_view(['PUT', ])
 @permission_classes(())
 @authentication_classes((TokenAuthentication,))
@@ -272,11 +275,11 @@ def api_edit_book_image_view(request, book_slug):
             return Response(data, status.HTTP_400_BAD_REQUEST)
 
         # serializing:
-        serializer = EditBookImageSerializer(book, data={'image': image})
+        # (the image is set by the image worker):
+        serializer = ImageUploadSerializer(data={'image': image})
 
         if serializer.is_valid():
-            remove_old_book_image(book)
-            serializer.save()
+            serializer.save(target='book', object_id=book.pk)
             data['message'] = MSG_EDIT_IMAGE_SUCCESS
             return Response(data=data, status=status.HTTP_200_OK)
         else:
@@ -286,6 +289,7 @@ def api_edit_book_image_view(request, book_slug):
     
 
 @api_view(['GET', ])
+@renderer_classes(IMAGE_RENDERER_CLASSES)
 @permission_classes(())
 @authentication_classes((TokenAuthentication,))
 def api_get_book_image_view(request, book_slug):
@@ -301,20 +305,21 @@ def api_get_book_image_view(request, book_slug):
             data['message'] = MSG_NONEXISTANT_BOOK
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
 
-        DEFAULT_BOOK_IMAGE_PATH = os.path.join(MEDIA_ROOT, DEFAULT_BOOK_IMAGE)
-        image_path = DEFAULT_BOOK_IMAGE_PATH
+        # the size of the thumbnail (the original image, if not given):
+        try:
+            size = parse_thumbnail_size(request.query_params.get('size', None))
+        except ValueError:
+            data['message'] = MSG_INVALID_IMAGE_SIZE
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+        image_path = None
         try:
             if book.image is not None:
                 image_path = book.image.path
         except ValueError:
             pass
-    
-        try:
-            with open(image_path, "rb") as image_file:
-                return HttpResponse(image_file.read(), content_type="image/jpeg")
-        except IOError as e:
-            with open(DEFAULT_BOOK_IMAGE_PATH, "rb") as image_file:
-                return HttpResponse(image_file.read(), content_type="image/jpeg")
+
+        return serve_image(request, image_path, os.path.join(MEDIA_ROOT, DEFAULT_BOOK_IMAGE), size=size)
 
 
 
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from book.models import SEARCH_VECTOR_WEIGHTS, Book, create_search_vector
+from search.cache import bump_generation
+from search.normalization import NormalizedText
+
+
+class Command(BaseCommand):
+    help = "(re)builds the stored search vector of all books, in batches of primary keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # the vector is computed by the database itself from the (normalized) stored fields:
+        search_vector = create_search_vector({field: NormalizedText(field) for field in SEARCH_VECTOR_WEIGHTS})
+
+        max_pk = Book.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        num_updated = 0
+        for start_pk in range(0, max_pk + 1, batch_size):
+            num_updated += Book.objects.filter(
+                pk__gte=start_pk, pk__lt=start_pk + batch_size,
+            ).update(search_vector=search_vector)
+
+        # bulk updates send no signals:
+        bump_generation()
+
+        self.stdout.write("{0} books' search vectors were updated.".format(num_updated))
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0017_auto_20261018_0440'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category_1', 'rating'], name='book_category_1_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(_negated=True, category_2=''), fields=['category_2', 'rating'], name='book_category_2_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(_negated=True, category_3=''), fields=['category_3', 'rating'], name='book_category_3_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(pub_year__isnull=False), fields=['pub_year'], name='book_pub_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['page_num'], name='book_page_num_idx'),
+        ),
+    ]
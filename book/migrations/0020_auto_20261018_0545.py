@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0019_book_date_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['date_updated'], name='book_date_updated_idx'),
+        ),
+    ]
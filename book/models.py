@@ -1,20 +1,42 @@
 from django.db import models
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import TextField, Value
 from uuid import uuid4
-import os
 from datetime import timedelta
 from django.utils import timezone
 
 from account.models import User
+from images.storage import get_sharded_image_name
+from search.normalization import normalize_text
 
 
 def create_book_image_upload_path(instance, filename):
-    extension = filename.split('.')[-1]
-    file_name = '{}.{}'.format(str(instance.pk) + '-' + uuid4().hex, extension)
+    return get_sharded_image_name('book_images', instance, filename)
 
-    return os.path.join('book_images/', file_name)
+
+# the weight of each book field in the stored search vector:
+SEARCH_VECTOR_WEIGHTS = {
+    'title': 'A',
+    'authors_str': 'B',
+    'description': 'C',
+    'publisher': 'D',
+}
+
+
+def create_search_vector(field_values):
+    """ returns the weighted search vector of the given {field: value (or expression)} dictionary """
+    search_vector = None
+    for field, weight in SEARCH_VECTOR_WEIGHTS.items():
+        field_search_vector = SearchVector(field_values[field], weight=weight)
+        if search_vector is None:
+            search_vector = field_search_vector
+        else:
+            search_vector = search_vector + field_search_vector
+    return search_vector
 
 
 class Book(models.Model): 
@@ -27,6 +49,8 @@ class Book(models.Model):
     pub_year =          models.IntegerField(null=True)
     
     date_added =        models.DateTimeField(verbose_name='date added', default=timezone.now)
+    # the version of the book, including its authors (for the etags):
+    date_updated =      models.DateTimeField(verbose_name='date updated', auto_now=True)
 
     owner =             models.ForeignKey(User, on_delete=models.CASCADE)
     slug =              models.CharField(max_length=30, unique=True)
@@ -55,6 +79,23 @@ class Book(models.Model):
     
     authors_str =       models.CharField(max_length=250, blank=True, default="")
 
+    # weighted title, authors, description & publisher (kept up to date on save):
+    search_vector =     SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='book_search_vector_gin'),
+            # for the search filters (combined with the search vector index by the planner);
+            # most books have no 2nd/3rd category, so those are only indexed when set:
+            models.Index(fields=['category_1', 'rating'], name='book_category_1_rating_idx'),
+            models.Index(fields=['category_2', 'rating'], name='book_category_2_rating_idx', condition=~models.Q(category_2='')),
+            models.Index(fields=['category_3', 'rating'], name='book_category_3_rating_idx', condition=~models.Q(category_3='')),
+            models.Index(fields=['pub_year'], name='book_pub_year_idx', condition=models.Q(pub_year__isnull=False)),
+            models.Index(fields=['page_num'], name='book_page_num_idx'),
+            # for the changes since a time (see search.suggest):
+            models.Index(fields=['date_updated'], name='book_date_updated_idx'),
+        ]
+
     @property
     def when_added(self):
         duration = timezone.now() - self.date_added
@@ -106,9 +147,28 @@ class Book(models.Model):
         self.save()
         return self.slug
 
+    def generate_search_vector(self):
+        # the (persian) texts are normalized the same way as the queries:
+        self.search_vector = create_search_vector({
+            field: Value(normalize_text(getattr(self, field)), output_field=TextField())
+            for field in SEARCH_VECTOR_WEIGHTS
+        })
+        return self.search_vector
+
     def save(self, *args, **kwargs):
         self.date_added = timezone.now()
 
+        # the search vector is only regenerated if one of its fields may have changed:
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.generate_search_vector()
+        elif set(update_fields) & set(SEARCH_VECTOR_WEIGHTS):
+            self.generate_search_vector()
+            kwargs['update_fields'] = set(update_fields) | {'search_vector'}
+        # any change is a new version:
+        if update_fields is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'date_updated'}
+
         super(Book, self).save(*args, **kwargs)
 
         if not(self.slug):
@@ -133,6 +193,16 @@ class Author(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     name = models.CharField(max_length=50, blank=False, default=None)
 
+    def save(self, *args, **kwargs):
+        super(Author, self).save(*args, **kwargs)
+        # the authors are a part of the book's version:
+        Book.objects.filter(pk=self.book_id).update(date_updated=timezone.now())
+
+    def delete(self, *args, **kwargs):
+        result = super(Author, self).delete(*args, **kwargs)
+        Book.objects.filter(pk=self.book_id).update(date_updated=timezone.now())
+        return result
+
     def __str__(self):
         return self.name
 
@@ -1,3 +1,6 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase, TransactionTestCase
 from book.models import Book, Author
 from django.utils import timezone
@@ -66,4 +69,47 @@ class AuthorTransactionTestCase(TransactionTestCase):
             test_author = Author.objects.create(book=test_book)
         with self.assertRaises(IntegrityError):
             test_author = Author.objects.create(name=test_name)
-        
\ No newline at end of file
+        
+
+class BookSearchVectorTestCase(TestCase):
+
+    def setUp(self):
+        self.test_book = Book.objects.create(title="hobbit", description="dragon", page_num=666, owner=User.objects.create(username="test_user"), category_1=Book.Category_Choice[0][0], publisher="penguin")
+
+    def test_search_vector_on_save(self):
+        test_book = Book.objects.get(pk=self.test_book.pk)
+        self.assertIn("'hobbit':1A", test_book.search_vector)
+        self.assertIn("'dragon':", test_book.search_vector)
+        self.assertIn("'penguin':", test_book.search_vector)
+
+        test_book.title = "silmarillion"
+        test_book.save()
+        test_book = Book.objects.get(pk=self.test_book.pk)
+        self.assertIn("'silmarillion':1A", test_book.search_vector)
+        self.assertNotIn("'hobbit'", test_book.search_vector)
+
+    def test_search_vector_on_add_author(self):
+        self.test_book.add_author("tolkien")
+        test_book = Book.objects.get(pk=self.test_book.pk)
+        self.assertRegex(test_book.search_vector, r"'tolkien':\d+B")
+
+    def test_update_search_vectors_command(self):
+        Book.objects.update(search_vector=None)
+        call_command('update_search_vectors', batch_size=1, stdout=StringIO())
+
+        test_book = Book.objects.get(pk=self.test_book.pk)
+        self.assertIn("'hobbit':1A", test_book.search_vector)
+
+    def test_search_vector_normalized(self):
+        # arabic yeh & kaf, a ZWNJ, a diacritic and persian digits:
+        self.test_book.title = "كتاب\u200cهاي عِلمی ۱۹۸۴"
+        self.test_book.save()
+        saved_search_vector = Book.objects.get(pk=self.test_book.pk).search_vector
+        self.assertIn("'کتابهای':1A", saved_search_vector)
+        self.assertIn("'علمی':2A", saved_search_vector)
+        self.assertIn("'1984':3A", saved_search_vector)
+
+        # the command normalizes the stored texts the same way:
+        Book.objects.update(search_vector=None)
+        call_command('update_search_vectors', stdout=StringIO())
+        self.assertEqual(Book.objects.get(pk=self.test_book.pk).search_vector, saved_search_vector)
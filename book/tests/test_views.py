@@ -9,9 +9,11 @@ from bookshare.settings import DEFAULT_BOOK_IMAGE, MEDIA_ROOT
 
 from account.models import User
 from book.models import Author, Book
+from images.jobs import run_image_jobs
 from PIL import Image
 import tempfile
 import json
+import io
 import os
 
 
@@ -525,6 +527,53 @@ class GetBookPropertiesAPITestCase(APITestCase):
             self.assertEqual(getattr(book, field), response.data[field])
 
 
+    def test_get_book_properties_etag(self):
+        owner = User.objects.create(username="test_owner", email="test_email1@gmail.com")
+        client = APIClient()
+        client.force_authenticate(owner)
+        client.post(
+            reverse('book_api:add_book'),
+            data=self.initial_book_json,
+            format='json'
+        )
+        book = Book.objects.all()[0]
+        url = reverse('book_api:get_book_properties', kwargs={'book_slug': book.slug})
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # not modified, without loading the authors:
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # others get another version (of another serializer):
+        other_client = APIClient()
+        other_client.force_authenticate(User.objects.create(username="test_other_user", email="test_email2@gmail.com"))
+        response = other_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # adding an author:
+        Author.objects.create(book=book, name="test_author3")
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("test_author3", response.data['authors_list'])
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        # editing the book:
+        client.put(
+            reverse('book_api:edit_book', kwargs={'book_slug': book.slug}),
+            data={'title': 'edited title'},
+            format='json'
+        )
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'edited title')
+
+
 class BookImageAPITestCase(APITestCase):
     
     urls = 'book.api.urls'
@@ -575,7 +624,7 @@ class BookImageAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # checking image field:
-        image_received = response.content
+        image_received = response.getvalue()
         with open(os.path.join(MEDIA_ROOT, DEFAULT_BOOK_IMAGE), "rb") as image_file:
             self.assertEqual(image_received, image_file.read())
 
@@ -602,6 +651,9 @@ class BookImageAPITestCase(APITestCase):
                 format='multipart'
             )
 
+        # processing the image (as the image worker does):
+        run_image_jobs()
+
         # getting book image:
         get_response = client.get(
             reverse('book_api:get_book_image', kwargs={'book_slug': book_slug}),
@@ -613,10 +665,10 @@ class BookImageAPITestCase(APITestCase):
         self.assertEqual(edit_response.status_code, status.HTTP_200_OK)
         self.assertEqual(get_response.status_code, status.HTTP_200_OK)
 
-        # checking image field:
-        image_received = get_response.content
-        with open(self.book_image_file.name, 'rb') as f:
-            self.assertEqual(image_received, f.read())
+        # checking image field (the image is re-encoded):
+        image_received = Image.open(io.BytesIO(get_response.getvalue()))
+        self.assertEqual(image_received.format, 'JPEG')
+        self.assertEqual(image_received.size, self.image.size)
 
 
 
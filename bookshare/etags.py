@@ -0,0 +1,23 @@
+from hashlib import sha1
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*version_data):
+    """ returns a strong etag of the given version data (everything the response depends on) """
+    return quote_etag(sha1(repr(version_data).encode()).hexdigest())
+
+
+def get_etag_headers(etag):
+    # the responses depend on the requester, and are revalidated on every request:
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+
+def get_not_modified_response(request, etag):
+    """ returns a "304 Not Modified" response if the client already has this version (If-None-Match), else None """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in etags or '*' in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=get_etag_headers(etag))
+    return None
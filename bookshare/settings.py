@@ -49,6 +49,8 @@ INSTALLED_APPS = [
     'book',
     'sharing',
     'search',
+    'images',
+    'mailing',
 ]
 
 AUTHENTICATION_BACKENDS = (
@@ -64,6 +66,13 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_HOST_USER = os.environ.get('SADBOOKSHARE_DJANGO_EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('SADBOOKSHARE_DJANGO_EMAIL_HOST_PASSWORD')
 EMAIL_PORT = 587
+# the emails are queued by the apis & sent by the email sender (see mailing.outbox), in batches over one connection;
+# a claimed email is leased for EMAIL_OUTBOX_LEASE seconds, and a failed one is retried after
+# EMAIL_OUTBOX_RETRY_DELAY * 2 ^ (attempts - 1) seconds, at most EMAIL_OUTBOX_MAX_ATTEMPTS times:
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_LEASE = 300
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -86,12 +95,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'bookshare.urls'
 
+# the templates are compiled once (by the cached loader), unless DEBUG:
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': (os.path.join(BASE_DIR, 'account/templates')),
-        'APP_DIRS': True,
+        'DIRS': [os.path.join(BASE_DIR, 'account/templates')],
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -118,6 +133,33 @@ DATABASES = {
     }
 }
 
+# the seconds a transaction may take, between the stamping of its changes (e.g. date_updated) and its commit;
+# the readers of the changes since a time re-read this margin before it:
+MAX_TRANSACTION_TIME = 60
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+#   the search results cache is shared by all the processes (so a change invalidates it in all of them):
+#   in the database by default (its table is created by "manage.py createcachetable"), or e.g. in memcached.
+#   a local backend (locmem) is only accepted with one web process (WEB_CONCURRENCY, as with gunicorn).
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': os.environ.get('SADBOOKSHARE_DJANGO_SEARCH_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('SADBOOKSHARE_DJANGO_SEARCH_CACHE_LOCATION', 'search_cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -166,4 +208,50 @@ MEDIA_URL = '/media/'
 DEFAULT_PROFILE_IMAGE = 'default_profile_image.png'
 DEFAULT_BOOK_IMAGE = 'default_book_image.png'
 
+# image serving: the images are streamed by django, or (if set) sent by the web server with
+# "x-accel-redirect" (nginx, from an internal location aliased to MEDIA_ROOT) or "x-sendfile" (apache):
+IMAGE_SENDFILE = os.environ.get('SADBOOKSHARE_DJANGO_IMAGE_SENDFILE', '')
+IMAGE_ACCEL_REDIRECT_LOCATION = os.environ.get('SADBOOKSHARE_DJANGO_IMAGE_ACCEL_REDIRECT_LOCATION', '/protected_media/')
+# the seconds the clients may use an image before revalidating it:
+IMAGE_CACHE_MAX_AGE = 300
+# the sizes (px) of the thumbnails of the images (the "size" parameter of the image apis), and their quality:
+THUMBNAIL_SIZES = [64, 256, 768]
+THUMBNAIL_QUALITY = 80
+# the uploaded images are staged (in this directory of MEDIA_ROOT) & processed by the image worker:
+IMAGE_STAGING_DIR = 'image_staging'
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_WORKER_PROCESSES = int(os.environ.get('SADBOOKSHARE_DJANGO_IMAGE_WORKER_PROCESSES', os.cpu_count() or 1))
+# a job processing for more than IMAGE_JOB_TIMEOUT seconds (its worker has died) is retried,
+# at most IMAGE_JOB_MAX_ATTEMPTS times:
+IMAGE_JOB_TIMEOUT = 600
+IMAGE_JOB_MAX_ATTEMPTS = 3
+# (the seconds between the checks of the workers for such jobs):
+IMAGE_JOB_REQUEUE_INTERVAL = 60
+# store the images by their content (so the same images share one file, which is removed with its last reference):
+IMAGE_CONTENT_ADDRESSED = (os.environ.get('SADBOOKSHARE_DJANGO_IMAGE_CONTENT_ADDRESSED') == "True")
+IMAGE_BLOB_DIR = 'image_blobs'
+
+# search results pagination:
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# user search: "fulltext" or "trigram" (typo tolerant & prefix matching)
+SEARCH_USER_MODE = 'trigram'
+# autocomplete suggestions:
+SEARCH_SUGGEST_LIMIT = 10
+# (the seconds between the refreshes of the suggestion index (with the changed books), by each web process):
+SEARCH_SUGGEST_REFRESH_INTERVAL = 10
+
+# borrow & lend lists pagination:
+EXCHANGE_LIST_PAGE_SIZE = 50
+EXCHANGE_LIST_MAX_PAGE_SIZE = 200
+# the exchange scheduler (see sharing.scheduler): a delivered book is overdue EXCHANGE_LOAN_PERIOD days after its
+# delivery, and a request which is not responded expires (is rejected) after EXCHANGE_REQUEST_EXPIRY days:
+EXCHANGE_LOAN_PERIOD = 30
+EXCHANGE_REQUEST_EXPIRY = 14
+EXCHANGE_SCHEDULER_BATCH_SIZE = 1000
+EXCHANGE_SCHEDULER_INTERVAL = 300
+# the deleted exchanges are listed in the incremental syncs of the borrow & lend lists for EXCHANGE_DELETION_RETENTION
+# days (a "since" older than that needs a full sync):
+EXCHANGE_DELETION_RETENTION = 30
+
 django_heroku.settings(locals())
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookshare.settings')
 
 application = get_wsgi_application()
+
+# the autocomplete suggestions are served from memory, by an index built (and kept up to date) in the background,
+# in each process (so the workers are not forked after this, e.g. by "gunicorn --preload"):
+from search.suggest import suggestion_index  # noqa: E402
+
+suggestion_index.start_refresher()
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ImagesConfig(AppConfig):
+    name = 'images'
+
+    def ready(self):
+        import images.signals
+        from images.serving import check_sendfile_mode
+        check_sendfile_mode()
@@ -0,0 +1,65 @@
+import os
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from bookshare.settings import IMAGE_BLOB_DIR, MEDIA_ROOT
+from images.models import ImageBlob
+from images.storage import move_image, remove_image
+
+
+def get_blob_name(digest, extension):
+    """ the name of a content addressed image: "<IMAGE_BLOB_DIR>/<ab>/<cd>/<sha256>.<extension>" """
+    return os.path.join(IMAGE_BLOB_DIR, digest[:2], digest[2:4], digest + extension)
+
+
+def is_blob(image_name):
+    return bool(image_name) and image_name.startswith(IMAGE_BLOB_DIR + '/')
+
+
+def lock_blob(blob_name):
+    """ locks a blob (whether it exists or not) until the end of the transaction, so it is never removed
+        while it is being stored again """
+    digest = os.path.splitext(os.path.basename(blob_name))[0]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [int(digest[:15], 16)])
+
+
+def lock_blobs(image_names):
+    # (the blobs are locked in order, so two transactions never wait for each other's blobs):
+    for image_name in sorted(set(filter(is_blob, image_names))):
+        lock_blob(image_name)
+
+
+def store_blob(image_path, blob_name):
+    """ stores a processed image (with its thumbnails) as a blob (see get_blob_name), or removes it if the blob
+        is already stored; the blob has one more reference """
+    image_name = os.path.relpath(image_path, MEDIA_ROOT)
+
+    lock_blob(blob_name)
+    blob = ImageBlob.objects.get_or_create(name=blob_name)[0]
+    if os.path.exists(os.path.join(MEDIA_ROOT, blob_name)):
+        remove_image(image_name)
+    else:
+        move_image(image_name, blob_name)
+    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def remove_unreferenced_blob(blob_name):
+    with transaction.atomic():
+        lock_blob(blob_name)
+        if not ImageBlob.objects.filter(name=blob_name).exists():
+            remove_image(blob_name)
+
+
+def release_image(image_name):
+    """ an image is not used anymore: a blob loses a reference (and is removed after the transaction, if it was
+        the last one), and any other image is removed after the transaction """
+    if not is_blob(image_name):
+        transaction.on_commit(lambda: remove_image(image_name))
+        return
+
+    lock_blob(image_name)
+    ImageBlob.objects.filter(name=image_name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    if ImageBlob.objects.filter(name=image_name, ref_count__lte=0).delete()[0]:
+        transaction.on_commit(lambda: remove_unreferenced_blob(image_name))
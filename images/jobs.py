@@ -0,0 +1,140 @@
+import os
+from datetime import timedelta
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import (IMAGE_CONTENT_ADDRESSED, IMAGE_JOB_MAX_ATTEMPTS,
+                                IMAGE_JOB_TIMEOUT, IMAGE_STAGING_DIR, MEDIA_ROOT)
+from images.blobs import get_blob_name, lock_blobs, release_image, store_blob
+from images.models import ImageJob
+from images.processing import process_image
+
+# the models whose "image" the jobs of each target set:
+IMAGE_JOB_MODELS = {
+    'book': Book,
+    'profile': User,
+}
+
+PENDING, PROCESSING, DONE, FAILED = 0, 1, 2, 3
+
+
+def stage_image(image_file, target, object_id):
+    """ writes an uploaded image to the staging directory (in chunks), and queues the job of processing it """
+    staged_name = os.path.join(IMAGE_STAGING_DIR, uuid4().hex)
+    os.makedirs(os.path.join(MEDIA_ROOT, IMAGE_STAGING_DIR), exist_ok=True)
+    with open(os.path.join(MEDIA_ROOT, staged_name), 'wb') as staged_file:
+        for chunk in image_file.chunks():
+            staged_file.write(chunk)
+
+    return ImageJob.objects.create(target=target, object_id=object_id, staged_name=staged_name)
+
+
+def claim_image_jobs(limit):
+    """ marks (at most limit of) the oldest pending jobs as processing, and returns them;
+        the jobs locked by the other workers are skipped. """
+    with transaction.atomic():
+        job_pks = list(
+            ImageJob.objects.select_for_update(skip_locked=True).filter(state=PENDING)
+            .order_by('date_created').values_list('pk', flat=True)[:limit]
+        )
+        ImageJob.objects.filter(pk__in=job_pks).update(
+            state=PROCESSING, attempts=F('attempts') + 1, date_started=timezone.now(),
+        )
+    return list(ImageJob.objects.filter(pk__in=job_pks).order_by('date_created'))
+
+
+def requeue_image_jobs(jobs, error):
+    """ the given processing jobs are pending again, or failed if they have been tried IMAGE_JOB_MAX_ATTEMPTS times """
+    jobs = jobs.filter(state=PROCESSING)
+    jobs.filter(attempts__lt=IMAGE_JOB_MAX_ATTEMPTS).update(state=PENDING)
+    jobs.update(state=FAILED, error=error, date_finished=timezone.now())
+
+
+def release_image_jobs(jobs):
+    """ the given processing jobs (interrupted by the shutdown of their worker) are pending again,
+        without counting their attempt """
+    jobs.filter(state=PROCESSING).update(state=PENDING, attempts=F('attempts') - 1)
+
+
+def requeue_stale_image_jobs():
+    # the jobs left processing for more than IMAGE_JOB_TIMEOUT seconds (by a worker which has died):
+    requeue_image_jobs(
+        ImageJob.objects.filter(date_started__lt=timezone.now() - timedelta(seconds=IMAGE_JOB_TIMEOUT)), 'timed out',
+    )
+
+
+def get_job_arguments(job):
+    """ returns the arguments of process_image for a job: the path of its staged image, and the path
+        (without the extension) its processed image is saved at (the upload path of its target's image,
+        or a staging path if it is stored by its content) """
+    if IMAGE_CONTENT_ADDRESSED:
+        return os.path.join(MEDIA_ROOT, job.staged_name), os.path.join(MEDIA_ROOT, job.staged_name + '-processed')
+
+    model = IMAGE_JOB_MODELS[job.target]
+    image_name = model._meta.get_field('image').generate_filename(model(pk=job.object_id), 'image.jpg')
+    return os.path.join(MEDIA_ROOT, job.staged_name), os.path.join(MEDIA_ROOT, os.path.splitext(image_name)[0])
+
+
+def finish_image_job(job, image_path=None, digest=None, error=None):
+    """ sets the processed image as the image of the job's target (and releases its old one),
+        or marks the job as failed """
+
+    with transaction.atomic():
+        if error is not None:
+            job.state = FAILED
+            job.error = error
+        else:
+            model = IMAGE_JOB_MODELS[job.target]
+
+            # (the target is locked, so its jobs finish one at a time, but maybe out of order):
+            old_image_names = list(
+                model.objects.select_for_update().filter(pk=job.object_id).values_list('image', flat=True)
+            )
+            is_superseded = ImageJob.objects.filter(
+                target=job.target, object_id=job.object_id, state=DONE, pk__gt=job.pk,
+            ).exists()
+
+            if IMAGE_CONTENT_ADDRESSED:
+                image_name = get_blob_name(digest, os.path.splitext(image_path)[1])
+                lock_blobs([image_name] + old_image_names)
+                store_blob(image_path, image_name)
+            else:
+                image_name = os.path.relpath(image_path, MEDIA_ROOT)
+
+            if not old_image_names or is_superseded:
+                # the target is deleted, or already has a newer image:
+                release_image(image_name)
+            else:
+                model.objects.filter(pk=job.object_id).update(image=image_name, date_updated=timezone.now())
+                release_image(old_image_names[0])
+            job.state = DONE
+
+        job.date_finished = timezone.now()
+        job.save(update_fields=['state', 'error', 'date_finished'])
+
+    staged_path = os.path.join(MEDIA_ROOT, job.staged_name)
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+
+def run_image_jobs(limit=None):
+    """ processes the pending jobs in this process (for development, tests & the worker's --processes 0);
+        returns the number of processed jobs """
+    num_jobs = 0
+    while limit is None or num_jobs < limit:
+        jobs = claim_image_jobs(1)
+        if not jobs:
+            break
+        try:
+            image_path, digest = process_image(*get_job_arguments(jobs[0]))
+        except Exception as e:
+            finish_image_job(jobs[0], error=repr(e))
+        else:
+            finish_image_job(jobs[0], image_path=image_path, digest=digest)
+        num_jobs += 1
+    return num_jobs
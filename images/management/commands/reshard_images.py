@@ -0,0 +1,58 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bookshare.settings import DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE, MEDIA_ROOT
+from images.jobs import IMAGE_JOB_MODELS
+from images.storage import get_image_shard, move_image
+
+
+def reshard_image(model, pk, image_name, new_image_name):
+    """ moves the image of an instance (and its thumbnails) to its new name; returns False if it has changed
+        meanwhile, or does not exist """
+    with transaction.atomic():
+        # the instance is locked, so the image worker does not replace its image meanwhile:
+        if not model.objects.select_for_update().filter(pk=pk, image=image_name).exists():
+            return False
+        if not os.path.exists(os.path.join(MEDIA_ROOT, image_name)):
+            return False
+
+        move_image(image_name, new_image_name)
+        try:
+            model.objects.filter(pk=pk).update(image=new_image_name)
+        except Exception:
+            move_image(new_image_name, image_name)
+            raise
+    return True
+
+
+class Command(BaseCommand):
+    help = "moves the book & profile images stored before the sharded layout (and their thumbnails) " \
+           "to their shard directories"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="only print the moves")
+
+    def handle(self, *args, **options):
+        for target, model in IMAGE_JOB_MODELS.items():
+            # the images directly in "book_images/" or "profile_images/":
+            images = list(model.objects.filter(image__regex=r'^[^/]+/[^/]+$').values_list('pk', 'image'))
+
+            num_resharded, num_skipped = 0, 0
+            for pk, image_name in images:
+                directory, file_name = os.path.split(image_name)
+                if file_name in (DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE):
+                    continue
+                new_image_name = os.path.join(directory, get_image_shard(pk), file_name)
+
+                if options['dry_run']:
+                    self.stdout.write("{0} -> {1}".format(image_name, new_image_name))
+                elif reshard_image(model, pk, image_name, new_image_name):
+                    num_resharded += 1
+                else:
+                    num_skipped += 1
+
+            self.stdout.write("{0} images: {1} resharded, {2} skipped (changed or missing).".format(
+                target, num_resharded, num_skipped,
+            ))
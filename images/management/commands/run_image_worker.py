@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bookshare.settings import IMAGE_WORKER_PROCESSES
+from images.jobs import run_image_jobs
+from images.worker import run_worker
+
+
+class Command(BaseCommand):
+    help = "processes the uploaded images (verification, re-encoding & thumbnails) in a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=IMAGE_WORKER_PROCESSES,
+                            help="the number of worker processes (0: process the pending jobs in this process, and exit)")
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help="exit when there are no pending jobs")
+
+    def handle(self, *args, **options):
+        if options['processes'] == 0:
+            num_jobs = run_image_jobs()
+            self.stdout.write("{0} image jobs were processed.".format(num_jobs))
+            return
+
+        run_worker(options['processes'], options['poll_interval'], options['once'])
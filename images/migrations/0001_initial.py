@@ -0,0 +1,33 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('book', 'Book Image'), ('profile', 'Profile Image')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('staged_name', models.CharField(max_length=255)),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Processing'), (2, 'Done'), (3, 'Failed')], default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('date_started', models.DateTimeField(blank=True, null=True, verbose_name='date started')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='date finished')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(condition=models.Q(state=0), fields=['date_created'], name='imagejob_pending_idx'),
+        ),
+    ]
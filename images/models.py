@@ -0,0 +1,46 @@
+from django.db import models
+
+
+IMAGE_JOB_TARGETS = (
+    ('book', 'Book Image'),
+    ('profile', 'Profile Image'),
+)
+
+IMAGE_JOB_STATES = (
+    (0, 'Pending'),
+    (1, 'Processing'),
+    (2, 'Done'),
+    (3, 'Failed'),
+)
+
+
+class ImageJob(models.Model):
+    # an uploaded image, staged until a worker processes it & sets it as the image of its target:
+    target =            models.CharField(max_length=10, choices=IMAGE_JOB_TARGETS)
+    object_id =         models.PositiveIntegerField()
+    staged_name =       models.CharField(max_length=255)
+    state =             models.PositiveSmallIntegerField(choices=IMAGE_JOB_STATES, default=0)
+    attempts =          models.PositiveSmallIntegerField(default=0)
+    error =             models.TextField(blank=True, default='')
+
+    date_created =      models.DateTimeField(verbose_name='date created', auto_now_add=True)
+    date_started =      models.DateTimeField(verbose_name='date started', null=True, blank=True)
+    date_finished =     models.DateTimeField(verbose_name='date finished', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # for claiming the pending jobs (oldest first):
+            models.Index(fields=['date_created'], name='imagejob_pending_idx', condition=models.Q(state=0)),
+        ]
+
+    def __str__(self):
+        return '{0} image of {1} ({2})'.format(self.target, self.object_id, self.get_state_display())
+
+
+class ImageBlob(models.Model):
+    # a content addressed image (see IMAGE_CONTENT_ADDRESSED), and the number of books & users which have it:
+    name =              models.CharField(max_length=100, unique=True)
+    ref_count =         models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '{0} ({1} references)'.format(self.name, self.ref_count)
@@ -0,0 +1,64 @@
+import os
+from hashlib import sha256
+
+from PIL import Image, ImageOps
+
+from images.thumbnails import generate_thumbnails, save_atomically
+
+# the formats the uploaded images may have:
+UPLOAD_IMAGE_FORMATS = ['JPEG', 'PNG', 'GIF', 'WEBP', 'BMP']
+# the quality the (opaque) images are re-encoded with:
+IMAGE_QUALITY = 90
+
+
+def get_image_format(image_file):
+    """ returns the format of an image file (by parsing its header only, without decoding it),
+        or None if it is not an image of the UPLOAD_IMAGE_FORMATS """
+    try:
+        with Image.open(image_file) as image:
+            image_format = image.format
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        if hasattr(image_file, 'seek'):
+            image_file.seek(0)
+    return image_format if image_format in UPLOAD_IMAGE_FORMATS else None
+
+
+def process_image(staged_path, destination_stem):
+    """ verifies & re-encodes a staged image (with its EXIF orientation applied & its metadata dropped),
+        saves it as destination_stem + ".jpg" (or ".png", if it is transparent) with its thumbnails,
+        and returns its path & the sha256 of its content. (it runs in the worker processes, so it does not
+        use the database) """
+
+    with Image.open(staged_path) as image:
+        image.verify()
+
+    with Image.open(staged_path) as original_image:
+        image = ImageOps.exif_transpose(original_image)
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            image = image.convert('RGBA')
+            image_path = destination_stem + '.png'
+            options = {'format': 'PNG', 'optimize': True}
+        else:
+            image = image.convert('RGB')
+            image_path = destination_stem + '.jpg'
+            options = {'format': 'JPEG', 'quality': IMAGE_QUALITY, 'optimize': True, 'progressive': True}
+
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        save_atomically(image, image_path, options.pop('format'), **options)
+
+    try:
+        generate_thumbnails(image_path)
+    except Exception:
+        os.remove(image_path)
+        raise
+    return image_path, get_file_digest(image_path)
+
+
+def get_file_digest(path):
+    digest = sha256()
+    with open(path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,18 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+
+class ImageRenderer(JSONRenderer):
+    """ lets the image apis answer the clients which only accept images (e.g. "Accept: image/webp")
+        instead of "406 Not Acceptable"; their error messages are still rendered as json. """
+    media_type = 'image/*'
+    format = 'image'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response', None)
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return super().render(data, JSONRenderer.media_type, renderer_context)
+
+
+IMAGE_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ImageRenderer]
@@ -0,0 +1,21 @@
+from rest_framework import serializers
+
+from bookshare.settings import IMAGE_MAX_UPLOAD_SIZE
+from images.jobs import stage_image
+from images.processing import get_image_format
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    """ accepts an uploaded image after only checking its size & header; it is staged, and verified,
+        re-encoded & set by the image worker (see images.worker) """
+    image = serializers.FileField()
+
+    def validate_image(self, image):
+        if image.size > IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError('The image must be at most {0} bytes.'.format(IMAGE_MAX_UPLOAD_SIZE))
+        if get_image_format(image) is None:
+            raise serializers.ValidationError('Upload a valid image.')
+        return image
+
+    def create(self, validated_data):
+        return stage_image(validated_data['image'], validated_data['target'], validated_data['object_id'])
@@ -0,0 +1,190 @@
+import mimetypes
+import os
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from bookshare.settings import (IMAGE_ACCEL_REDIRECT_LOCATION,
+                                IMAGE_CACHE_MAX_AGE, IMAGE_SENDFILE,
+                                MEDIA_ROOT)
+from images.thumbnails import get_thumbnail, get_thumbnail_format
+
+# the values of IMAGE_SENDFILE (streamed by django, or sent by nginx or apache):
+IMAGE_SENDFILE_MODES = ['', 'x-accel-redirect', 'x-sendfile']
+
+# the size of the chunks the images are streamed in:
+CHUNK_SIZE = 64 * 1024
+
+# (offset, magic bytes, content type) of the image formats:
+IMAGE_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'BM', 'image/bmp'),
+]
+
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def check_sendfile_mode():
+    """ raises ImproperlyConfigured if IMAGE_SENDFILE is not one of IMAGE_SENDFILE_MODES (checked at startup,
+        so a typo does not make every image a file path) """
+    if IMAGE_SENDFILE not in IMAGE_SENDFILE_MODES:
+        raise ImproperlyConfigured('IMAGE_SENDFILE is {0!r}, but it should be one of {1}.'.format(
+            IMAGE_SENDFILE, ', '.join(repr(mode) for mode in IMAGE_SENDFILE_MODES),
+        ))
+
+
+def sniff_content_type(image_file, path):
+    """ returns the content type of an open image from its first bytes (or its extension, if unknown) """
+    header = image_file.read(16)
+    image_file.seek(0)
+    for offset, signature, content_type in IMAGE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return content_type
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def get_file_etag(stat):
+    """ a strong etag of a file (as nginx does): its modification time & size """
+    return quote_etag('{0:x}-{1:x}'.format(stat.st_mtime_ns, stat.st_size))
+
+
+def parse_range(range_header, size):
+    """ returns the (start, end) (inclusive) of a single byte range, None if it should be ignored
+        (multiple ranges are answered with the whole file), or raises ValueError if it is unsatisfiable """
+    match = RANGE_REGEX.match(range_header.strip())
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # the last "end" bytes:
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), (min(int(end), size - 1) if end else size - 1)
+
+    if start >= size or start > end:
+        raise ValueError('unsatisfiable range')
+    return start, end
+
+
+def is_range_current(if_range_header, etag, last_modified):
+    """ the range is only sent if the client's copy (If-Range) is still the current one """
+    if not if_range_header:
+        return True
+    if if_range_header.startswith('"') or if_range_header.startswith('W/'):
+        return if_range_header == etag
+    return parse_http_date_safe(if_range_header) == int(last_modified)
+
+
+class FileChunks:
+    """ the chunks of a byte range of an open file; the file is closed with the response (which closes its
+        streaming content), even if it is never iterated. """
+
+    def __init__(self, image_file, start, length):
+        self.image_file = image_file
+        self.start = start
+        self.length = length
+
+    def __iter__(self):
+        self.image_file.seek(self.start)
+        length = self.length
+        while length > 0:
+            chunk = self.image_file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.image_file.close()
+
+
+def open_image(image_path, size, image_format):
+    """ returns the (path, open file) of an image, or of its thumbnail if size is given """
+    if size is not None:
+        image_path = get_thumbnail(image_path, size, image_format)
+    return image_path, open(image_path, 'rb')
+
+
+def serve_image(request, image_path, default_image_path, is_private=False, size=None):
+    """ returns the response of an image file (or the default image, if it does not exist), or of its thumbnail
+        if size is given: streamed in chunks (or sent by the web server, if IMAGE_SENDFILE is set), with its sniffed
+        content type, Last-Modified, ETag & Cache-Control headers, conditional requests and single byte ranges. """
+
+    # the file is opened once (a missing or unreadable image falls back to the default), and is then only
+    # accessed through its handle, so it cannot be replaced or removed in between:
+    image_format = get_thumbnail_format(request)
+    try:
+        if image_path is None:
+            raise FileNotFoundError('the image is not set')
+        image_path, image_file = open_image(image_path, size, image_format)
+    except OSError:
+        image_path, image_file = open_image(default_image_path, size, image_format)
+
+    response = None
+    try:
+        stat = os.fstat(image_file.fileno())
+        etag = get_file_etag(stat)
+        last_modified = stat.st_mtime
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+        if response is None:
+            response = get_file_response(request, image_file, image_path, stat, etag, last_modified)
+    finally:
+        # a streamed file is closed with the response:
+        if not isinstance(response, StreamingHttpResponse):
+            image_file.close()
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # the images are revalidated (with the etag) after IMAGE_CACHE_MAX_AGE seconds:
+    patch_cache_control(response, max_age=IMAGE_CACHE_MAX_AGE, **{'private' if is_private else 'public': True})
+    if size is not None:
+        # the format of the thumbnails depends on the Accept header:
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def get_file_response(request, image_file, image_path, stat, etag, last_modified):
+    content_type = sniff_content_type(image_file, image_path)
+    size = stat.st_size
+
+    # letting the web server send the file (it also handles the ranges):
+    if IMAGE_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        if IMAGE_SENDFILE == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = IMAGE_ACCEL_REDIRECT_LOCATION + os.path.relpath(image_path, MEDIA_ROOT)
+        else:
+            response['X-Sendfile'] = image_path
+        return response
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE', '')
+    if range_header and is_range_current(request.META.get('HTTP_IF_RANGE', ''), etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{0}'.format(size)
+            return response
+
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    response = StreamingHttpResponse(
+        FileChunks(image_file, start, end - start + 1),
+        status=(206 if byte_range is not None else 200), content_type=content_type,
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range is not None:
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+    return response
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from account.models import User
+from book.models import Book
+from images.blobs import release_image
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=User)
+def release_deleted_image(sender, instance, **kwargs):
+    # the image of a deleted book or user (a blob only loses a reference):
+    if instance.image:
+        release_image(instance.image.name)
@@ -0,0 +1,44 @@
+import os
+from hashlib import md5
+from uuid import uuid4
+
+from bookshare.settings import DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE, MEDIA_ROOT
+from images.thumbnails import get_thumbnail_paths, remove_thumbnails
+
+
+def get_image_shard(key):
+    """ returns the "ab/cd" directories of a key (the start of its md5), so the images are spread over
+        65536 directories instead of one """
+    digest = md5(str(key).encode()).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+
+def get_sharded_image_name(directory, instance, filename):
+    """ the name of a new image of an instance: "<directory>/<shard of its pk>/<pk>-<uuid>.<extension>" """
+    extension = filename.split('.')[-1]
+    unique_id = uuid4().hex
+    # (the images of the instances which are not saved yet are sharded by their uuid):
+    shard = get_image_shard(instance.pk if instance.pk is not None else unique_id)
+    return os.path.join(directory, shard, '{0}-{1}.{2}'.format(instance.pk, unique_id, extension))
+
+
+def remove_image(image_name):
+    """ removes an image (by its name relative to MEDIA_ROOT) and its thumbnails; the default images are kept """
+    if not image_name or os.path.basename(image_name) in (DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE):
+        return
+    image_path = os.path.join(MEDIA_ROOT, image_name)
+    remove_thumbnails(image_path)
+    if os.path.exists(image_path):
+        os.remove(image_path)
+
+
+def move_image(image_name, new_image_name):
+    """ moves an image (by its name relative to MEDIA_ROOT) and its thumbnails """
+    image_path = os.path.join(MEDIA_ROOT, image_name)
+    new_image_path = os.path.join(MEDIA_ROOT, new_image_name)
+    os.makedirs(os.path.dirname(new_image_path), exist_ok=True)
+
+    for thumbnail_path, new_thumbnail_path in zip(get_thumbnail_paths(image_path), get_thumbnail_paths(new_image_path)):
+        if os.path.exists(thumbnail_path):
+            os.replace(thumbnail_path, new_thumbnail_path)
+    os.replace(image_path, new_image_path)
@@ -0,0 +1,71 @@
+import os
+from unittest import mock
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import IMAGE_BLOB_DIR
+from images.jobs import run_image_jobs
+from images.models import ImageBlob
+from images.tests.test_jobs import create_image_file
+from images.thumbnails import get_thumbnail_paths
+
+
+@mock.patch('images.jobs.IMAGE_CONTENT_ADDRESSED', True)
+class ContentAddressedImageTestCase(APITransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test_user", email="test_user@alaki.com", first_name="test", last_name="user", is_active=True)
+        self.books = [
+            Book.objects.create(title="book " + str(i), description="nothing", page_num=100, category_1='0', owner=self.user, slug="book-" + str(i))
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        return super().setUp()
+
+    def edit_book_image(self, book, image_file):
+        response = self.client.put(
+            reverse('book_api:edit_book_image', kwargs={'book_slug': book.slug}),
+            data={'image': image_file}, format='multipart',
+        )
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run_image_jobs()
+        return Book.objects.get(pk=book.pk).image
+
+    def test_same_images_share_a_blob(self):
+        image_1 = self.edit_book_image(self.books[0], create_image_file())
+        image_2 = self.edit_book_image(self.books[1], create_image_file())
+
+        self.assertEqual(image_1.name, image_2.name)
+        self.assertTrue(image_1.name.startswith(IMAGE_BLOB_DIR + '/'))
+        self.assertEqual(ImageBlob.objects.get(name=image_1.name).ref_count, 2)
+        self.assertTrue(os.path.exists(image_1.path))
+        self.assertTrue(all(os.path.exists(path) for path in get_thumbnail_paths(image_1.path)))
+
+        # a book gets another image (the blob is still used by the other book):
+        other_image = self.edit_book_image(self.books[0], create_image_file(size=(50, 50)))
+        self.assertNotEqual(other_image.name, image_1.name)
+        self.assertEqual(ImageBlob.objects.get(name=image_1.name).ref_count, 1)
+        self.assertTrue(os.path.exists(image_1.path))
+
+        # the last reference is deleted:
+        Book.objects.get(pk=self.books[1].pk).delete()
+        self.assertFalse(ImageBlob.objects.filter(name=image_1.name).exists())
+        self.assertFalse(os.path.exists(image_1.path))
+        self.assertFalse(any(os.path.exists(path) for path in get_thumbnail_paths(image_1.path)))
+        self.assertTrue(os.path.exists(other_image.path))
+
+    def test_same_image_again(self):
+        image = self.edit_book_image(self.books[0], create_image_file())
+        same_image = self.edit_book_image(self.books[0], create_image_file())
+
+        self.assertEqual(image.name, same_image.name)
+        self.assertEqual(ImageBlob.objects.get(name=image.name).ref_count, 1)
+        self.assertTrue(os.path.exists(image.path))
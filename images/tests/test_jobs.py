@@ -0,0 +1,173 @@
+import io
+import os
+from datetime import timedelta
+from unittest import mock
+
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import MEDIA_ROOT
+from images.jobs import (DONE, FAILED, PENDING, PROCESSING, run_image_jobs,
+                         requeue_stale_image_jobs)
+from images.models import ImageJob
+from images.storage import get_image_shard
+from images.thumbnails import get_thumbnail_paths
+from images.worker import run_worker
+
+
+def create_image_file(size=(300, 200), image_format='JPEG', orientation=None):
+    image_file = io.BytesIO()
+    image = Image.new('RGB', size, (0, 128, 255))
+    if orientation is not None:
+        exif = image.getexif()
+        exif[0x0112] = orientation
+        image.save(image_file, format=image_format, exif=exif.tobytes())
+    else:
+        image.save(image_file, format=image_format)
+    image_file.name = 'image.' + image_format.lower()
+    image_file.seek(0)
+    return image_file
+
+
+class ImageJobTestCase(APITransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test_user", email="test_user@alaki.com", first_name="test", last_name="user", is_active=True)
+        self.book = Book.objects.create(title="book", description="nothing", page_num=100, category_1='0', owner=self.user, slug="book")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        return super().setUp()
+
+    def edit_book_image(self, image_file):
+        return self.client.put(
+            reverse('book_api:edit_book_image', kwargs={'book_slug': self.book.slug}),
+            data={'image': image_file}, format='multipart',
+        )
+
+    def test_edit_image_is_processed_later(self):
+        # rotated 90 degrees by its EXIF orientation:
+        response = self.edit_book_image(create_image_file(size=(300, 200), orientation=6))
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the image is only staged:
+        job = ImageJob.objects.get()
+        self.assertEqual(job.state, PENDING)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, job.staged_name)))
+        self.assertFalse(Book.objects.get(pk=self.book.pk).image)
+
+        self.assertEqual(run_image_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, DONE)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, job.staged_name)))
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertTrue(book.image.name.startswith('book_images/{0}/{1}-'.format(get_image_shard(book.pk), book.pk)))
+        with Image.open(book.image.path) as image:
+            self.assertEqual(image.size, (200, 300))
+            self.assertNotIn(0x0112, image.getexif())
+        self.assertTrue(all(os.path.exists(path) for path in get_thumbnail_paths(book.image.path)))
+
+        # the old image & its thumbnails are removed with a new one:
+        old_image_path = book.image.path
+        self.edit_book_image(create_image_file(image_format='PNG'))
+        run_image_jobs()
+        self.assertFalse(os.path.exists(old_image_path))
+        self.assertFalse(any(os.path.exists(path) for path in get_thumbnail_paths(old_image_path)))
+        self.assertTrue(os.path.exists(Book.objects.get(pk=self.book.pk).image.path))
+
+    def test_edit_profile_image(self):
+        response = self.client.put(reverse('account_api:edit_image'), data={'image': create_image_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run_image_jobs()
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.image.name.startswith('profile_images/{0}/{1}-'.format(get_image_shard(user.pk), user.pk)))
+        self.assertTrue(os.path.exists(user.image.path))
+
+    def test_invalid_images(self):
+        # not an image:
+        not_an_image = io.BytesIO(b'not an image')
+        not_an_image.name = 'image.jpg'
+        response = self.edit_book_image(not_an_image)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageJob.objects.exists())
+
+        # a truncated image (with a valid header) fails in the worker:
+        image_content = create_image_file().getvalue()
+        truncated_image = io.BytesIO(image_content[:len(image_content) // 2])
+        truncated_image.name = 'image.jpg'
+        response = self.edit_book_image(truncated_image)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run_image_jobs()
+
+        job = ImageJob.objects.get()
+        self.assertEqual(job.state, FAILED)
+        self.assertNotEqual(job.error, '')
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, job.staged_name)))
+        self.assertFalse(Book.objects.get(pk=self.book.pk).image)
+
+    def test_jobs_finished_out_of_order(self):
+        self.edit_book_image(create_image_file(size=(100, 100)))
+        self.edit_book_image(create_image_file(size=(50, 50)))
+        older_job, newer_job = ImageJob.objects.order_by('pk')
+
+        # the newer job finishes first:
+        older_job.state = PROCESSING
+        older_job.save()
+        run_image_jobs()
+        older_job.state = PENDING
+        older_job.save()
+        run_image_jobs()
+
+        with Image.open(Book.objects.get(pk=self.book.pk).image.path) as image:
+            self.assertEqual(image.size, (50, 50))
+        # the image of the older job is removed (only the newer one & its thumbnails are left):
+        book_image_names = [
+            name for name in os.listdir(os.path.join(MEDIA_ROOT, 'book_images', get_image_shard(self.book.pk)))
+            if name.startswith('{0}-'.format(self.book.pk))
+        ]
+        self.assertEqual(len(book_image_names), 1 + len(get_thumbnail_paths(book_image_names[0])))
+
+    def test_requeue_stale_jobs(self):
+        self.edit_book_image(create_image_file())
+        self.edit_book_image(create_image_file())
+        stale_date = timezone.now() - timedelta(hours=1)
+        ImageJob.objects.update(state=PROCESSING, date_started=stale_date)
+        ImageJob.objects.filter(pk=ImageJob.objects.order_by('pk')[0].pk).update(attempts=3)
+
+        requeue_stale_image_jobs()
+        self.assertEqual(list(ImageJob.objects.order_by('pk').values_list('state', flat=True)), [FAILED, PENDING])
+
+    def test_worker(self):
+        for i in range(3):
+            self.edit_book_image(create_image_file(size=(100 + i, 100)))
+        run_worker(processes=2, poll_interval=0.1, once=True)
+
+        self.assertEqual(list(ImageJob.objects.values_list('state', flat=True)), [DONE] * 3)
+        with Image.open(Book.objects.get(pk=self.book.pk).image.path) as image:
+            self.assertEqual(image.size, (102, 100))
+
+    @mock.patch('images.worker.IMAGE_JOB_REQUEUE_INTERVAL', 0)
+    def test_worker_requeues_stale_jobs_periodically(self):
+        self.edit_book_image(create_image_file())
+        with mock.patch('images.worker.requeue_stale_image_jobs') as requeue_stale_image_jobs:
+            run_worker(processes=1, poll_interval=0.1, once=True)
+        self.assertGreater(requeue_stale_image_jobs.call_count, 1)
+
+    def test_stopped_worker_releases_its_jobs(self):
+        for i in range(2):
+            self.edit_book_image(create_image_file())
+        with mock.patch('images.worker.wait', side_effect=KeyboardInterrupt), self.assertRaises(KeyboardInterrupt):
+            run_worker(processes=1, poll_interval=0.1)
+
+        self.assertEqual(list(ImageJob.objects.values_list('state', 'attempts')), [(PENDING, 0)] * 2)
+        run_worker(processes=1, poll_interval=0.1, once=True)
+        self.assertEqual(list(ImageJob.objects.values_list('state', flat=True)), [DONE] * 2)
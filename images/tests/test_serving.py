@@ -0,0 +1,191 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import DEFAULT_BOOK_IMAGE, DEFAULT_PROFILE_IMAGE, MEDIA_ROOT
+from images.serving import check_sendfile_mode, parse_range, serve_image
+
+
+class ServeImageTestCase(TestCase):
+
+    def setUp(self):
+        # a png image with a wrong extension:
+        self.image_file = tempfile.NamedTemporaryFile(suffix='.jpg', dir=MEDIA_ROOT)
+        Image.new('RGB', (100, 100)).save(self.image_file, format='PNG')
+        self.image_file.flush()
+        with open(self.image_file.name, 'rb') as f:
+            self.image_content = f.read()
+        self.default_image_path = os.path.join(MEDIA_ROOT, DEFAULT_BOOK_IMAGE)
+        self.factory = RequestFactory()
+
+        return super().setUp()
+
+    def tearDown(self):
+        self.image_file.close()
+        return super().tearDown()
+
+    def test_serve_image(self):
+        response = serve_image(self.factory.get('/'), self.image_file.name, self.default_image_path)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.getvalue(), self.image_content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], str(len(self.image_content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_serve_default_image(self):
+        response = serve_image(self.factory.get('/'), os.path.join(MEDIA_ROOT, 'nonexistent.jpg'), self.default_image_path)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with open(self.default_image_path, 'rb') as f:
+            self.assertEqual(response.getvalue(), f.read())
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        response = serve_image(self.factory.get('/'), None, self.default_image_path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # an unreadable image (here, a directory) falls back to the default as well:
+        response = serve_image(self.factory.get('/'), MEDIA_ROOT, self.default_image_path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with open(self.default_image_path, 'rb') as f:
+            self.assertEqual(response.getvalue(), f.read())
+
+    def test_file_opened_once(self):
+        opened_files = []
+
+        def record_open(*args):
+            opened_files.append(open(*args))
+            return opened_files[-1]
+
+        with mock.patch('images.serving.open', side_effect=record_open, create=True):
+            response = serve_image(self.factory.get('/'), self.image_file.name, self.default_image_path)
+        self.assertEqual(len(opened_files), 1)
+        self.assertEqual(response.getvalue(), self.image_content)
+        self.assertFalse(opened_files[0].closed)
+        # the streamed file is closed with the response:
+        response.close()
+        self.assertTrue(opened_files[0].closed)
+
+    def test_conditional_requests(self):
+        response = serve_image(self.factory.get('/'), self.image_file.name, self.default_image_path)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = serve_image(
+            self.factory.get('/', HTTP_IF_NONE_MATCH=etag), self.image_file.name, self.default_image_path,
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = serve_image(
+            self.factory.get('/', HTTP_IF_MODIFIED_SINCE=last_modified), self.image_file.name, self.default_image_path,
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # after the image changes:
+        os.utime(self.image_file.name, ns=(0, os.stat(self.image_file.name).st_mtime_ns + 10 ** 9))
+        response = serve_image(
+            self.factory.get('/', HTTP_IF_NONE_MATCH=etag), self.image_file.name, self.default_image_path,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_range_requests(self):
+        size = len(self.image_content)
+
+        response = serve_image(self.factory.get('/', HTTP_RANGE='bytes=0-9'), self.image_file.name, self.default_image_path)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.getvalue(), self.image_content[:10])
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/{0}'.format(size))
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = serve_image(self.factory.get('/', HTTP_RANGE='bytes=-5'), self.image_file.name, self.default_image_path)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.getvalue(), self.image_content[-5:])
+
+        response = serve_image(
+            self.factory.get('/', HTTP_RANGE='bytes={0}-'.format(size)), self.image_file.name, self.default_image_path,
+        )
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */{0}'.format(size))
+
+        # a stale If-Range gets the whole image:
+        response = serve_image(
+            self.factory.get('/', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"'), self.image_file.name, self.default_image_path,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.getvalue(), self.image_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(parse_range('bytes=10-1000', 100), (10, 99))
+        self.assertEqual(parse_range('bytes=-1000', 100), (0, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=20-10', 100)
+
+    def test_sendfile(self):
+        with mock.patch('images.serving.IMAGE_SENDFILE', 'x-accel-redirect'):
+            response = serve_image(self.factory.get('/'), self.image_file.name, self.default_image_path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected_media/' + os.path.basename(self.image_file.name))
+
+        with mock.patch('images.serving.IMAGE_SENDFILE', 'x-sendfile'):
+            response = serve_image(self.factory.get('/'), self.image_file.name, self.default_image_path)
+        self.assertEqual(response['X-Sendfile'], self.image_file.name)
+
+    def test_check_sendfile_mode(self):
+        for mode in ['', 'x-accel-redirect', 'x-sendfile']:
+            with mock.patch('images.serving.IMAGE_SENDFILE', mode):
+                check_sendfile_mode()
+        with mock.patch('images.serving.IMAGE_SENDFILE', 'x-accel'), self.assertRaises(ImproperlyConfigured):
+            check_sendfile_mode()
+
+
+class ImageAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test_user", email="test_user@alaki.com", first_name="test", last_name="user", is_active=True)
+        self.book = Book.objects.create(title="book", description="nothing", page_num=100, category_1='0', owner=self.user, slug="book")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        return super().setUp()
+
+    def test_get_book_image_not_modified(self):
+        response = self.client.get(reverse('book_api:get_book_image', kwargs={'book_slug': self.book.slug}))
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('public', response['Cache-Control'])
+
+        response = self.client.get(
+            reverse('book_api:get_book_image', kwargs={'book_slug': self.book.slug}), HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_profile_image(self):
+        response = self.client.get(reverse('account_api:get_profile_image', kwargs={'username': self.user.username}))
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with open(os.path.join(MEDIA_ROOT, DEFAULT_PROFILE_IMAGE), 'rb') as f:
+            self.assertEqual(response.getvalue(), f.read())
+        self.assertIn('private', response['Cache-Control'])
@@ -0,0 +1,61 @@
+import io
+import os
+
+from django.core.management import call_command
+from django.test import TestCase
+from PIL import Image
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import MEDIA_ROOT
+from images.storage import get_image_shard, get_sharded_image_name
+from images.thumbnails import generate_thumbnails, get_thumbnail_paths
+
+
+class ShardedStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test_user", email="test_user@alaki.com", first_name="test", last_name="user")
+        self.book = Book.objects.create(title="book", description="nothing", page_num=100, category_1='0', owner=self.user, slug="book")
+        return super().setUp()
+
+    def test_sharded_image_name(self):
+        image_name = get_sharded_image_name('book_images', self.book, 'cover.png')
+        directory, shard_1, shard_2, file_name = image_name.split('/')
+
+        self.assertEqual(directory, 'book_images')
+        self.assertEqual(os.path.join(shard_1, shard_2), get_image_shard(self.book.pk))
+        self.assertEqual(len(shard_1), 2)
+        self.assertEqual(len(shard_2), 2)
+        self.assertTrue(file_name.startswith('{0}-'.format(self.book.pk)))
+        self.assertTrue(file_name.endswith('.png'))
+
+        # the images of an instance are in the same shard, but the instances are spread over the shards:
+        self.assertEqual(os.path.dirname(get_sharded_image_name('book_images', self.book, 'cover.png')), os.path.dirname(image_name))
+        shards = {get_image_shard(pk) for pk in range(1000)}
+        self.assertGreater(len(shards), 900)
+
+    def test_reshard_images(self):
+        # an image stored before the sharded layout, with its thumbnails:
+        image_name = 'book_images/{0}-unsharded.jpg'.format(self.book.pk)
+        image_path = os.path.join(MEDIA_ROOT, image_name)
+        Image.new('RGB', (100, 100)).save(image_path, format='JPEG')
+        generate_thumbnails(image_path)
+        Book.objects.filter(pk=self.book.pk).update(image=image_name)
+
+        output = io.StringIO()
+        call_command('reshard_images', stdout=output)
+        self.assertIn('book images: 1 resharded', output.getvalue())
+
+        new_image_name = 'book_images/{0}/{1}-unsharded.jpg'.format(get_image_shard(self.book.pk), self.book.pk)
+        new_image_path = os.path.join(MEDIA_ROOT, new_image_name)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).image.name, new_image_name)
+        self.assertTrue(os.path.exists(new_image_path))
+        self.assertFalse(os.path.exists(image_path))
+        self.assertTrue(all(os.path.exists(path) for path in get_thumbnail_paths(new_image_path)))
+        self.assertFalse(any(os.path.exists(path) for path in get_thumbnail_paths(image_path)))
+
+        # the sharded images are left as they are:
+        output = io.StringIO()
+        call_command('reshard_images', stdout=output)
+        self.assertIn('book images: 0 resharded, 0 skipped', output.getvalue())
@@ -0,0 +1,122 @@
+import io
+import os
+import tempfile
+
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import MEDIA_ROOT, THUMBNAIL_SIZES
+from images.jobs import run_image_jobs
+from images.thumbnails import (generate_thumbnails, get_thumbnail_path,
+                               get_thumbnail_paths, parse_thumbnail_size,
+                               remove_thumbnails)
+
+
+class ThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.directory.name, '1-test.png')
+        return super().setUp()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        return super().tearDown()
+
+    def test_generate_thumbnails(self):
+        Image.new('RGB', (1000, 500), (255, 0, 0)).save(self.image_path)
+        generate_thumbnails(self.image_path)
+
+        for size in THUMBNAIL_SIZES:
+            with Image.open(get_thumbnail_path(self.image_path, size, 'webp')) as thumbnail:
+                self.assertEqual(thumbnail.format, 'WEBP')
+                self.assertEqual(thumbnail.size, (size, size // 2))
+            with Image.open(get_thumbnail_path(self.image_path, size, 'jpeg')) as thumbnail:
+                self.assertEqual(thumbnail.format, 'JPEG')
+                self.assertEqual(thumbnail.size, (size, size // 2))
+
+        remove_thumbnails(self.image_path)
+        self.assertFalse(any(os.path.exists(path) for path in get_thumbnail_paths(self.image_path)))
+        self.assertTrue(os.path.exists(self.image_path))
+
+    def test_small_and_transparent_images(self):
+        # the small images are not upscaled, and the transparent parts become white:
+        Image.new('RGBA', (100, 50), (0, 0, 0, 0)).save(self.image_path)
+        generate_thumbnails(self.image_path)
+
+        with Image.open(get_thumbnail_path(self.image_path, 768, 'jpeg')) as thumbnail:
+            self.assertEqual(thumbnail.size, (100, 50))
+            self.assertEqual(thumbnail.mode, 'RGB')
+            self.assertTrue(all(channel > 240 for channel in thumbnail.getpixel((50, 25))))
+
+    def test_parse_thumbnail_size(self):
+        self.assertIsNone(parse_thumbnail_size(None))
+        self.assertIsNone(parse_thumbnail_size('original'))
+        self.assertEqual(parse_thumbnail_size('64'), 64)
+        with self.assertRaises(ValueError):
+            parse_thumbnail_size('65')
+        with self.assertRaises(ValueError):
+            parse_thumbnail_size('large')
+
+
+class ThumbnailAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="test_user", email="test_user@alaki.com", first_name="test", last_name="user", is_active=True)
+        self.book = Book.objects.create(title="book", description="nothing", page_num=100, category_1='0', owner=self.user, slug="book")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.image_file = io.BytesIO()
+        Image.new('RGB', (1200, 800), (0, 0, 255)).save(self.image_file, format='JPEG')
+        self.image_file.name = 'cover.jpg'
+        self.image_file.seek(0)
+
+        return super().setUp()
+
+    def test_edit_and_get_book_thumbnail(self):
+        response = self.client.put(
+            reverse('book_api:edit_book_image', kwargs={'book_slug': self.book.slug}),
+            data={'image': self.image_file}, format='multipart',
+        )
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        run_image_jobs()
+
+        # the thumbnails are generated with the image:
+        image_path = Book.objects.get(pk=self.book.pk).image.path
+        self.assertTrue(image_path.startswith(os.path.join(MEDIA_ROOT, 'book_images')))
+        self.assertTrue(all(os.path.exists(path) for path in get_thumbnail_paths(image_path)))
+
+        url = reverse('book_api:get_book_image', kwargs={'book_slug': self.book.slug})
+        response = self.client.get(url, {'size': 256}, HTTP_ACCEPT='image/webp,image/*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(io.BytesIO(response.getvalue())) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 171))
+
+        response = self.client.get(url, {'size': 64})
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(response.getvalue())) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 43))
+
+        response = self.client.get(url, {'size': 100}, HTTP_ACCEPT='image/webp')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_get_default_profile_thumbnail(self):
+        response = self.client.get(
+            reverse('account_api:get_profile_image', kwargs={'username': self.user.username}), {'size': 64},
+        )
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with Image.open(io.BytesIO(response.getvalue())) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 64)
@@ -0,0 +1,90 @@
+import os
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+
+from bookshare.settings import THUMBNAIL_QUALITY, THUMBNAIL_SIZES
+
+# the (file extension, pillow format) of the thumbnails; webp is sent to the clients which accept it:
+THUMBNAIL_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+THUMBNAIL_EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+
+def parse_thumbnail_size(size):
+    """ returns the thumbnail size (one of THUMBNAIL_SIZES), or None for the original image """
+    if size is None or size == '' or size == 'original':
+        return None
+    size = int(size)
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError('invalid thumbnail size')
+    return size
+
+
+def get_thumbnail_format(request):
+    return 'webp' if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else 'jpeg'
+
+
+def get_thumbnail_path(image_path, size, image_format):
+    """ the thumbnails are stored alongside their image: "<name>.<size>.<extension>" """
+    return '{0}.{1}.{2}'.format(os.path.splitext(image_path)[0], size, THUMBNAIL_EXTENSIONS[image_format])
+
+
+def get_thumbnail_paths(image_path):
+    return [
+        get_thumbnail_path(image_path, size, image_format)
+        for size in THUMBNAIL_SIZES for image_format in THUMBNAIL_FORMATS
+    ]
+
+
+def save_atomically(image, path, pillow_format, **options):
+    # the thumbnail is written to a temporary file first, so it is never served half-written:
+    temp_path = '{0}.{1}.tmp'.format(path, uuid4().hex)
+    try:
+        image.save(temp_path, format=pillow_format, **options)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def generate_thumbnails(image_path):
+    """ saves a thumbnail of the image (fitting in size x size, never upscaled) in each size & format """
+    with Image.open(image_path) as original_image:
+        image = ImageOps.exif_transpose(original_image)
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            # the transparent parts become white (jpeg has no alpha channel):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        else:
+            image = image.convert('RGB')
+
+        # the larger thumbnails are downscaled first, and each smaller one from the previous:
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            save_atomically(image, get_thumbnail_path(image_path, size, 'webp'), 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+            save_atomically(image, get_thumbnail_path(image_path, size, 'jpeg'), 'JPEG', quality=THUMBNAIL_QUALITY,
+                            optimize=True, progressive=True)
+
+
+def remove_thumbnails(image_path):
+    for thumbnail_path in get_thumbnail_paths(image_path):
+        if os.path.exists(thumbnail_path):
+            os.remove(thumbnail_path)
+
+
+def get_thumbnail(image_path, size, image_format):
+    """ returns the path of a thumbnail of the image; the thumbnails of the images saved before they existed
+        (and of the default images) are generated on their first request. """
+    thumbnail_path = get_thumbnail_path(image_path, size, image_format)
+    if not os.path.exists(thumbnail_path):
+        generate_thumbnails(image_path)
+    return thumbnail_path
@@ -0,0 +1,70 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from bookshare.settings import IMAGE_JOB_REQUEUE_INTERVAL
+from images.jobs import (claim_image_jobs, finish_image_job, get_job_arguments,
+                         release_image_jobs, requeue_image_jobs,
+                         requeue_stale_image_jobs)
+from images.models import ImageJob
+from images.processing import process_image
+
+# the jobs claimed per worker process (so a process never waits for the database):
+JOBS_PER_PROCESS = 2
+
+
+def stop_worker(signum, frame):
+    # (SIGTERM, e.g. on a deploy, stops the worker like KeyboardInterrupt does):
+    raise SystemExit(0)
+
+
+def run_worker(processes, poll_interval=1.0, once=False):
+    """ processes the image jobs in a pool of processes (the database is only used by this process);
+        returns when there are no pending jobs if once is True, else runs forever. the stale jobs (of the dead
+        workers) are requeued every IMAGE_JOB_REQUEUE_INTERVAL seconds, and the jobs of this worker when it stops """
+
+    previous_handler = signal.signal(signal.SIGTERM, stop_worker)
+    running_jobs = {}
+    try:
+        # the processes are spawned (not forked), so they do not share this process's database connection:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn')) as executor:
+            last_requeued = None
+            while True:
+                if last_requeued is None or time.monotonic() - last_requeued >= IMAGE_JOB_REQUEUE_INTERVAL:
+                    requeue_stale_image_jobs()
+                    last_requeued = time.monotonic()
+
+                max_running_jobs = JOBS_PER_PROCESS * processes
+                if len(running_jobs) < max_running_jobs:
+                    for job in claim_image_jobs(max_running_jobs - len(running_jobs)):
+                        running_jobs[executor.submit(process_image, *get_job_arguments(job))] = job
+
+                if not running_jobs:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+
+                done_futures, _ = wait(running_jobs, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    job = running_jobs.pop(future)
+                    try:
+                        image_path, digest = future.result()
+                    except BrokenProcessPool:
+                        # a process has crashed (e.g. on a malicious image): the running jobs are retried
+                        # (up to IMAGE_JOB_MAX_ATTEMPTS times) by the restarted worker:
+                        crashed_job_pks = [job.pk] + [running_job.pk for running_job in running_jobs.values()]
+                        requeue_image_jobs(ImageJob.objects.filter(pk__in=crashed_job_pks), 'the worker process crashed')
+                        raise
+                    except Exception as e:
+                        finish_image_job(job, error=repr(e))
+                    else:
+                        finish_image_job(job, image_path=image_path, digest=digest)
+    except (KeyboardInterrupt, SystemExit):
+        # the claimed jobs are left to the other (or the restarted) workers:
+        release_image_jobs(ImageJob.objects.filter(pk__in=[job.pk for job in running_jobs.values()]))
+        raise
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
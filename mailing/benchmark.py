@@ -0,0 +1,58 @@
+import time
+from uuid import uuid4
+
+from django.template import Context, Engine
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from account.models import User
+from bookshare.settings import MSG_LANGUAGE, TEMPLATE_LOADERS, TEMPLATES
+from mailing.rendering import EMAILS, get_email_template, render_email
+
+
+def get_sample_contexts(num_messages):
+    """ returns the contexts (with unsaved users) of num_messages emails of EMAILS """
+    contexts = []
+    for i in range(num_messages):
+        user = User(pk=i + 1, username='user' + str(i), first_name='first' + str(i), last_name='last' + str(i))
+        contexts.append({
+            'user': user,
+            'domain': 'bookshare.test',
+            'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+            'token': 'a1b2c3-' + uuid4().hex[:20],
+            'new_password': uuid4().hex[:10],
+        })
+    return contexts
+
+
+def get_renderers(name):
+    """ returns {renderer name: function rendering the body of an email from its context} """
+    template_name = get_email_template(name, MSG_LANGUAGE).origin.template_name
+    engines = {
+        'uncached loaders': Engine(dirs=TEMPLATES[0]['DIRS'], loaders=TEMPLATE_LOADERS),
+        'cached loader': Engine(dirs=TEMPLATES[0]['DIRS'], loaders=[('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]),
+    }
+    renderers = {
+        renderer: (lambda context, engine=engine: engine.get_template(template_name).render(Context(context)))
+        for renderer, engine in engines.items()
+    }
+    renderers['pre-rendered'] = lambda context: render_email(name, **context)[1]
+    return renderers
+
+
+def run_rendering_benchmark(num_messages):
+    """ renders num_messages of each email of EMAILS with each renderer (see get_renderers);
+        returns {(email, renderer): the rendering times of the messages (µs)} """
+    results = {}
+    for name in EMAILS:
+        contexts = get_sample_contexts(num_messages)
+        for renderer, render in get_renderers(name).items():
+            # a warm up message, which is not reported:
+            render(contexts[0])
+            durations = []
+            for context in contexts:
+                start_time = time.perf_counter()
+                render(context)
+                durations.append((time.perf_counter() - start_time) * 1000000)
+            results[(name, renderer)] = durations
+    return results
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailing.benchmark import run_rendering_benchmark
+from search.benchmark import percentile
+
+
+class Command(BaseCommand):
+    help = "reports the rendering time per message of the transactional emails, with the not cached & cached "\
+           "template loaders, and pre-rendered (see mailing.rendering)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        results = run_rendering_benchmark(options['messages'])
+
+        line_format = '{0:<16} {1:<18} {2:>9} {3:>9} {4:>13}'
+        self.stdout.write(line_format.format('email', 'renderer', 'p50 (µs)', 'p95 (µs)', 'messages/s'))
+        for (name, renderer), durations in results.items():
+            self.stdout.write(line_format.format(
+                name, renderer,
+                '{0:.1f}'.format(percentile(durations, 50)),
+                '{0:.1f}'.format(percentile(durations, 95)),
+                '{0:.0f}'.format(len(durations) / sum(durations) * 1000000),
+            ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from mailing.outbox import run_sender, send_pending_emails
+
+
+class Command(BaseCommand):
+    help = "sends the queued emails (registration, reset password, ...) in batches over one SMTP connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help="exit when there are no pending emails")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            num_sent = send_pending_emails()
+            self.stdout.write("{0} emails were sent.".format(num_sent))
+            return
+
+        run_sender(options['poll_interval'])
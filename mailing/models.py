@@ -0,0 +1,36 @@
+from django.db import models
+from django.utils import timezone
+
+
+OUTGOING_EMAIL_STATES = (
+    (0, 'Pending'),
+    (1, 'Sent'),
+    (2, 'Failed'),
+)
+
+
+class OutgoingEmail(models.Model):
+    # an email queued by the apis, and sent by the email sender (see mailing.outbox):
+    subject =           models.CharField(max_length=255)
+    body =              models.TextField(blank=True)
+    to =                models.TextField()
+    state =             models.PositiveSmallIntegerField(choices=OUTGOING_EMAIL_STATES, default=0)
+    attempts =          models.PositiveSmallIntegerField(default=0)
+    last_error =        models.TextField(blank=True, default='')
+
+    date_created =      models.DateTimeField(verbose_name='date created', auto_now_add=True)
+    next_attempt =      models.DateTimeField(verbose_name='next attempt', default=timezone.now)
+    date_sent =         models.DateTimeField(verbose_name='date sent', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # for claiming the pending emails which are due:
+            models.Index(fields=['next_attempt'], name='outgoingemail_pending_idx', condition=models.Q(state=0)),
+        ]
+
+    @property
+    def recipients(self):
+        return self.to.split(',')
+
+    def __str__(self):
+        return '{0} to {1} ({2})'.format(self.subject, self.to, self.get_state_display())
@@ -0,0 +1,97 @@
+import smtplib
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bookshare.settings import (EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_LEASE,
+                                EMAIL_OUTBOX_MAX_ATTEMPTS,
+                                EMAIL_OUTBOX_RETRY_DELAY)
+from mailing.models import OutgoingEmail
+
+PENDING, SENT, FAILED = 0, 1, 2
+
+
+def enqueue_email(subject, body, to):
+    """ queues an email (to a list of addresses) for the email sender, instead of sending it in the request """
+    return OutgoingEmail.objects.create(subject=subject, body=body, to=','.join(to))
+
+
+def claim_emails(limit):
+    """ returns (at most limit of) the pending emails which are due; they are leased for EMAIL_OUTBOX_LEASE
+        seconds (so if this sender dies, they are sent by another one), and the ones leased by the other
+        senders are skipped. """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True).filter(state=PENDING, next_attempt__lte=now)
+            .order_by('next_attempt')[:limit]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F('attempts') + 1, next_attempt=now + timedelta(seconds=EMAIL_OUTBOX_LEASE),
+        )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def is_permanent_error(error):
+    # the rejected recipients & the 5xx responses are not retried:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def mark_sent(email):
+    # (the body is not kept, e.g. the new passwords of the reset password emails):
+    OutgoingEmail.objects.filter(pk=email.pk).update(state=SENT, body='', last_error='', date_sent=timezone.now())
+
+
+def mark_failed(email, error):
+    """ the email is retried after EMAIL_OUTBOX_RETRY_DELAY * 2 ^ (attempts - 1) seconds, unless the error
+        is permanent or it has been tried EMAIL_OUTBOX_MAX_ATTEMPTS times """
+    if is_permanent_error(error) or email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+        OutgoingEmail.objects.filter(pk=email.pk).update(state=FAILED, body='', last_error=repr(error))
+    else:
+        next_attempt = timezone.now() + timedelta(seconds=EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+        OutgoingEmail.objects.filter(pk=email.pk).update(next_attempt=next_attempt, last_error=repr(error))
+
+
+def send_emails(emails):
+    """ sends the emails over one SMTP connection (reopened after an error); returns the number of sent emails """
+    num_sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for email in emails:
+            try:
+                connection.open()
+                connection.send_messages([EmailMessage(email.subject, email.body, to=email.recipients, connection=connection)])
+            except Exception as e:
+                mark_failed(email, e)
+                connection.close()
+            else:
+                mark_sent(email)
+                num_sent += 1
+    finally:
+        connection.close()
+    return num_sent
+
+
+def send_pending_emails():
+    """ sends the pending emails which are due, in batches of EMAIL_OUTBOX_BATCH_SIZE; returns the number of sent emails """
+    num_sent = 0
+    while True:
+        emails = claim_emails(EMAIL_OUTBOX_BATCH_SIZE)
+        if not emails:
+            return num_sent
+        num_sent += send_emails(emails)
+
+
+def run_sender(poll_interval=1.0):
+    """ sends the queued emails forever """
+    while True:
+        send_pending_emails()
+        time.sleep(poll_interval)
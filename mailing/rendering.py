@@ -0,0 +1,136 @@
+from uuid import uuid4
+
+from django.template import Variable
+from django.template.loader import select_template
+from django.urls import NoReverseMatch
+
+from bookshare.settings import DEBUG, MSG_LANGUAGE
+
+# the transactional emails: their subjects, templates & per-user fields (the variables of their templates,
+# which may also be given to the url tags). a template may have a version for each language,
+# in "<language>/<template>" (e.g. "persian/reset_password_email.html"):
+EMAILS = {
+    'activate_email': {
+        'subject': 'Activate Your BookShare Account',
+        'template': 'activate_email_email.html',
+        'fields': ['user.first_name', 'user.last_name', 'domain', 'uid', 'token'],
+    },
+    'reset_password': {
+        'subject': 'Retrieve your account',
+        'template': 'reset_password_email.html',
+        'fields': ['user.first_name', 'user.last_name', 'new_password'],
+    },
+}
+
+# the pre-rendered emails, by (email, language):
+COMPILED_EMAILS = {}
+
+# the values a template may render differently (the html special characters are autoescaped, and the empty
+# values may change the {% if %} branches & the |default filters), given to each field in compile_email:
+PROBE_VALUES = ['', '<a href="?a=1&b=2">\'x\'</a>']
+
+
+class CompiledEmail:
+    """ an email template rendered once (with placeholders for its fields), split into the static segments
+        between the fields; so an email is rendered by joining the segments & the fields of its user """
+
+    def __init__(self, subject, segments, fields):
+        self.subject = subject
+        # (segments[i] is followed by the value of fields[i], and the last segment by nothing):
+        self.segments = segments
+        self.variables = [Variable(field) for field in fields]
+
+    def render(self, context):
+        values = [str(variable.resolve(context)) for variable in self.variables]
+        parts = []
+        for segment, value in zip(self.segments, values):
+            parts += [segment, value]
+        parts.append(self.segments[-1])
+        return ''.join(parts)
+
+
+def make_context(field_values):
+    """ returns the context of the values of the fields (e.g. {'user.first_name': ...} -> {'user': {'first_name': ...}}) """
+    context = {}
+    for field, value in field_values.items():
+        *path, name = field.split('.')
+        values = context
+        for part in path:
+            values = values.setdefault(part, {})
+        values[name] = value
+    return context
+
+
+def get_placeholders(fields):
+    """ returns {field: placeholder} & the context which renders the fields as their placeholders;
+        (the placeholders are random, and also match the patterns of the url arguments, e.g. "<key>-0f") """
+    key = uuid4().hex[:12]
+    placeholders = {field: '{0}-{1}f'.format(key, i) for i, field in enumerate(fields)}
+    return placeholders, make_context(placeholders)
+
+
+def split_rendered(rendered, placeholders):
+    """ returns the segments between the placeholders of a rendered template, and the fields they are followed by """
+    positions = []
+    for field, placeholder in placeholders.items():
+        start = rendered.find(placeholder)
+        while start != -1:
+            positions.append((start, field))
+            start = rendered.find(placeholder, start + len(placeholder))
+    positions.sort()
+
+    segments, fields = [], []
+    end = 0
+    for start, field in positions:
+        segments.append(rendered[end:start])
+        fields.append(field)
+        end = start + len(placeholders[field])
+    segments.append(rendered[end:])
+    return segments, fields
+
+
+def get_email_template(name, language):
+    template_name = EMAILS[name]['template']
+    return select_template([language.lower() + '/' + template_name, template_name])
+
+
+def compile_email(name, language):
+    """ pre-renders an email (see CompiledEmail); returns None if its template does not render its fields
+        as they are (e.g. autoescaped, with filters, or in {% if %} tags), so it has to be rendered completely """
+    email = EMAILS[name]
+    template = get_email_template(name, language)
+
+    placeholders, context = get_placeholders(email['fields'])
+    segments, fields = split_rendered(template.render(context), placeholders)
+    compiled_email = CompiledEmail(email['subject'], segments, fields)
+
+    # checking the segments with other placeholders, and with each of PROBE_VALUES in each field:
+    other_placeholders = get_placeholders(email['fields'])[0]
+    probes = [other_placeholders] + [
+        dict(other_placeholders, **{field: value}) for field in email['fields'] for value in PROBE_VALUES
+    ]
+    for probe in probes:
+        probe_context = make_context(probe)
+        try:
+            rendered = template.render(probe_context)
+        except NoReverseMatch:
+            # (the values which can not be in the urls are not checked):
+            continue
+        if compiled_email.render(probe_context) != rendered:
+            return None
+    return compiled_email
+
+
+def get_compiled_email(name, language=MSG_LANGUAGE):
+    # (with DEBUG, the templates are compiled every time, like the (not cached) template loaders):
+    if DEBUG or (name, language) not in COMPILED_EMAILS:
+        COMPILED_EMAILS[(name, language)] = compile_email(name, language)
+    return COMPILED_EMAILS[(name, language)]
+
+
+def render_email(name, language=MSG_LANGUAGE, **context):
+    """ returns the subject & the body of an email of EMAILS """
+    compiled_email = get_compiled_email(name, language)
+    if compiled_email is None:
+        return EMAILS[name]['subject'], get_email_template(name, language).render(context)
+    return compiled_email.subject, compiled_email.render(context)
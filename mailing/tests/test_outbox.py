@@ -0,0 +1,111 @@
+import smtplib
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from mailing.models import OutgoingEmail
+from mailing.outbox import (FAILED, PENDING, SENT, claim_emails, enqueue_email,
+                            send_pending_emails)
+
+
+class OutboxAPITestCase(APITestCase):
+
+    def test_register_queues_the_email(self):
+        response = APIClient().post(reverse('account_api:register'), data={
+            'first_name': 'test', 'last_name': 'user', 'username': 'test_user', 'email': 'Test_User@alaki.com',
+            'password': 'a_password_1234', 'password_confirmation': 'a_password_1234',
+        })
+        if response.status_code != status.HTTP_200_OK:
+            print(response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the email is not sent in the request:
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.state, PENDING)
+        self.assertEqual(email.recipients, ['test_user@alaki.com'])
+
+        self.assertEqual(send_pending_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test_user@alaki.com'])
+        self.assertEqual(mail.outbox[0].subject, 'Activate Your BookShare Account')
+
+        email.refresh_from_db()
+        self.assertEqual(email.state, SENT)
+        self.assertEqual(email.body, '')
+        self.assertIsNotNone(email.date_sent)
+
+
+class OutboxTestCase(APITestCase):
+
+    @mock.patch('mailing.outbox.EMAIL_OUTBOX_BATCH_SIZE', 2)
+    def test_batches_over_one_connection(self):
+        for i in range(5):
+            enqueue_email('subject ' + str(i), 'body', ['user_{0}@alaki.com'.format(i)])
+
+        with mock.patch('mailing.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_pending_emails(), 5)
+        # (one connection per batch):
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ['subject ' + str(i) for i in range(5)])
+        self.assertEqual(OutgoingEmail.objects.filter(state=SENT).count(), 5)
+
+        # nothing is sent again:
+        self.assertEqual(send_pending_emails(), 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    @mock.patch('mailing.outbox.EMAIL_OUTBOX_MAX_ATTEMPTS', 2)
+    @mock.patch('mailing.outbox.EMAIL_OUTBOX_RETRY_DELAY', 30)
+    def test_transient_error_is_retried_with_backoff(self):
+        email = enqueue_email('subject', 'body', ['user@alaki.com'])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=smtplib.SMTPServerDisconnected('connection lost')):
+            before = timezone.now()
+            self.assertEqual(send_pending_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual(email.state, PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertGreaterEqual(email.next_attempt, before + timedelta(seconds=30))
+            self.assertIn('connection lost', email.last_error)
+
+            # it is not due yet:
+            self.assertEqual(claim_emails(10), [])
+
+            # the last attempt:
+            OutgoingEmail.objects.filter(pk=email.pk).update(next_attempt=timezone.now())
+            self.assertEqual(send_pending_emails(), 0)
+            email.refresh_from_db()
+            self.assertEqual(email.state, FAILED)
+            self.assertEqual(email.attempts, 2)
+
+    def test_permanent_error_is_not_retried(self):
+        email = enqueue_email('subject', 'body', ['nobody@alaki.com'])
+        other_email = enqueue_email('other subject', 'body', ['user@alaki.com'])
+
+        def send_messages(messages):
+            if messages[0].to == ['nobody@alaki.com']:
+                raise smtplib.SMTPRecipientsRefused({'nobody@alaki.com': (550, b'no such user')})
+            mail.outbox.extend(messages)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            self.assertEqual(send_pending_emails(), 1)
+
+        email.refresh_from_db()
+        self.assertEqual(email.state, FAILED)
+        self.assertEqual(email.attempts, 1)
+        other_email.refresh_from_db()
+        self.assertEqual(other_email.state, SENT)
+        self.assertEqual([message.subject for message in mail.outbox], ['other subject'])
+
+    def test_claimed_emails_are_leased(self):
+        enqueue_email('subject', 'body', ['user@alaki.com'])
+        self.assertEqual(len(claim_emails(10)), 1)
+        # (until the lease expires, another sender does not claim it):
+        self.assertEqual(claim_emails(10), [])
@@ -0,0 +1,62 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase
+
+from mailing.benchmark import get_sample_contexts
+from mailing.rendering import EMAILS, compile_email, render_email
+
+
+class EmailRenderingTestCase(SimpleTestCase):
+
+    def test_same_as_rendering_the_templates(self):
+        for name, email in EMAILS.items():
+            compiled_email = compile_email(name, 'English')
+            self.assertIsNotNone(compiled_email)
+            for context in get_sample_contexts(3):
+                self.assertEqual(render_email(name, **context), (email['subject'], render_to_string(email['template'], context)))
+
+    def test_fields_are_not_rendered_again(self):
+        context = get_sample_contexts(1)[0]
+        context['user'].first_name = '{{ new_password }}'
+        context['new_password'] = '{0}-0f'
+        subject, body = render_email('reset_password', **context)
+        self.assertEqual(body, render_to_string('reset_password_email.html', context))
+        self.assertIn('Hi {{ new_password }} ', body)
+
+    def test_transformed_fields_are_rendered_completely(self):
+        template = engines['django'].from_string('Hi {{ user.first_name|upper }}, {{ new_password }}')
+        with mock.patch('mailing.rendering.get_email_template', return_value=template):
+            self.assertIsNone(compile_email('reset_password', 'English'))
+            with mock.patch.dict('mailing.rendering.COMPILED_EMAILS', clear=True):
+                context = get_sample_contexts(1)[0]
+                subject, body = render_email('reset_password', **context)
+        self.assertEqual(body, 'Hi FIRST0, ' + context['new_password'])
+
+    def test_changed_values_are_rendered_completely(self):
+        context = get_sample_contexts(1)[0]
+        context['user'].first_name = '<b>Tom & Jerry</b>'
+        context['user'].last_name = ''
+        for source in [
+            # (autoescaped):
+            'Hi {{ user.first_name }} {{ user.last_name }}, {{ new_password }}',
+            '{% autoescape off %}Hi {{ user.first_name }}{% if user.last_name %} {{ user.last_name }}{% endif %}, '
+            '{{ new_password }}{% endautoescape %}',
+            '{% autoescape off %}Hi {{ user.first_name }} {{ user.last_name|default:"friend" }}, '
+            '{{ new_password }}{% endautoescape %}',
+        ]:
+            template = engines['django'].from_string(source)
+            with mock.patch('mailing.rendering.get_email_template', return_value=template):
+                self.assertIsNone(compile_email('reset_password', 'English'))
+                with mock.patch.dict('mailing.rendering.COMPILED_EMAILS', clear=True):
+                    self.assertEqual(render_email('reset_password', **context)[1], template.render(context))
+
+    def test_benchmark_email_rendering_command(self):
+        out = StringIO()
+        call_command('benchmark_email_rendering', messages=5, stdout=out)
+        for name in EMAILS:
+            self.assertIn(name, out.getvalue())
+        self.assertIn('pre-rendered', out.getvalue())
@@ -1,7 +1,8 @@
 from django.conf.urls import url
 from django.urls import include, path
 
-from .views import (api_search_book_view, api_search_user_view, )
+from .views import (api_search_book_view, api_search_user_view, 
+                    api_search_cache_stats_view, api_suggest_view, )
 
 
 app_name = 'sharing'
@@ -9,6 +10,8 @@ app_name = 'sharing'
 urlpatterns = [
     path('search/book', api_search_book_view, name='search_book'),
     path('search/user', api_search_user_view, name='search_user'),
+    path('suggest', api_suggest_view, name='suggest'),
+    path('cache_stats', api_search_cache_stats_view, name='search_cache_stats'),
     
 ]
 
@@ -1,25 +1,39 @@
-from math import log2
-
 from django.contrib.auth import authenticate
-from django.contrib.postgres.search import (SearchQuery, SearchRank,
-                                            SearchVector)
-from django.db.models import CharField, F, Value
-from django.db.models.functions import Concat
 from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import (api_view, authentication_classes,
                                        permission_classes)
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from account.models import User
 from book.models import Author, Book
-from bookshare.settings import DEFAULT_BOOK_IMAGE, MEDIA_ROOT, MSG_LANGUAGE
+from bookshare.settings import (DEFAULT_BOOK_IMAGE, MEDIA_ROOT, MSG_LANGUAGE,
+                                SEARCH_SUGGEST_LIMIT, SEARCH_USER_MODE)
+from search.cache import (get_cached_result, get_stats, make_key,
+                          set_cached_result)
+from search.engine import USER_SEARCH_MODES, match_books, search_books
+from search.filters import (InvalidFilterError, get_book_facets,
+                            parse_book_filters)
+from search.pagination import InvalidPageError, paginate, parse_limit
+from search.suggest import suggestion_index
 
 from .serializers import BookResultSerializer, UserResultSerializer
 
+# messages:
+MSG_INVALID_PAGE =              {'Persian': 'صفحه درخواستی نامعتبر است', 'English': 'invalid limit or cursor!'}[MSG_LANGUAGE]
+MSG_INVALID_MODE =              {'Persian': 'روش جستجو نامعتبر است', 'English': 'invalid search mode!'}[MSG_LANGUAGE]
+MSG_INVALID_FILTERS =           {'Persian': 'فیلترهای جستجو نامعتبر هستند', 'English': 'invalid search filters!'}[MSG_LANGUAGE]
+
+
+def get_books_in_order(books):
+    """ returns the given (ranked) books with their owners & authors, fetched in 2 queries, in the same order """
+    pks = [book.pk for book in books]
+    books_by_pk = Book.objects.defer('search_vector').select_related('owner').prefetch_related('author_set').in_bulk(pks)
+    return [books_by_pk[pk] for pk in pks if pk in books_by_pk]
+
 
 @api_view(['PUT', ])
 @permission_classes([])
@@ -34,63 +48,41 @@ def api_search_book_view(request):
             response_data["message"] = "Erro - No Query!"
             return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            limit = parse_limit(request.data.get("limit", None))
+        except InvalidPageError:
+            response_data["message"] = MSG_INVALID_PAGE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.data.get("cursor", None)
+
+        # category, min_rating, min/max_pub_year, min/max_page_num & available:
+        try:
+            filters = parse_book_filters(request.data)
+        except InvalidFilterError:
+            response_data["message"] = MSG_INVALID_FILTERS
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = make_key('book', query, limit=limit, cursor=cursor, filters=filters)
+        cached_response_data = get_cached_result(cache_key)
+        if cached_response_data is not None:
+            return Response(data=cached_response_data, status=status.HTTP_200_OK)
+
+        # ranking all 4 fields of the filtered books in a single query, only for the requested page:
+        try:
+            page, next_cursor = paginate(search_books(query, filters), limit, cursor)
+        except InvalidPageError:
+            response_data["message"] = MSG_INVALID_PAGE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        # serializing the authors & owner names of the whole page without a query per book:
+        serializer = BookResultSerializer(get_books_in_order(page), many=True)
 
-        # searching query in book "title":
-        title_res = Book.objects.annotate(
-            rank=SearchRank(SearchVector('title'), SearchQuery(query)),
-        ).filter(rank__gt=0.0)
-        title_res = sorted(title_res, key=lambda b: b.rank * (1 + log2(1 + b.rating)), reverse=True)
-        title_scores = {b.pk: b.rank * (1 + log2(1 + b.rating)) for b in title_res}
-        if title_res != []:
-            max_title_score = title_scores[title_res[0].pk]
-            title_scores = {b: title_scores[b] / max_title_score for b in title_scores}
-
-        # searching query in book "description":
-        description_res = Book.objects.annotate(
-            rank=SearchRank(SearchVector('description'), SearchQuery(query)),
-        ).filter(rank__gt=0.0)
-        description_res = sorted(description_res, key=lambda b: b.rank * (1 + log2(1 + b.rating)), reverse=True)
-        description_scores = {b.pk: b.rank * (1 + log2(1 + b.rating)) for b in description_res}
-        if description_res != []:
-            max_description_score = description_scores[description_res[0].pk]
-            description_scores = {b: description_scores[b] / max_description_score for b in description_scores}
-
-        # searching query in book "author":
-        author_res = Book.objects.annotate(
-            rank=SearchRank(SearchVector('authors_str'), SearchQuery(query)),
-        ).filter(rank__gt=0.0)
-        author_res = sorted(author_res, key=lambda b: b.rank * (1 + log2(1 + b.rating)), reverse=True)
-        author_scores = {b.pk: b.rank * (1 + log2(1 + b.rating)) for b in author_res}
-        if author_res != []:
-            max_author_score = author_scores[author_res[0].pk]
-            author_scores = {b: author_scores[b] / max_author_score for b in author_scores}
-
-        # searching query in book "publisher":
-        publisher_res = Book.objects.annotate(
-            rank=SearchRank(SearchVector('publisher'), SearchQuery(query)),
-        ).filter(rank__gt=0.0)
-        publisher_res = sorted(publisher_res, key=lambda b: b.rank * (1 + log2(1 + b.rating)), reverse=True)
-        publisher_scores = {b.pk: b.rank * (1 + log2(1 + b.rating)) for b in publisher_res}
-        if publisher_res != []:
-            max_publisher_score = publisher_scores[publisher_res[0].pk]
-            publisher_scores = {b:publisher_scores[b] / max_publisher_score for b in publisher_scores}
-
-
-        # combining:
-        weights = {"title": 0.5, "description": 0.25, "author": 0.15, "publisher": 0.1}
-
-        final_scores = {x: 0.0 for x in set(title_scores.keys()).union(set(description_scores.keys()), set(author_scores.keys()), set(publisher_scores.keys()))}
-        for book_pk in final_scores:
-            final_score =   weights["title"] * title_scores.get(book_pk, 0.0) + \
-                            weights["description"] * description_scores.get(book_pk, 0.0) + \
-                            weights["author"] * author_scores.get(book_pk, 0.0) + \
-                            weights["publisher"] * publisher_scores.get(book_pk, 0.0)
-            final_scores[book_pk] = final_score
-        
-        final_scores = [Book.objects.get(pk=b_pk) for b_pk in sorted(list(final_scores.keys()), key=lambda bpk: final_scores[bpk], reverse=True)]
-        serializer = BookResultSerializer(final_scores, many=True)
-
-        return Response(data={"result": serializer.data}, status=status.HTTP_200_OK)
+        response_data = {"result": serializer.data, "next_cursor": next_cursor}
+        # the facets are the same for all the pages, so they are only counted for the first one:
+        if cursor is None:
+            response_data["facets"] = get_book_facets(match_books(query, filters))
+        set_cached_result(cache_key, response_data)
+        return Response(data=response_data, status=status.HTTP_200_OK)
 
 
 @api_view(['PUT', ])
@@ -106,27 +98,67 @@ def api_search_user_view(request):
             response_data["message"] = "Erro - No Query!"
             return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
 
+        # "fulltext" or "trigram" (typo tolerant & prefix matching):
+        mode = request.data.get("mode", SEARCH_USER_MODE)
+        if mode not in USER_SEARCH_MODES:
+            response_data["message"] = MSG_INVALID_MODE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = parse_limit(request.data.get("limit", None))
+        except InvalidPageError:
+            response_data["message"] = MSG_INVALID_PAGE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.data.get("cursor", None)
+
+        cache_key = make_key('user', query, limit=limit, cursor=cursor, mode=mode)
+        cached_response_data = get_cached_result(cache_key)
+        if cached_response_data is not None:
+            return Response(data=cached_response_data, status=status.HTTP_200_OK)
+
+        # searching query in user "firstname + lastname + username", only for the requested page:
+        try:
+            page, next_cursor = paginate(USER_SEARCH_MODES[mode](query), limit, cursor)
+        except InvalidPageError:
+            response_data["message"] = MSG_INVALID_PAGE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserResultSerializer(page, many=True)
+
+        response_data = {"result": serializer.data, "next_cursor": next_cursor}
+        set_cached_result(cache_key, response_data)
+        return Response(data=response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', ])
+@permission_classes([])
+@authentication_classes([])
+def api_suggest_view(request):
+    """ this api returns the titles, authors & publishers starting with the query (for autocomplete);
+        it is answered from an in-memory index, without any query to the database. """
+
+    if request.method == 'GET':
+        response_data = {}
 
-        # searching query in user "firstname + lastname + username":
-        res = User.objects.annotate(
-            combined_name=Concat(
-                F('first_name'), Value(' '), F('last_name'), Value(' '), F('username'), 
-                output_field=CharField()
-            )
-        ).annotate(
-            rank=SearchRank(SearchVector('combined_name'), SearchQuery(query)),
-        ).filter(rank__gt=0.0)
+        query = request.query_params.get("query", None)
+        if query is None:
+            response_data["message"] = "Erro - No Query!"
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
 
-        res = sorted(res, key=lambda u: u.rank * (1 + log2(1 + u.rating)), reverse=True)
-        scores = {u.pk: u.rank * (1 + log2(1 + u.rating)) for u in res}
-        if res != []:
-            max_score = scores[res[0].pk]
-            scores = {u: scores[u] / max_score for u in scores}
+        try:
+            limit = min(int(request.query_params.get("limit", SEARCH_SUGGEST_LIMIT)), SEARCH_SUGGEST_LIMIT)
+        except ValueError:
+            response_data["message"] = MSG_INVALID_PAGE
+            return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(data={"result": suggestion_index.suggest(query, limit)}, status=status.HTTP_200_OK)
 
 
-        scores = {x: 0.0 for x in scores}
-        
-        scores = [User.objects.get(pk=u_pk) for u_pk in sorted(list(scores.keys()), key=lambda upk: scores[upk], reverse=True)]
-        serializer = UserResultSerializer(scores, many=True)
+@api_view(['GET', ])
+@permission_classes([IsAdminUser])
+@authentication_classes([TokenAuthentication])
+def api_search_cache_stats_view(request):
+    """ this api returns the hits & misses of the search results cache (for monitoring). """
 
-        return Response(data={"result": serializer.data}, status=status.HTTP_200_OK)
+    if request.method == 'GET':
+        return Response(data=get_stats(), status=status.HTTP_200_OK)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class SearchConfig(AppConfig):
     name = 'search'
+
+    def ready(self):
+        import search.signals
+        from search.cache import check_search_cache
+        check_search_cache()
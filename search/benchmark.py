@@ -0,0 +1,163 @@
+import math
+import random
+import time
+from uuid import uuid4
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from account.models import User
+from book.models import SEARCH_VECTOR_WEIGHTS, Author, Book, create_search_vector
+from search.normalization import NormalizedText
+from sharing.models import BOOK_EXCHANGE_STATES, BookExchange
+
+ENGLISH_WORDS = [
+    'history', 'dark', 'forest', 'river', 'king', 'queen', 'war', 'peace', 'love', 'night', 'city', 'garden',
+    'secret', 'journey', 'island', 'mountain', 'shadow', 'light', 'dragon', 'ocean', 'empire', 'winter',
+    'summer', 'stone', 'fire', 'silver', 'golden', 'lost', 'hidden', 'ancient', 'modern', 'science',
+    'philosophy', 'poetry', 'children', 'story', 'world', 'life', 'death', 'dream', 'house', 'road',
+    'music', 'painter', 'doctor', 'soldier', 'mystery', 'kingdom', 'letters', 'friends',
+]
+PERSIAN_WORDS = [
+    'کتاب', 'تاریخ', 'ایران', 'داستان', 'شعر', 'عشق', 'زندگی', 'جنگ', 'صلح', 'دریا', 'شب', 'روز', 'خانه',
+    'سفر', 'رمان', 'فلسفه', 'علم', 'هنر', 'کودک', 'باغ', 'آسمان', 'ستاره', 'راز', 'سرزمین', 'پادشاه',
+    'شاهنامه', 'دیوان', 'حافظ', 'سعدی', 'مولانا',
+]
+ENGLISH_FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth', 'David', 'Barbara']
+ENGLISH_LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Anderson', 'Taylor', 'Thomas']
+PERSIAN_FIRST_NAMES = ['علی', 'مریم', 'محمد', 'زهرا', 'حسین', 'فاطمه', 'رضا', 'سارا', 'امیر', 'نرگس']
+PERSIAN_LAST_NAMES = ['احمدی', 'محمدی', 'حسینی', 'رضایی', 'کریمی', 'موسوی', 'جعفری', 'کاظمی', 'رحیمی', 'هاشمی']
+PUBLISHERS = ['Penguin', 'Bloomsbury', 'HarperCollins', 'Vintage', 'نشر چشمه', 'نشر نی', 'امیرکبیر', 'ققنوس']
+
+# the share of the persian books & users:
+PERSIAN_RATIO = 0.3
+
+# (name, api, request data) of the queries run in each round:
+QUERY_MIX = [
+    ('book: common word', 'search_api:search_book', {'query': 'history'}),
+    ('book: two words', 'search_api:search_book', {'query': 'dark forest'}),
+    ('book: persian (arabic yeh)', 'search_api:search_book', {'query': 'تاريخ ايران'}),
+    ('book: author', 'search_api:search_book', {'query': 'smith'}),
+    ('book: filtered', 'search_api:search_book', {'query': 'history', 'category': 3, 'min_rating': 2, 'available': True}),
+    ('book: large page', 'search_api:search_book', {'query': 'love', 'limit': 100}),
+    ('book: no match', 'search_api:search_book', {'query': 'xylophonist'}),
+    ('user: typo', 'search_api:search_user', {'query': 'jonson'}),
+    ('user: prefix', 'search_api:search_user', {'query': 'will'}),
+    ('user: persian', 'search_api:search_user', {'query': 'محمدي'}),
+    ('user: fulltext', 'search_api:search_user', {'query': 'smith', 'mode': 'fulltext'}),
+]
+
+
+def random_text(words, num_words):
+    return ' '.join(random.choice(words) for i in range(num_words))
+
+
+def generate_catalogue(num_users, num_books):
+    """ creates num_users users & num_books books (with 1-2 authors each, and some exchanges)
+        of random english & persian text, in bulk """
+
+    users = []
+    for i in range(num_users):
+        if random.random() < PERSIAN_RATIO:
+            first_name, last_name = random.choice(PERSIAN_FIRST_NAMES), random.choice(PERSIAN_LAST_NAMES)
+            username = 'benchmark.user.{0}'.format(i)
+        else:
+            first_name, last_name = random.choice(ENGLISH_FIRST_NAMES), random.choice(ENGLISH_LAST_NAMES)
+            username = '{0}.{1}.{2}'.format(first_name, last_name, i).lower()
+        users.append(User(
+            username=username[:30], first_name=first_name, last_name=last_name,
+            email='benchmark{0}-{1}@bookshare.test'.format(i, uuid4().hex[:8]),
+            rating=round(random.uniform(0, 10), 1), password='!',
+        ))
+    users = User.objects.bulk_create(users)
+
+    books = []
+    books_authors = []
+    for i in range(num_books):
+        is_persian = random.random() < PERSIAN_RATIO
+        words = PERSIAN_WORDS if is_persian else ENGLISH_WORDS
+        first_names = PERSIAN_FIRST_NAMES if is_persian else ENGLISH_FIRST_NAMES
+        last_names = PERSIAN_LAST_NAMES if is_persian else ENGLISH_LAST_NAMES
+
+        authors = [
+            random.choice(first_names) + ' ' + random.choice(last_names) for j in range(random.randint(1, 2))
+        ]
+        books_authors.append(authors)
+        books.append(Book(
+            title=random_text(words, random.randint(2, 5)),
+            description=random_text(words, random.randint(15, 40)),
+            page_num=random.randint(50, 1500),
+            edition=random.randint(1, 10),
+            publisher=random.choice(PUBLISHERS),
+            pub_year=random.randint(1900, 2020),
+            owner=random.choice(users),
+            slug=uuid4().hex[:30],
+            rating=round(random.uniform(0, 5), 1),
+            category_1=str(random.choice(Book.Category_Choice)[0]),
+            category_2=str(random.choice(Book.Category_Choice)[0]) if random.random() < 0.3 else '',
+            authors_str=' '.join(authors),
+        ))
+    books = Book.objects.bulk_create(books)
+    # bulk creation does not call save(), so the search vectors are computed by the database:
+    Book.objects.filter(pk__in=[book.pk for book in books]).update(
+        search_vector=create_search_vector({field: NormalizedText(field) for field in SEARCH_VECTOR_WEIGHTS}),
+    )
+
+    Author.objects.bulk_create([
+        Author(book=book, name=name) for book, authors in zip(books, books_authors) for name in authors
+    ])
+
+    # a tenth of the books are in an exchange:
+    BookExchange.objects.bulk_create([
+        BookExchange(
+            slug=uuid4().hex[:30], book=book, borrower=random.choice(users), lender=book.owner,
+            state=random.choice(BOOK_EXCHANGE_STATES)[0],
+        )
+        for book in random.sample(books, num_books // 10)
+    ])
+
+    return users, books
+
+
+def get_rows_scanned():
+    """ returns the number of rows read (by sequential & index scans) in the current transaction """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0) FROM pg_stat_xact_user_tables'
+        )
+        return int(cursor.fetchone()[0])
+
+
+def percentile(values, percent):
+    """ returns the nearest-rank percentile of the values """
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run_query_mix(rounds, before_each_request=None):
+    """ runs the query mix rounds times through the api (with the DRF test client);
+        returns {name: {"latencies" (ms), "queries", "rows_scanned"}} """
+
+    client = APIClient()
+    results = {name: {"latencies": [], "queries": [], "rows_scanned": []} for name, api, data in QUERY_MIX}
+
+    for round_num in range(rounds):
+        for name, api, data in QUERY_MIX:
+            if before_each_request is not None:
+                before_each_request()
+
+            rows_scanned = get_rows_scanned()
+            with CaptureQueriesContext(connection) as queries:
+                start_time = time.perf_counter()
+                response = client.put(reverse(api), data=data, format='json')
+                latency = (time.perf_counter() - start_time) * 1000
+            if response.status_code != 200:
+                raise RuntimeError('{0}: {1} {2}'.format(name, response.status_code, response.data))
+
+            results[name]["latencies"].append(latency)
+            results[name]["queries"].append(len(queries))
+            results[name]["rows_scanned"].append(get_rows_scanned() - rows_scanned)
+
+    return results
@@ -0,0 +1,85 @@
+import json
+import time
+from hashlib import sha1
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from bookshare.settings import WEB_CONCURRENCY
+from search.normalization import normalize_text
+
+SEARCH_CACHE_ALIAS = 'search'
+
+GENERATION_KEY = 'search:generation'
+HITS_KEY = 'search:hits'
+MISSES_KEY = 'search:misses'
+
+
+def get_search_cache():
+    return caches[SEARCH_CACHE_ALIAS]
+
+
+def check_search_cache():
+    """ raises ImproperlyConfigured if the search cache is local to each of many web processes (checked at startup),
+        since the changes in one process would not invalidate the results cached by the others """
+    if WEB_CONCURRENCY > 1 and isinstance(get_search_cache(), LocMemCache):
+        raise ImproperlyConfigured(
+            'The search cache is local to each process, but WEB_CONCURRENCY is {0}; '
+            'a shared cache backend should be configured.'.format(WEB_CONCURRENCY)
+        )
+
+
+def get_generation():
+    cache = get_search_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # starting from the current time (not 0), so if the counter is ever evicted,
+        # the keys of the old generations are not reused:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """ invalidates all the cached search results """
+    cache = get_search_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+
+def make_key(kind, query, **params):
+    # the queries are normalized before matching, so are the cache keys:
+    params['query'] = normalize_text(query)
+    params_hash = sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return 'search:{0}:{1}:{2}'.format(get_generation(), kind, params_hash)
+
+
+def increment_counter(counter_key):
+    cache = get_search_cache()
+    try:
+        cache.incr(counter_key)
+    except ValueError:
+        cache.add(counter_key, 0, timeout=None)
+        cache.incr(counter_key)
+
+
+def get_cached_result(key):
+    result = get_search_cache().get(key)
+    increment_counter(MISSES_KEY if result is None else HITS_KEY)
+    return result
+
+
+def set_cached_result(key, result):
+    get_search_cache().set(key, result)
+
+
+def get_stats():
+    cache = get_search_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'generation': get_generation(),
+    }
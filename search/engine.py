@@ -0,0 +1,138 @@
+from math import log
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
+from django.db.models import (Case, CharField, F, FloatField, Func, Max, Q,
+                              Value, When, Window)
+from django.db.models.functions import Coalesce, Concat, Greatest, Ln, NullIf
+
+from account.models import User
+from book.models import SEARCH_VECTOR_WEIGHTS, Book
+from search import lookups  # registers the "trigram_prefix" lookup
+from search.filters import apply_book_filters
+from search.normalization import NormalizedText, normalize_text
+
+
+# weights of each book field in the final score:
+BOOK_FIELD_WEIGHTS = {
+    'title': 0.5,
+    'description': 0.25,
+    'authors_str': 0.15,
+    'publisher': 0.1,
+}
+
+
+class FilterSearchVector(Func):
+    """ keeps only the lexemes of a search vector with the given weight (i.e. of one book field) """
+    function = 'ts_filter'
+    template = "%(function)s(%(expressions)s, '{%(weight)s}')"
+    output_field = SearchVectorField()
+
+
+class TrigramWordSimilarity(Func):
+    """ the greatest similarity of a string to any part of a field """
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+def rating_boost(rating_field='rating'):
+    """ returns the expression 1 + log2(1 + rating) """
+    return Value(1.0) + Ln(Value(1.0) + F(rating_field)) / Value(log(2))
+
+
+def match_books(query, filters=None):
+    """ returns a queryset of all books matching the query (and the filters, if given), not ranked """
+
+    queryset = Book.objects.defer('search_vector').filter(search_vector=SearchQuery(normalize_text(query)))
+    if filters:
+        queryset = apply_book_filters(queryset, filters)
+    return queryset
+
+
+def search_books(query, filters=None):
+    """ returns a queryset of all books matching the query (and the filters, if given),
+        ordered by their final score (annotated as "score").
+
+        the books are matched against their stored (GIN indexed) search vector, so no text is parsed per row;
+        the filters are applied in the same query, so only the filtered books are ranked.
+        the score of each field is its rank boosted by the book rating, normalized by the
+        maximum score of that field among the matched books (using a window function);
+        the final score is the weighted sum of the field scores, all in one sql query. """
+
+    search_query = SearchQuery(normalize_text(query))
+    boost = rating_boost()
+
+    # each field is ranked on its own part of the stored search vector:
+    ranks = {
+        field + '_rank': SearchRank(
+            FilterSearchVector('search_vector', weight=SEARCH_VECTOR_WEIGHTS[field].lower()), search_query,
+        )
+        for field in BOOK_FIELD_WEIGHTS
+    }
+
+    # combining:
+    final_score = Value(0.0)
+    for field, weight in BOOK_FIELD_WEIGHTS.items():
+        field_score = F(field + '_rank') * boost
+        max_field_score = Window(expression=Max(field_score), output_field=FloatField())
+        normalized_field_score = Coalesce(field_score / NullIf(max_field_score, Value(0.0)), Value(0.0))
+        final_score = final_score + Value(weight) * normalized_field_score
+
+    return match_books(query, filters).annotate(**ranks).annotate(
+        score=final_score,
+    ).order_by('-score', 'pk')
+
+
+def search_users(query):
+    """ returns a queryset of all users matching the query in "firstname + lastname + username",
+        ordered by their rank boosted by the user rating (annotated as "score"). """
+
+    return User.objects.annotate(
+        combined_name=Concat(
+            F('first_name'), Value(' '), F('last_name'), Value(' '), F('username'), 
+            output_field=CharField()
+        )
+    ).annotate(
+        rank=SearchRank(SearchVector(NormalizedText('combined_name')), SearchQuery(normalize_text(query))),
+    ).filter(rank__gt=0.0).annotate(
+        score=F('rank') * rating_boost(),
+    ).order_by('-score', 'pk')
+
+
+# the user fields with a trigram index:
+USER_TRIGRAM_FIELDS = ['first_name', 'last_name', 'username']
+
+
+def search_users_by_trigram(query):
+    """ returns a queryset of all users with a first name, last name or username similar to the query
+        (typo tolerant) or starting with it (autocomplete), ordered by their score (annotated as "score").
+
+        the score is the best word similarity among the fields (plus 1 for a prefix match),
+        boosted by the user rating; both the query and the fields are normalized, and both the similarity (%)
+        and the prefix (ILIKE) matching are done with the trigram indexes (of the normalized fields). """
+
+    query = normalize_text(query)
+    normalized_fields = {'normalized_' + field: NormalizedText(field) for field in USER_TRIGRAM_FIELDS}
+    is_matched = Q()
+    is_prefix = Q()
+    for field in normalized_fields:
+        is_matched |= Q(**{field + '__trigram_similar': query})
+        is_prefix |= Q(**{field + '__trigram_prefix': query})
+
+    similarity = Greatest(*[TrigramWordSimilarity(query, field) for field in normalized_fields])
+    prefix_bonus = Case(When(is_prefix, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+
+    return User.objects.annotate(**normalized_fields).filter(is_matched | is_prefix).annotate(
+        score=(similarity + prefix_bonus) * rating_boost(),
+    ).order_by('-score', 'pk')
+
+
+USER_SEARCH_MODES = {
+    'fulltext': search_users,
+    'trigram': search_users_by_trigram,
+}
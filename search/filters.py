@@ -0,0 +1,106 @@
+from django.db.models import Case, Count, Exists, OuterRef, Q, When
+
+from book.models import Book
+from sharing.models import ACTIVE_BOOK_EXCHANGE_STATES, BookExchange
+
+# the categories are stored as strings of their numbers:
+BOOK_CATEGORIES = [str(category) for category, name in Book.Category_Choice]
+
+# the range filters => the (field, lookup) they are applied on:
+BOOK_RANGE_FILTERS = {
+    'min_pub_year': ('pub_year', 'gte'),
+    'max_pub_year': ('pub_year', 'lte'),
+    'min_page_num': ('page_num', 'gte'),
+    'max_page_num': ('page_num', 'lte'),
+}
+
+# the rating facet counts the books with at least each of these ratings:
+RATING_FACET_THRESHOLDS = [1, 2, 3, 4]
+
+
+class InvalidFilterError(ValueError):
+    pass
+
+
+def parse_book_filters(data):
+    """ returns the {filter: value} dictionary of the given filters (of the request data);
+        raises InvalidFilterError if any of them is invalid. """
+
+    filters = {}
+    try:
+        category = data.get('category', None)
+        if category not in (None, ''):
+            category = str(int(category))
+            if category not in BOOK_CATEGORIES:
+                raise InvalidFilterError(category)
+            filters['category'] = category
+
+        min_rating = data.get('min_rating', None)
+        if min_rating not in (None, ''):
+            filters['min_rating'] = float(min_rating)
+
+        for name in BOOK_RANGE_FILTERS:
+            value = data.get(name, None)
+            if value not in (None, ''):
+                filters[name] = int(value)
+
+        available = data.get('available', None)
+        if available not in (None, ''):
+            if str(available).lower() not in ('true', 'false', '1', '0'):
+                raise InvalidFilterError(available)
+            filters['available'] = str(available).lower() in ('true', '1')
+    except (TypeError, ValueError):
+        raise InvalidFilterError(data)
+
+    return filters
+
+
+def is_available():
+    """ the expression of a book not being in an active exchange (using its partial index) """
+    return ~Exists(BookExchange.objects.filter(book=OuterRef('pk'), state__in=ACTIVE_BOOK_EXCHANGE_STATES))
+
+
+def apply_book_filters(queryset, filters):
+    """ returns the queryset of books narrowed by the given (parsed) filters """
+
+    if 'category' in filters:
+        category = filters['category']
+        queryset = queryset.filter(Q(category_1=category) | Q(category_2=category) | Q(category_3=category))
+
+    if 'min_rating' in filters:
+        queryset = queryset.filter(rating__gte=filters['min_rating'])
+
+    for name, (field, lookup) in BOOK_RANGE_FILTERS.items():
+        if name in filters:
+            queryset = queryset.filter(**{field + '__' + lookup: filters[name]})
+
+    if 'available' in filters:
+        queryset = queryset.filter(is_available() if filters['available'] else ~is_available())
+
+    return queryset
+
+
+def get_book_facets(queryset):
+    """ returns the number of books of the queryset in each category, with at least each rating,
+        and available, all counted in a single aggregate query. """
+
+    counts = {'total': Count('pk'), 'available': Count(Case(When(is_available(), then='pk')))}
+    for category in BOOK_CATEGORIES:
+        counts['in_category_' + category] = Count(
+            'pk', filter=Q(category_1=category) | Q(category_2=category) | Q(category_3=category),
+        )
+    for rating in RATING_FACET_THRESHOLDS:
+        counts['min_rating_' + str(rating)] = Count('pk', filter=Q(rating__gte=rating))
+
+    counts = queryset.order_by().aggregate(**counts)
+
+    return {
+        "total": counts['total'],
+        "available": counts['available'],
+        # only the categories with any books:
+        "categories": {
+            category: counts['in_category_' + category]
+            for category in BOOK_CATEGORIES if counts['in_category_' + category]
+        },
+        "rating": {str(rating): counts['min_rating_' + str(rating)] for rating in RATING_FACET_THRESHOLDS},
+    }
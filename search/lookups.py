@@ -0,0 +1,18 @@
+from django.db.models import CharField, Lookup, TextField
+
+
+class TrigramPrefix(Lookup):
+    """ lhs ILIKE 'rhs%': case-insensitive prefix matching (also served by a gin_trgm_ops index) """
+    lookup_name = 'trigram_prefix'
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [connection.ops.prep_for_like_query(value) + '%']
+
+    def as_sql(self, qn, connection):
+        lhs, lhs_params = self.process_lhs(qn, connection)
+        rhs, rhs_params = self.process_rhs(qn, connection)
+        return '%s ILIKE %s' % (lhs, rhs), lhs_params + rhs_params
+
+
+CharField.register_lookup(TrigramPrefix)
+TextField.register_lookup(TrigramPrefix)
@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from search.benchmark import generate_catalogue, percentile, run_query_mix
+from search.cache import SEARCH_CACHE_ALIAS, bump_generation
+
+
+class Command(BaseCommand):
+    help = "generates a synthetic catalogue & reports the latency, queries & scanned rows of a fixed search query mix "\
+           "(the catalogue is rolled back at the end, unless --keep is given)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--use-cache', action='store_true', help="do not clear the search cache before each request")
+        parser.add_argument('--keep', action='store_true', help="commit the generated catalogue")
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+
+        # the requests are made by the test client, and (unless --use-cache) answered without a shared cache:
+        overridden_settings = {'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver']}
+        if not options['use_cache']:
+            overridden_settings['CACHES'] = dict(settings.CACHES, **{SEARCH_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'search-benchmark',
+            }})
+
+        with override_settings(**overridden_settings), transaction.atomic():
+            start_time = time.perf_counter()
+            generate_catalogue(options['users'], options['books'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE account_user, book_book, book_author, sharing_bookexchange')
+            bump_generation()
+            self.stdout.write("{0} users & {1} books were generated in {2:.1f}s.".format(
+                options['users'], options['books'], time.perf_counter() - start_time,
+            ))
+
+            before_each_request = None if options['use_cache'] else caches[SEARCH_CACHE_ALIAS].clear
+            # a warm up round, which is not reported:
+            run_query_mix(1, before_each_request)
+            results = run_query_mix(options['rounds'], before_each_request)
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.report(results)
+
+    def report(self, results):
+        line_format = '{0:<28} {1:>9} {2:>9} {3:>9} {4:>8} {5:>13}'
+        self.stdout.write(line_format.format('query', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'queries', 'rows scanned'))
+
+        all_latencies = []
+        for name, result in results.items():
+            latencies = result["latencies"]
+            all_latencies += latencies
+            self.stdout.write(line_format.format(
+                name,
+                '{0:.1f}'.format(percentile(latencies, 50)),
+                '{0:.1f}'.format(percentile(latencies, 95)),
+                '{0:.1f}'.format(percentile(latencies, 99)),
+                max(result["queries"]),
+                sum(result["rows_scanned"]) // len(result["rows_scanned"]),
+            ))
+
+        self.stdout.write(line_format.format(
+            'all',
+            '{0:.1f}'.format(percentile(all_latencies, 50)),
+            '{0:.1f}'.format(percentile(all_latencies, 95)),
+            '{0:.1f}'.format(percentile(all_latencies, 99)),
+            '', '',
+        ))
@@ -0,0 +1,8 @@
+from django.db import models
+
+
+class SuggestionIndexVersion(models.Model):
+    # the version of the suggested texts (the titles, author names & publishers), shared by all the processes:
+    # it is incremented (after the commits) by their deletions, which the other processes can not load incrementally,
+    # so their suggestion indexes are rebuilt (see search.suggest). there is one row, created by the first deletion:
+    version =           models.BigIntegerField(default=0)
@@ -0,0 +1,66 @@
+import re
+
+from django.db.models import Func, TextField, Value
+
+# the persian/arabic ranges are the ones accepted in usernames (see account.models.validate_persian_username)
+
+# arabic variants of letters => persian letters:
+LETTERS_MAPPING = {
+    'ي': 'ی',     # arabic yeh => persian yeh
+    'ى': 'ی',     # alef maksura => persian yeh
+    'ئ': 'ی',     # yeh with hamza above => persian yeh
+    'ك': 'ک',     # arabic kaf => persian kaf (keheh)
+    'ة': 'ه',     # teh marbuta => heh
+    'ۀ': 'ه',     # heh with yeh above => heh
+    'ە': 'ه',     # ae => heh
+    'أ': 'ا',     # alef with hamza above => alef
+    'إ': 'ا',     # alef with hamza below => alef
+    'ٱ': 'ا',     # alef wasla => alef
+    'ؤ': 'و',     # waw with hamza above => waw
+}
+
+# persian & arabic digits => latin digits:
+DIGITS_MAPPING = {}
+for digit in range(10):
+    DIGITS_MAPPING[chr(0x06F0 + digit)] = str(digit)
+    DIGITS_MAPPING[chr(0x0660 + digit)] = str(digit)
+
+# characters that are removed:
+#   diacritics (harakat, tanween, shadda, sukun, superscript alef), tatweel (kashida),
+#   and zero width characters (ZWNJ is usually left out by the users while typing)
+REMOVED_CHARACTERS = (
+    [chr(codepoint) for codepoint in range(0x064B, 0x0660)] +
+    ['\u0670', '\u0640'] +
+    ['\u200B', '\u200C', '\u200D', '\u200E', '\u200F', '\uFEFF']
+)
+
+TRANSLATION_TABLE = str.maketrans({
+    **LETTERS_MAPPING,
+    **DIGITS_MAPPING,
+    **{character: None for character in REMOVED_CHARACTERS},
+})
+
+WHITESPACES_REGEX = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """ returns the normalized (persian aware, lowercase) text, used both for indexing and for queries """
+    if not text:
+        return ''
+    return WHITESPACES_REGEX.sub(' ', str(text).translate(TRANSLATION_TABLE).lower()).strip()
+
+
+# the same characters mapping, for the sql TRANSLATE function (the characters without a counterpart are removed);
+# (the trigram indexes of the user names are on this expression, so changing the mapping needs a new migration of them):
+SQL_TRANSLATE_FROM = ''.join(list(LETTERS_MAPPING) + list(DIGITS_MAPPING) + REMOVED_CHARACTERS)
+SQL_TRANSLATE_TO = ''.join(list(LETTERS_MAPPING.values()) + list(DIGITS_MAPPING.values()))
+
+
+class NormalizedText(Func):
+    """ the sql equivalent of normalize_text (without lowercasing, which the search vectors do themselves),
+        for normalizing the texts already stored in the database """
+    function = 'TRANSLATE'
+    output_field = TextField()
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, Value(SQL_TRANSLATE_FROM), Value(SQL_TRANSLATE_TO), **extra)
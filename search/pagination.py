@@ -0,0 +1,70 @@
+import json
+
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from bookshare.settings import SEARCH_MAX_PAGE_SIZE, SEARCH_PAGE_SIZE
+
+
+class InvalidPageError(ValueError):
+    pass
+
+
+def encode_cursor(score, pk):
+    return urlsafe_base64_encode(force_bytes(json.dumps([score, pk])))
+
+
+def decode_cursor(cursor):
+    """ returns the (score, pk) of the last result of the previous page """
+    # (the cursor of a json body may be of any type:)
+    if not isinstance(cursor, str):
+        raise InvalidPageError('invalid cursor')
+    try:
+        score, pk = json.loads(force_text(urlsafe_base64_decode(cursor)))
+        return float(score), int(pk)
+    except (TypeError, ValueError):
+        raise InvalidPageError('invalid cursor')
+
+
+def parse_limit(limit, default=SEARCH_PAGE_SIZE, maximum=SEARCH_MAX_PAGE_SIZE):
+    """ returns the requested page size, capped by the maximum """
+    if limit is None or limit == '':
+        return default
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise InvalidPageError('invalid limit')
+    if limit < 1:
+        raise InvalidPageError('invalid limit')
+    return min(limit, maximum)
+
+
+def paginate(queryset, limit, cursor=None):
+    """ returns (page, next_cursor) of a queryset annotated with "score" (keyset pagination on (score, pk)).
+
+        the ranked query is wrapped in an outer query, so the database only returns the rows of the page
+        (window annotations like the book scores can not be filtered on directly). """
+
+    model = queryset.model
+    pk_column = model._meta.pk.column
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    params = list(params)
+
+    where = ''
+    if cursor:
+        last_score, last_pk = decode_cursor(cursor)
+        where = 'WHERE ranked.score < %s OR (ranked.score = %s AND ranked."{0}" > %s)'.format(pk_column)
+        params += [last_score, last_score, last_pk]
+
+    # fetching one more row to see if there is a next page:
+    page = list(model.objects.raw(
+        'SELECT * FROM ({0}) AS ranked {1} ORDER BY ranked.score DESC, ranked."{2}" ASC LIMIT %s'.format(sql, where, pk_column),
+        params + [limit + 1],
+    ))
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].score, page[-1].pk)
+    return page, next_cursor
@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from account.models import User
+from book.models import Author, Book
+from search.cache import bump_generation
+from search.suggest import AUTHOR, PUBLISHER, TITLE, suggestion_index
+from sharing.models import ACTIVE_BOOK_EXCHANGE_STATES, BookExchange
+
+
+# the fields of the searched users: their names, and the rating & counters they are shown (& ranked) with
+# (the other changes, e.g. logins, do not invalidate the search cache):
+SEARCHED_USER_FIELDS = ['username', 'first_name', 'last_name', 'rating', 'num_rates', 'num_borrowers', 'num_lenders']
+
+
+def invalidate_search_cache():
+    # (after the transaction: so no request caches the old rows under the new generation):
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=User)
+def invalidate_search_cache_on_change(sender, **kwargs):
+    invalidate_search_cache()
+
+
+def remember_searched_user_fields(instance):
+    # (the deferred fields are not loaded, so they are remembered as DEFERRED):
+    instance._searched_fields = {field: instance.__dict__.get(field, DEFERRED) for field in SEARCHED_USER_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_loaded_user(sender, instance, **kwargs):
+    remember_searched_user_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_search_cache_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    searched_fields = instance._searched_fields
+    remember_searched_user_fields(instance)
+    if update_fields is not None and not set(update_fields) & set(SEARCHED_USER_FIELDS):
+        return
+    if created or any(
+        searched_fields[field] is DEFERRED or searched_fields[field] != instance.__dict__.get(field)
+        for field in SEARCHED_USER_FIELDS
+    ):
+        invalidate_search_cache()
+
+
+# the exchanges change the availability of their books (the "available" filter & facet),
+# when they become active or stop being active:
+@receiver(post_init, sender=BookExchange)
+def remember_exchange_activity(sender, instance, **kwargs):
+    instance._was_active = instance.__dict__.get('state') in ACTIVE_BOOK_EXCHANGE_STATES
+
+
+@receiver(post_save, sender=BookExchange)
+def invalidate_search_cache_on_exchange_change(sender, instance, created, **kwargs):
+    was_active = False if created else instance._was_active
+    instance._was_active = instance.state in ACTIVE_BOOK_EXCHANGE_STATES
+    if instance._was_active != was_active:
+        invalidate_search_cache()
+
+
+@receiver(post_delete, sender=BookExchange)
+def invalidate_search_cache_on_exchange_delete(sender, instance, **kwargs):
+    if instance.state in ACTIVE_BOOK_EXCHANGE_STATES:
+        invalidate_search_cache()
+
+
+# the suggestion index of this process is updated right away; the other processes load the changes by themselves,
+# but are signaled the deletions (after the commit):
+@receiver(post_save, sender=Book)
+def update_book_suggestions(sender, instance, update_fields=None, **kwargs):
+    # (e.g. the ratings & counters are saved alone):
+    if update_fields is not None and not set(update_fields) & {'title', 'publisher'}:
+        return
+    if suggestion_index.is_built:
+        suggestion_index.add(TITLE, instance.pk, instance.title)
+        suggestion_index.add(PUBLISHER, instance.pk, instance.publisher)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_suggestions(sender, instance, **kwargs):
+    documents = [(TITLE, instance.pk), (PUBLISHER, instance.pk)]
+    transaction.on_commit(lambda: suggestion_index.remove_deleted(documents))
+
+
+@receiver(post_save, sender=Author)
+def update_author_suggestions(sender, instance, **kwargs):
+    if suggestion_index.is_built:
+        suggestion_index.add(AUTHOR, instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Author)
+def remove_author_suggestions(sender, instance, **kwargs):
+    documents = [(AUTHOR, instance.pk)]
+    transaction.on_commit(lambda: suggestion_index.remove_deleted(documents))
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from book.models import Author, Book
+from bookshare.settings import (MAX_TRANSACTION_TIME,
+                                SEARCH_SUGGEST_REFRESH_INTERVAL)
+from search.models import SuggestionIndexVersion
+from search.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# the kinds of suggestions (the book fields they come from):
+TITLE = 'title'
+AUTHOR = 'author'
+PUBLISHER = 'publisher'
+
+# the primary key of the (only) SuggestionIndexVersion row:
+VERSION_PK = 1
+
+
+def get_version():
+    return SuggestionIndexVersion.objects.filter(pk=VERSION_PK).values_list('version', flat=True).first() or 0
+
+
+def bump_version():
+    """ signals the deletions of the suggested texts to the suggestion indexes of all the processes;
+        returns the new version """
+    with transaction.atomic():
+        row = SuggestionIndexVersion.objects.select_for_update().get_or_create(pk=VERSION_PK)[0]
+        row.version += 1
+        row.save(update_fields=['version'])
+    return row.version
+
+
+class PrefixIndex:
+    """ an in-memory sorted array of the (normalized) word suffixes of all the titles, author names & publishers.
+
+        each text is indexed from the start of each of its words, so "rin" and "lord of" both complete
+        "The Lord of the Rings"; a prefix is answered by a binary search and a scan of the next k entries.
+        the same text of many books is indexed once, with a reference count.
+
+        the index is built by a background thread (see start_refresher), which then applies the changed books
+        & authors (by Book.date_updated) every interval, and rebuilds it when another process has deleted any
+        (and bumped the SuggestionIndexVersion); the changes made by this process are also applied by the signals. """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.is_built = False
+            self.version = None
+            # the versions bumped by this process (whose deletions are already applied):
+            self.own_versions = set()
+            # the time the changes were last loaded at:
+            self.updated_at = None
+            # sorted (word suffix, kind, text) entries:
+            self.entries = []
+            # (kind, text) => number of documents with this text:
+            self.counts = {}
+            # (kind, pk) => text of the document:
+            self.documents = {}
+
+    @staticmethod
+    def get_entries(kind, text):
+        words = normalize_text(text).split(' ')
+        return [(' '.join(words[i:]), kind, text) for i in range(len(words)) if words[i]]
+
+    def add(self, kind, pk, text):
+        with self.lock:
+            if self.documents.get((kind, pk)) == text:
+                return
+            self.remove(kind, pk)
+            if not text:
+                return
+
+            self.documents[(kind, pk)] = text
+            self.counts[(kind, text)] = self.counts.get((kind, text), 0) + 1
+            if self.counts[(kind, text)] == 1:
+                for entry in self.get_entries(kind, text):
+                    insort(self.entries, entry)
+
+    def remove(self, kind, pk):
+        with self.lock:
+            text = self.documents.pop((kind, pk), None)
+            if text is None:
+                return
+
+            self.counts[(kind, text)] -= 1
+            if self.counts[(kind, text)] == 0:
+                del self.counts[(kind, text)]
+                for entry in self.get_entries(kind, text):
+                    i = bisect_left(self.entries, entry)
+                    if i < len(self.entries) and self.entries[i] == entry:
+                        del self.entries[i]
+
+    @classmethod
+    def load(cls):
+        """ returns the entries, counts & documents of all the texts in the database (in 2 queries) """
+        entries, counts, documents = [], {}, {}
+
+        texts = []
+        for pk, title, publisher in Book.objects.values_list('pk', 'title', 'publisher'):
+            texts += [(TITLE, pk, title), (PUBLISHER, pk, publisher)]
+        for pk, name in Author.objects.values_list('pk', 'name'):
+            texts.append((AUTHOR, pk, name))
+
+        for kind, pk, text in texts:
+            if not text:
+                continue
+            documents[(kind, pk)] = text
+            counts[(kind, text)] = counts.get((kind, text), 0) + 1
+            if counts[(kind, text)] == 1:
+                entries += cls.get_entries(kind, text)
+        entries.sort()
+        return entries, counts, documents
+
+    def build(self):
+        """ (re)builds the whole index from the database, sorting the entries once; the new entries are
+            swapped in when ready, so the suggestions are not blocked meanwhile """
+        # (read before the texts, so the deletions made while loading them rebuild the index again):
+        version = get_version()
+        updated_at = timezone.now()
+        entries, counts, documents = self.load()
+        with self.lock:
+            self.entries, self.counts, self.documents = entries, counts, documents
+            self.version = version
+            self.own_versions = set()
+            self.updated_at = updated_at
+            self.is_built = True
+
+    def is_outdated(self, version):
+        """ whether another process has deleted any texts since the index was built (or last refreshed) """
+        with self.lock:
+            if not self.is_built or version < self.version:
+                return True
+            return any(v not in self.own_versions for v in range(self.version + 1, version + 1))
+
+    def update(self, version):
+        """ applies the books (& their authors) changed since the last update, in 2 queries """
+        with self.lock:
+            own_versions = set(self.own_versions)
+        updated_at = timezone.now()
+        since = self.updated_at - timedelta(seconds=MAX_TRANSACTION_TIME)
+        books = list(Book.objects.filter(date_updated__gte=since).values_list('pk', 'title', 'publisher'))
+        authors = list(Author.objects.filter(book__date_updated__gte=since).values_list('pk', 'name'))
+
+        with self.lock:
+            if self.own_versions != own_versions:
+                # (a deletion of this process, maybe of these rows, was applied meanwhile: they are loaded again next time):
+                return
+            for pk, title, publisher in books:
+                self.add(TITLE, pk, title)
+                self.add(PUBLISHER, pk, publisher)
+            for pk, name in authors:
+                self.add(AUTHOR, pk, name)
+            self.version = version
+            self.own_versions = {v for v in self.own_versions if v > version}
+            self.updated_at = updated_at
+
+    def refresh(self):
+        version = get_version()
+        if self.is_outdated(version):
+            self.build()
+        else:
+            self.update(version)
+
+    def remove_deleted(self, documents):
+        """ removes the [(kind, pk)] documents of a committed deletion, and signals it to the other processes """
+        version = bump_version()
+        with self.lock:
+            for kind, pk in documents:
+                self.remove(kind, pk)
+            self.own_versions.add(version)
+
+    def refresh_forever(self, interval):
+        """ builds the index, and refreshes it every interval seconds """
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                # (e.g. the database is not available yet; retried after the interval):
+                logger.exception("refreshing the suggestion index failed")
+            finally:
+                connection.close()
+            time.sleep(interval)
+
+    def start_refresher(self, interval=SEARCH_SUGGEST_REFRESH_INTERVAL):
+        thread = threading.Thread(target=self.refresh_forever, args=(interval,), name='suggestion-index', daemon=True)
+        thread.start()
+        return thread
+
+    def suggest(self, prefix, limit):
+        """ returns up to limit distinct [{"text", "type"}] (in alphabetical order) starting with the prefix
+            (nothing, until the index is built) """
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+
+        with self.lock:
+            suggestions = []
+            seen = set()
+            i = bisect_left(self.entries, (prefix,))
+            while i < len(self.entries) and len(suggestions) < limit:
+                key, kind, text = self.entries[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, text) not in seen:
+                    seen.add((kind, text))
+                    suggestions.append({"text": text, "type": kind})
+                i += 1
+            return suggestions
+
+
+suggestion_index = PrefixIndex()
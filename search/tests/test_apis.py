@@ -1,5 +1,10 @@
-from django.db import IntegrityError
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
 from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from PIL import Image
@@ -8,6 +13,10 @@ from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 
 from account.models import User
 from book.models import Author, Book
+from search.cache import check_search_cache, get_search_cache, get_stats
+from search.engine import search_books, search_users_by_trigram
+from sharing.models import BookExchange
+from sharing.ratings import add_rating
 
 
 class SearchBookAPITestCase(APITestCase):
@@ -15,6 +24,8 @@ class SearchBookAPITestCase(APITestCase):
     urls = ['book.api.urls', 'search.api.urls']
 
     def setUp(self):
+        # (the search cache is invalidated after the commits, which the test cases roll back):
+        get_search_cache().clear()
         self.test_owner = User.objects.create(username="testowner", email="owner@alaki.com")
         self.test_searcher = User.objects.create(username="testsearcher", email="searcher@alaki.com")
         
@@ -242,11 +253,170 @@ class SearchBookAPITestCase(APITestCase):
         self.assertEqual(response_data[3]["publisher"].count("django"), 1)
 
 
+    def test_search_book_pagination(self):
+        # adding 'django' (in title) to books:
+        for i, book in enumerate(Book.objects.all()):
+            book.title += ' django'
+            book.save()
+
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        full_response = searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "django" },
+            format='json'
+        )
+        self.assertEqual(full_response.data["next_cursor"], None)
+
+        # fetching the results page by page:
+        slugs, cursor = [], None
+        for page_num in range(2):
+            response = searcher_client.put(
+                reverse('search_api:search_book'),
+                data={ 'query': "django", 'limit': 3, 'cursor': cursor },
+                format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            slugs += [book_dict["slug"] for book_dict in response.data["result"]]
+            cursor = response.data["next_cursor"]
+
+        self.assertEqual(cursor, None)
+        self.assertEqual(slugs, [book_dict["slug"] for book_dict in full_response.data["result"]])
+
+    def test_search_book_invalid_page(self):
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        invalid_pages = [
+            { 'limit': 0 }, { 'limit': 'ten' }, { 'cursor': 'not a cursor' }, { 'cursor': 5 }, { 'cursor': [1, 2] },
+        ]
+        for invalid_page in invalid_pages:
+            invalid_page['query'] = "django"
+            response = searcher_client.put(
+                reverse('search_api:search_book'),
+                data=invalid_page,
+                format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_book_constant_queries(self):
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        # the number of queries does not depend on the number of results:
+        num_queries = []
+        for limit in [1, 4]:
+            get_search_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = searcher_client.put(
+                    reverse('search_api:search_book'),
+                    data={ 'query': "novel", 'limit': limit },
+                    format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data["result"]), limit)
+            num_queries.append(len(queries))
+        self.assertEqual(num_queries[0], num_queries[1])
+
+        # still in the rank order, with the authors & owner names:
+        self.assertEqual([book_dict["slug"] for book_dict in response.data["result"]], [book.slug for book in search_books("novel")])
+        for book_dict in response.data["result"]:
+            book = Book.objects.get(slug=book_dict["slug"])
+            self.assertEqual(book_dict["authors_list"], book.authors_list)
+            self.assertEqual(book_dict["owner_name"], self.test_owner.full_name)
+
+    def test_search_book_filters(self):
+        for i, book in enumerate(Book.objects.order_by('page_num')):
+            book.rating = self.ratings_list[i]
+            book.pub_year = 1990 + i * 10
+            book.save()
+        # "The Hobbit" is lent:
+        BookExchange.objects.create(
+            slug="test-exchange", book=Book.objects.get(title="The Hobbit"), borrower=self.test_searcher, state=2,
+        )
+
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        filters_results = [
+            ({ 'category': 2 }, ['The Master and Margarita']),
+            ({ 'min_rating': 4 }, ['Harry Potter', 'The Master and Margarita']),
+            ({ 'min_pub_year': 2000, 'max_pub_year': 2010 }, ['The Hobbit', 'The Master and Margarita']),
+            ({ 'min_page_num': 2500 }, ['Harry Potter', 'The Hobbit']),
+            ({ 'available': True }, ['Harry Potter', 'The Lord of the Rings', 'The Master and Margarita']),
+            ({ 'available': False }, ['The Hobbit']),
+            ({ 'min_rating': 1.5, 'available': True, 'max_page_num': 3000 }, ['The Master and Margarita']),
+        ]
+        for filters, expected_titles in filters_results:
+            filters['query'] = "novel"
+            response = searcher_client.put(
+                reverse('search_api:search_book'),
+                data=filters,
+                format='json'
+            )
+            if response.status_code != status.HTTP_200_OK:
+                print(response.data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(sorted(book_dict["title"] for book_dict in response.data["result"]), expected_titles)
+            self.assertEqual(response.data["facets"]["total"], len(expected_titles))
+
+    def test_search_book_facets(self):
+        for i, book in enumerate(Book.objects.order_by('page_num')):
+            book.rating = self.ratings_list[i]
+            book.save()
+        harry_potter = Book.objects.get(title="Harry Potter")
+        harry_potter.category_2 = '1'
+        harry_potter.save()
+        BookExchange.objects.create(
+            slug="test-exchange", book=Book.objects.get(title="The Hobbit"), borrower=self.test_searcher, state=0,
+        )
+
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        response = searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "novel", 'limit': 1 },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["facets"], {
+            "total": 4,
+            "available": 3,
+            "categories": {'1': 2, '2': 1, '3': 1, '4': 1},
+            "rating": {'1': 4, '2': 2, '3': 2, '4': 2},
+        })
+
+        # the facets are only counted for the first page:
+        response = searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "novel", 'limit': 1, 'cursor': response.data["next_cursor"] },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("facets", response.data)
+
+    def test_search_book_invalid_filters(self):
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        for invalid_filters in [{ 'category': 32 }, { 'min_rating': 'high' }, { 'max_page_num': 'many' }, { 'available': 'maybe' }]:
+            invalid_filters['query'] = "novel"
+            response = searcher_client.put(
+                reverse('search_api:search_book'),
+                data=invalid_filters,
+                format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class SearchUserAPITestCase(APITestCase):
 
     urls = 'search.api.urls'
 
     def setUp(self):
+        get_search_cache().clear()
         self.test_searcher = User.objects.create(username="testsearcher", email="searcher@alaki.com")
         
         self.ratings_list = [3.1, 7.0, 5.9, 8.5]
@@ -329,4 +499,220 @@ class SearchUserAPITestCase(APITestCase):
         self.assertEqual(response_data[0]["last_name"], "Gates")
         self.assertEqual(response_data[1]["last_name"], "Musk")
 
-    
\ No newline at end of file
+    
+
+    def test_search_user_pagination(self):
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        response = searcher_client.put(
+            reverse('search_api:search_user'),
+            data={ 'query': "Michael", 'limit': 1 },
+            format='json'
+        )
+        
+        # response status code:
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["result"]), 1)
+        self.assertEqual(response.data["result"][0]["last_name"], "Gates")
+
+        response = searcher_client.put(
+            reverse('search_api:search_user'),
+            data={ 'query': "Michael", 'limit': 1, 'cursor': response.data["next_cursor"] },
+            format='json'
+        )
+        
+        # response status code:
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["result"]), 1)
+        self.assertEqual(response.data["result"][0]["last_name"], "Musk")
+        self.assertEqual(response.data["next_cursor"], None)
+
+    def test_search_user_trigram_typo_and_prefix(self):
+        User.objects.create(
+            username = 'امیرگلپایگانی',
+            first_name = "امیر",
+            last_name = "گلپایگانی",
+            email = 'amir@xxx.com'
+        )
+
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        # query => expected last names (in order):
+        expected_results = {
+            "Micheal": ["Gates", "Musk"],   # typo
+            "zuck": ["Zuckerberg"],         # prefix
+            "j": ["Bezos"],                 # one-letter prefix
+            "امی": ["گلپایگانی"],            # persian prefix
+        }
+        for query, expected_last_names in expected_results.items():
+            response = searcher_client.put(
+                reverse('search_api:search_user'),
+                data={ 'query': query, 'mode': 'trigram' },
+                format='json'
+            )
+
+            # response status code:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([user_dict["last_name"] for user_dict in response.data["result"]], expected_last_names)
+
+    def test_search_user_trigram_normalized_names(self):
+        # a name saved with the arabic yeh & kaf:
+        User.objects.create(username='arabic_user', first_name="علي", last_name="كريمي", email='ali@xxx.com')
+
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+        for query in ["كريمي", "کریمی", "کری"]:
+            response = searcher_client.put(
+                reverse('search_api:search_user'),
+                data={ 'query': query, 'mode': 'trigram' },
+                format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([user_dict["username"] for user_dict in response.data["result"]], ['arabic_user'])
+
+    def test_search_user_trigram_uses_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            queryset = search_users_by_trigram('کریمی')
+            cursor.execute('EXPLAIN ' + str(queryset.query.sql_with_params()[0]), queryset.query.sql_with_params()[1])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute('SET enable_seqscan = on')
+        for index_name in ['user_first_name_norm_trgm', 'user_last_name_norm_trgm', 'user_username_norm_trgm']:
+            self.assertIn(index_name, plan)
+
+    def test_search_user_modes(self):
+        searcher_client = APIClient()
+        searcher_client.force_authenticate(self.test_searcher)
+
+        response = searcher_client.put(
+            reverse('search_api:search_user'),
+            data={ 'query': "Micheal", 'mode': 'fulltext' },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["result"], [])
+
+        response = searcher_client.put(
+            reverse('search_api:search_user'),
+            data={ 'query': "Michael", 'mode': 'soundex' },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchCacheAPITestCase(APITransactionTestCase):
+
+    urls = ['book.api.urls', 'search.api.urls']
+
+    def setUp(self):
+        get_search_cache().clear()
+
+        self.test_owner = User.objects.create(username="testowner", email="owner@alaki.com")
+        self.test_searcher = User.objects.create(username="testsearcher", email="searcher@alaki.com")
+        self.test_book = Book.objects.create(title='django', description='test_description', page_num=100, category_1=0, owner=self.test_owner)
+
+        self.searcher_client = APIClient()
+        self.searcher_client.force_authenticate(self.test_searcher)
+
+        return super().setUp()
+
+
+    def test_search_book_cache_hit(self):
+        first_response = self.searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "Django" },
+            format='json'
+        )
+
+        # the same (normalized) query is answered from the cache (without searching the books):
+        with CaptureQueriesContext(connection) as queries:
+            second_response = self.searcher_client.put(
+                reverse('search_api:search_book'),
+                data={ 'query': "  django " },
+                format='json'
+            )
+        self.assertEqual([query['sql'] for query in queries.captured_queries if '"book_book"' in query['sql']], [])
+
+        self.assertEqual(second_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(second_response.data, first_response.data)
+        self.assertEqual(get_stats()['hits'], 1)
+        self.assertEqual(get_stats()['misses'], 1)
+
+    def test_search_book_cache_invalidation(self):
+        self.searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "django" },
+            format='json'
+        )
+
+        # editing the book:
+        self.test_book.title = 'flask'
+        self.test_book.save()
+
+        response = self.searcher_client.put(
+            reverse('search_api:search_book'),
+            data={ 'query': "django" },
+            format='json'
+        )
+        self.assertEqual(response.data["result"], [])
+        self.assertEqual(get_stats()['hits'], 0)
+
+    def test_search_cache_invalidated_after_commit(self):
+        generation = get_stats()['generation']
+        with transaction.atomic():
+            self.test_book.title = 'flask'
+            self.test_book.save()
+            # (the old rows may still be read & cached by the other requests):
+            self.assertEqual(get_stats()['generation'], generation)
+        self.assertNotEqual(get_stats()['generation'], generation)
+
+    def test_search_cache_invalidated_by_searched_changes_only(self):
+        generation = get_stats()['generation']
+
+        # a login, a save of an unchanged rating & a change of an active exchange:
+        self.test_owner.last_login = timezone.now()
+        self.test_owner.save()
+        User.objects.get(pk=self.test_owner.pk).save(update_fields=['rating'])
+        self.assertEqual(get_stats()['generation'], generation)
+        book_exchange = BookExchange.objects.create(book=self.test_book, borrower=self.test_searcher)
+        generation = get_stats()['generation']
+        book_exchange.state = 2
+        book_exchange.save()
+        self.assertEqual(get_stats()['generation'], generation)
+
+        # the name of a user:
+        user = User.objects.get(pk=self.test_owner.pk)
+        user.first_name = 'renamed'
+        user.save()
+        self.assertNotEqual(get_stats()['generation'], generation)
+
+        # the rating of a user (shown in the results):
+        generation = get_stats()['generation']
+        add_rating(User.objects.get(pk=self.test_owner.pk), 7)
+        self.assertNotEqual(get_stats()['generation'], generation)
+
+        # the book becomes available:
+        generation = get_stats()['generation']
+        book_exchange.state = 4
+        book_exchange.save()
+        self.assertNotEqual(get_stats()['generation'], generation)
+
+    def test_local_search_cache_with_many_processes(self):
+        with mock.patch('search.cache.WEB_CONCURRENCY', 4):
+            # (the default cache, in the database, is shared):
+            check_search_cache()
+            with mock.patch('search.cache.get_search_cache', return_value=LocMemCache('search', {})):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_search_cache()
+
+    def test_search_cache_stats_admin_only(self):
+        response = self.searcher_client.get(reverse('search_api:search_cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.test_searcher.is_staff = True
+        self.test_searcher.save()
+        response = self.searcher_client.get(reverse('search_api:search_cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'hits', 'misses', 'generation'})
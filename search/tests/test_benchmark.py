@@ -0,0 +1,30 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from account.models import User
+from book.models import Book
+from search.benchmark import QUERY_MIX, percentile
+
+
+class SearchBenchmarkTestCase(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_benchmark_search_command(self):
+        out = StringIO()
+        call_command('benchmark_search', users=20, books=100, rounds=2, stdout=out)
+
+        report = out.getvalue()
+        for name, api, data in QUERY_MIX:
+            self.assertIn(name, report)
+
+        # the generated catalogue is rolled back:
+        self.assertEqual(Book.objects.count(), 0)
+        self.assertEqual(User.objects.count(), 0)
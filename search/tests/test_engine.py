@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from account.models import User
+from book.models import Book
+from search.engine import search_books
+
+
+class SearchBooksEngineTestCase(TestCase):
+
+    def setUp(self):
+        self.test_owner = User.objects.create(username="testowner", email="owner@alaki.com")
+
+        self.test_books_list = [
+            Book.objects.create(title='django', description='nothing', page_num=100, category_1=0, owner=self.test_owner, rating=1.0),
+            Book.objects.create(title='nothing', description='django', page_num=100, category_1=0, owner=self.test_owner, rating=5.0),
+            Book.objects.create(title='nothing', description='nothing', page_num=100, category_1=0, owner=self.test_owner, publisher='django'),
+            Book.objects.create(title='nothing', description='nothing', page_num=100, category_1=0, owner=self.test_owner),
+        ]
+
+        return super().setUp()
+
+
+    def test_search_books_single_query(self):
+        with self.assertNumQueries(1):
+            result = list(search_books("django"))
+
+        # the unmatched book is not in the result:
+        self.assertEqual(len(result), 3)
+        
+        # checking the weighted order:
+        self.assertEqual([book.pk for book in result], [book.pk for book in self.test_books_list[:3]])
+
+    def test_search_books_normalized_score(self):
+        result = list(search_books("django"))
+
+        # each field score is normalized to 1, so the scores are the field weights:
+        self.assertAlmostEqual(result[0].score, 0.5)
+        self.assertAlmostEqual(result[1].score, 0.25)
+        self.assertAlmostEqual(result[2].score, 0.1)
+
+    def test_search_books_persian_normalization(self):
+        test_book = Book.objects.create(title='كتابهاي علمي', description='nothing', page_num=100, category_1=0, owner=self.test_owner)
+
+        # the same words, typed with persian letters, a ZWNJ & a diacritic:
+        for query in ['کتاب\u200cهای علمی', 'کتابهای عِلمی', 'كتابهاي']:
+            self.assertEqual([book.pk for book in search_books(query)], [test_book.pk])
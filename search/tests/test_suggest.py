@@ -0,0 +1,157 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from account.models import User
+from book.models import Author, Book
+from search.suggest import (AUTHOR, PUBLISHER, TITLE, PrefixIndex, get_version,
+                            suggestion_index)
+
+
+class PrefixIndexTestCase(SimpleTestCase):
+
+    def test_suggest_word_prefixes(self):
+        index = PrefixIndex()
+        index.is_built = True
+        index.add(TITLE, 1, "The Lord of the Rings")
+        index.add(TITLE, 2, "The Hobbit")
+        index.add(AUTHOR, 1, "J. R. R. Tolkien")
+
+        self.assertEqual(index.suggest("lord o", 10), [{"text": "The Lord of the Rings", "type": TITLE}])
+        self.assertEqual(index.suggest("RIN", 10), [{"text": "The Lord of the Rings", "type": TITLE}])
+        self.assertEqual(index.suggest("tol", 10), [{"text": "J. R. R. Tolkien", "type": AUTHOR}])
+        self.assertEqual(len(index.suggest("the", 10)), 2)
+        self.assertEqual(len(index.suggest("the", 1)), 1)
+        self.assertEqual(index.suggest("silm", 10), [])
+
+    def test_suggest_reference_counting(self):
+        index = PrefixIndex()
+        index.is_built = True
+        index.add(PUBLISHER, 1, "Bloomsbury")
+        index.add(PUBLISHER, 2, "Bloomsbury")
+        self.assertEqual(index.suggest("bloom", 10), [{"text": "Bloomsbury", "type": PUBLISHER}])
+
+        index.remove(PUBLISHER, 1)
+        self.assertEqual(len(index.suggest("bloom", 10)), 1)
+        index.add(PUBLISHER, 2, "Penguin")
+        self.assertEqual(index.suggest("bloom", 10), [])
+        self.assertEqual(len(index.entries), 1)
+
+    def test_suggest_persian_normalization(self):
+        index = PrefixIndex()
+        index.is_built = True
+        # with persian yeh & kaf, and a ZWNJ:
+        index.add(TITLE, 1, "کتاب‌های کودکی")
+
+        # with arabic yeh & kaf, without the ZWNJ:
+        self.assertEqual(index.suggest("كتابهاي", 10), [{"text": "کتاب‌های کودکی", "type": TITLE}])
+
+
+class SuggestAPITestCase(APITransactionTestCase):
+
+    urls = 'search.api.urls'
+
+    def setUp(self):
+        suggestion_index.clear()
+
+        self.test_owner = User.objects.create(username="testowner", email="owner@alaki.com")
+        self.test_book = Book.objects.create(title='The Hobbit', description='test_description', page_num=100, category_1=0, owner=self.test_owner)
+        # (as at startup, by the background thread):
+        suggestion_index.build()
+
+        return super().setUp()
+
+    def tearDown(self):
+        suggestion_index.clear()
+        return super().tearDown()
+
+
+    def test_suggest_without_database(self):
+        client = APIClient()
+
+        # the index is used without the database:
+        with self.assertNumQueries(0):
+            response = client.get(reverse('search_api:suggest'), data={ 'query': "hob" })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["result"], [{"text": "The Hobbit", "type": TITLE}])
+
+    def test_suggest_updated_by_signals(self):
+        client = APIClient()
+
+        self.test_book.title = 'The Silmarillion'
+        self.test_book.save()
+        Author.objects.create(book=self.test_book, name='Tolkien')
+
+        response = client.get(reverse('search_api:suggest'), data={ 'query': "hob" })
+        self.assertEqual(response.data["result"], [])
+        response = client.get(reverse('search_api:suggest'), data={ 'query': "silm" })
+        self.assertEqual(response.data["result"], [{"text": "The Silmarillion", "type": TITLE}])
+        response = client.get(reverse('search_api:suggest'), data={ 'query': "tolk" })
+        self.assertEqual(response.data["result"], [{"text": "Tolkien", "type": AUTHOR}])
+
+        self.test_book.delete()
+        response = client.get(reverse('search_api:suggest'), data={ 'query': "silm" })
+        self.assertEqual(response.data["result"], [])
+
+    def test_suggest_before_build(self):
+        suggestion_index.clear()
+        with self.assertNumQueries(0):
+            response = APIClient().get(reverse('search_api:suggest'), data={ 'query': "hob" })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["result"], [])
+
+
+class SuggestionIndexRefreshTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username="testowner", email="owner@alaki.com")
+        self.book = Book.objects.create(title='The Hobbit', description='test_description', page_num=100, category_1=0, owner=self.owner)
+        # (the index of another process):
+        self.index = PrefixIndex()
+        self.index.refresh()
+
+        return super().setUp()
+
+    def tearDown(self):
+        suggestion_index.clear()
+        return super().tearDown()
+
+    def test_changes_are_loaded_incrementally(self):
+        self.assertEqual(self.index.suggest("hob", 10), [{"text": "The Hobbit", "type": TITLE}])
+
+        version = get_version()
+        self.book.title = 'The Silmarillion'
+        self.book.save()
+        Author.objects.create(book=self.book, name='Tolkien')
+        self.assertEqual(get_version(), version)
+
+        # (the version, the changed books & their authors; not all of them):
+        with mock.patch.object(self.index, 'load', wraps=self.index.load) as load, self.assertNumQueries(3):
+            self.index.refresh()
+        self.assertEqual(load.call_count, 0)
+        self.assertEqual(self.index.suggest("hob", 10), [])
+        self.assertEqual(self.index.suggest("silm", 10), [{"text": "The Silmarillion", "type": TITLE}])
+        self.assertEqual(self.index.suggest("tolk", 10), [{"text": "Tolkien", "type": AUTHOR}])
+
+    def test_deletions_of_other_processes_rebuild(self):
+        self.book.delete()
+        self.assertEqual(self.index.suggest("hob", 10), [{"text": "The Hobbit", "type": TITLE}])
+
+        with mock.patch.object(self.index, 'load', wraps=self.index.load) as load:
+            self.index.refresh()
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(self.index.suggest("hob", 10), [])
+
+    def test_own_deletions_do_not_rebuild(self):
+        suggestion_index.refresh()
+        self.book.delete()
+        self.assertEqual(suggestion_index.suggest("hob", 10), [])
+
+        with mock.patch.object(suggestion_index, 'load', wraps=suggestion_index.load) as load:
+            suggestion_index.refresh()
+        self.assertEqual(load.call_count, 0)
+        self.assertEqual(suggestion_index.version, get_version())
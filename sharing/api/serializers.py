@@ -4,12 +4,6 @@ from sharing.models import BookExchange
 from account.models import User
 
 
-class BookExchangeRegistrationSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = BookExchange
-        fields = [  'book', 'borrower',  ]
-
-
 class BookExchangeBorrowRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = BookExchange
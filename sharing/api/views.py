@@ -1,12 +1,16 @@
 import json
 import os
+from datetime import timedelta
 
 from django.contrib.auth import authenticate
+from django.db import IntegrityError
+from django.db.models import Count
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage, send_mail
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes, force_text
+from django.utils import timezone
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from rest_framework import status, viewsets
 from rest_framework.authentication import TokenAuthentication
@@ -20,13 +24,17 @@ from rest_framework.views import APIView
 
 from account.models import User
 from book.models import Book
-from bookshare.settings import DEFAULT_BOOK_IMAGE, MEDIA_ROOT, MSG_LANGUAGE
-from sharing.models import BookExchange
+from bookshare.etags import get_etag_headers, get_not_modified_response, make_etag
+from bookshare.settings import (DEFAULT_BOOK_IMAGE, EXCHANGE_DELETION_RETENTION,
+                                EXCHANGE_LIST_MAX_PAGE_SIZE,
+                                EXCHANGE_LIST_PAGE_SIZE, MAX_TRANSACTION_TIME,
+                                MEDIA_ROOT, MSG_LANGUAGE)
+from search.pagination import InvalidPageError, parse_limit
+from sharing.models import BookExchange, DeletedBookExchange
+from sharing.pagination import paginate, parse_date
 
 from .serializers import (BookExchangeBorrowRequestSerializer,
-                          BookExchangeRegistrationSerializer,
-                          ExchangePropertiesSerializer,
-                          UserBorrowListSerializer, UserLendListSerializer)
+                          ExchangePropertiesSerializer)
 
 # messages:
 MSG_NO_RESPONSE_RESULT =        {'Persian': 'نتیجه پاسخ ارائه نشده است', 'English': 'No response result was provided!'}[MSG_LANGUAGE]
@@ -39,6 +47,8 @@ MSG_INVALID_STATE =             {'Persian': 'کتاب در وضعیت نامعت
 
 MSG_NONEXISTANT_BOOKEXCHANGE =  {'Persian': 'چنین مبادله کتابی وجود ندارد', 'English': 'There is no such book exchange!'}[MSG_LANGUAGE]
 MSG_UNEXPECTED_STATE =          {'Persian': 'حالت اشتراک کتاب در محدوده مورد نظر نیست', 'English': 'The exchange is not in the expected range!'}[MSG_LANGUAGE]
+MSG_INVALID_PAGE =              {'Persian': 'صفحه درخواستی نامعتبر است', 'English': 'invalid limit, cursor or since!'}[MSG_LANGUAGE]
+MSG_SYNC_EXPIRED =              {'Persian': 'زمان همگام سازی قدیمی است، کل فهرست را دریافت کنید', 'English': 'since is too old, the whole list should be synced!'}[MSG_LANGUAGE]
 
 MSG_BORROW_REQUEST_SUCCESS =    {'Persian': 'درخواست قرض گرفتن کتاب با موفقیت ثبت شد', 'English': 'Your book borrow request was successfully registered.'}[MSG_LANGUAGE]
 MSG_BORROW_RESPONSE_SUCCESS =    {'Persian': 'پاسخ شما به این درخواست با موفقیت ثبت شد', 'English': 'Your reponse to this request was successfully registered.'}[MSG_LANGUAGE]
@@ -66,41 +76,28 @@ def api_register_borrow_request_view(request, book_slug):
 
         book = Book.objects.get(slug=book_slug)
         borrower = request.user
-        lender = book.owner
 
-        if lender == borrower:
+        if book.owner_id == borrower.pk:
             response_data['message'] = MSG_IMPOSSIBLE_BORROW
             return Response(response_data, status.HTTP_400_BAD_REQUEST)
-        # if this book is in an active exchange:
-        if BookExchange.objects.filter(book=book, state__in=[0, 2, 3]).exists():
-            response_data['message'] = MSG_BOOK_UNAVAILABLE
-            return Response(response_data, status.HTTP_400_BAD_REQUEST)
-
-        serializer_data = {
-            "borrower": borrower.pk,
-            "book": book.pk,
-        }
-        book_exchange_serializer = BookExchangeRegistrationSerializer(data=serializer_data)
 
-
-        if book_exchange_serializer.is_valid():
-            new_book_exchange = book_exchange_serializer.save()
-            
-            # requesting:
+        # requesting (the exchange is only created if it is valid):
+        new_book_exchange = BookExchange(book=book, borrower=borrower)
+        try:
             request_result = new_book_exchange.request(request_message=request_message, phone_number=request_phone_number)
-            if request_result != True:
-                new_book_exchange.delete()
-                response_data = request_result
-                response_data['message'] = MSG_INVALID_FIELDS
-                return Response(response_data, status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # if this book is in an active exchange (see exchange_active_book_uniq):
+            response_data['message'] = MSG_BOOK_UNAVAILABLE
+            return Response(response_data, status.HTTP_400_BAD_REQUEST)
 
-            response_data['message'] = MSG_BORROW_REQUEST_SUCCESS
-            return Response(response_data, status=status.HTTP_200_OK)
-        else:
-            response_data = book_exchange_serializer.errors
+        if request_result != True:
+            response_data = request_result
             response_data['message'] = MSG_INVALID_FIELDS
             return Response(response_data, status.HTTP_400_BAD_REQUEST)
 
+        response_data['message'] = MSG_BORROW_REQUEST_SUCCESS
+        return Response(response_data, status=status.HTTP_200_OK)
+
 
 @api_view(['PUT', ])
 @permission_classes([])
@@ -166,6 +163,41 @@ def api_add_borrow_response_view(request, exchange_slug):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+def get_exchange_list_response(request, book_exchanges, deleted_exchanges, get_list, list_name):
+    """ returns the response of a page of a borrow/lend list, given the (sorted) BookExchanges queryset;
+        "limit", "cursor" (the "next_cursor" of the previous page) & "since" (the "sync_time" of the
+        last sync, for only the changed exchanges, and the slugs of the "deleted" ones) are the query parameters.
+
+        the changes are stamped before their commit, so the sync_time is MAX_TRANSACTION_TIME seconds before now,
+        and the changes of those seconds are also in the next sync (the clients replace the exchanges by slug). """
+
+    sync_time = timezone.now() - timedelta(seconds=MAX_TRANSACTION_TIME)
+
+    try:
+        limit = parse_limit(request.query_params.get('limit', None), EXCHANGE_LIST_PAGE_SIZE, EXCHANGE_LIST_MAX_PAGE_SIZE)
+        since = request.query_params.get('since', None)
+        if since:
+            since = parse_date(since)
+        page, next_cursor = paginate(book_exchanges, limit, request.query_params.get('cursor', None), since or None)
+    except InvalidPageError:
+        return Response({'message': MSG_INVALID_PAGE}, status.HTTP_400_BAD_REQUEST)
+
+    deleted = []
+    if since:
+        # (the older deletions are not kept):
+        if since < timezone.now() - timedelta(days=EXCHANGE_DELETION_RETENTION):
+            return Response({'message': MSG_SYNC_EXPIRED}, status.HTTP_400_BAD_REQUEST)
+        deleted = list(deleted_exchanges.filter(date_deleted__gt=since).values_list('slug', flat=True))
+
+    response_data = {
+        list_name: get_list(page),
+        'deleted': deleted,
+        'next_cursor': next_cursor,
+        'sync_time': sync_time,
+    }
+    return Response(data=response_data, status=status.HTTP_200_OK)
+
+
 @api_view(['GET', ])
 @permission_classes([])
 @authentication_classes([TokenAuthentication])
@@ -177,9 +209,10 @@ def api_get_borrow_list_view(request):
         response_data = {}
 
         user = request.user
-        borrow_list_serializer = UserBorrowListSerializer(user)
-
-        return Response(data=borrow_list_serializer.data, status=status.HTTP_200_OK)
+        return get_exchange_list_response(
+            request, user.borrow_exchanges, DeletedBookExchange.objects.filter(borrower_id=user.pk),
+            User.get_borrow_list, 'borrow_list_to_show',
+        )
 
 
 @api_view(['GET', ])
@@ -193,9 +226,10 @@ def api_get_lend_list_view(request):
         response_data = {}
 
         user = request.user
-        lend_list_serializer = UserLendListSerializer(user)
-
-        return Response(data=lend_list_serializer.data, status=status.HTTP_200_OK)
+        return get_exchange_list_response(
+            request, user.lend_exchanges, DeletedBookExchange.objects.filter(lender_id=user.pk),
+            User.get_lend_list, 'lend_list_to_show',
+        )
 
 
 @api_view(['GET', ])
@@ -208,15 +242,31 @@ def api_get_exchange_properties_view(request, exchange_slug):
         response_data = {}
 
         user = request.user
+        # with the versions of its book, borrower & lender, and its number of comments (for the etag):
         try:
-            book_exchange = BookExchange.objects.get(slug=exchange_slug)
+            book_exchange = BookExchange.objects.select_related('book', 'borrower', 'lender').defer(
+                'book__search_vector',
+            ).annotate(num_comments=Count('comment')).get(slug=exchange_slug)
         except BookExchange.DoesNotExist:
             response_data['message'] = MSG_NONEXISTANT_BOOKEXCHANGE
             return Response(data=response_data, status=status.HTTP_400_BAD_REQUEST)
 
+        etag = make_etag(
+            'exchange', book_exchange.slug, book_exchange.date_last_changed, book_exchange.num_comments,
+            book_exchange.book.date_updated, book_exchange.borrower.date_updated,
+            book_exchange.lender.date_updated if book_exchange.lender else None,
+            # the time passed since each change:
+            book_exchange.when_requested, book_exchange.when_started, book_exchange.when_delivered,
+            book_exchange.when_ended, book_exchange.when_closed, book_exchange.when_last_changed,
+            book_exchange.book.when_added,
+        )
+        not_modified_response = get_not_modified_response(request, etag)
+        if not_modified_response is not None:
+            return not_modified_response
+
         exchange_serializer = ExchangePropertiesSerializer(book_exchange)
 
-        return Response(data=exchange_serializer.data, status=status.HTTP_200_OK)
+        return Response(data=exchange_serializer.data, status=status.HTTP_200_OK, headers=get_etag_headers(etag))
 
 
 @api_view(['PUT', ])
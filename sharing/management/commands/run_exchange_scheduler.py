@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bookshare.settings import EXCHANGE_SCHEDULER_INTERVAL
+from sharing.scheduler import (expire_requests, mark_overdue_exchanges,
+                               purge_deleted_exchanges, run_scheduler)
+
+
+class Command(BaseCommand):
+    help = "marks the overdue exchanges, expires the old requests & purges the old deletions (once, e.g. from cron; or every --interval seconds, with --loop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="keep checking the exchanges, every --interval seconds")
+        parser.add_argument('--interval', type=float, default=EXCHANGE_SCHEDULER_INTERVAL)
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_scheduler(options['interval'])
+            return
+
+        num_overdue = mark_overdue_exchanges()
+        num_expired = expire_requests()
+        purge_deleted_exchanges()
+        self.stdout.write("{0} exchanges are overdue, and {1} requests were expired.".format(num_overdue, num_expired))
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0006_remove_comment_book'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookexchange',
+            index=models.Index(condition=models.Q(state__in=[0, 2, 3]), fields=['book'], name='exchange_active_book_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0007_auto_20261018_0449'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookexchange',
+            index=models.Index(fields=['borrower', '-date_last_changed', 'state', 'slug'], name='exchange_borrower_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookexchange',
+            index=models.Index(fields=['lender', '-date_last_changed', 'state', 'slug'], name='exchange_lender_list_idx'),
+        ),
+    ]
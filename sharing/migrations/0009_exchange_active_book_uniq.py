@@ -0,0 +1,34 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:19
+
+from django.db import migrations, models
+
+
+def reject_duplicate_active_exchanges(apps, schema_editor):
+    # (the exchanges of a book created concurrently, before the constraint: the most advanced one is kept
+    # and the others are rejected):
+    BookExchange = apps.get_model('sharing', 'BookExchange')
+    active_exchanges = BookExchange.objects.filter(state__in=[0, 2, 3]).order_by('book', '-state', 'date_requested')
+    kept_books = set()
+    for slug, book_id in active_exchanges.values_list('slug', 'book_id'):
+        if book_id in kept_books:
+            BookExchange.objects.filter(slug=slug).update(state=1)
+        kept_books.add(book_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0008_auto_20261018_0456'),
+    ]
+
+    operations = [
+        migrations.RunPython(reject_duplicate_active_exchanges, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='bookexchange',
+            name='exchange_active_book_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='bookexchange',
+            constraint=models.UniqueConstraint(condition=models.Q(state__in=[0, 2, 3]), fields=('book',), name='exchange_active_book_uniq'),
+        ),
+    ]
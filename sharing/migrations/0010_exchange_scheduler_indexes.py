@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0009_exchange_active_book_uniq'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='bookexchange',
+            name='exchange_active_book_uniq',
+        ),
+        migrations.AddIndex(
+            model_name='bookexchange',
+            index=models.Index(condition=models.Q(state=3), fields=['date_delivered'], name='exchange_delivered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookexchange',
+            index=models.Index(condition=models.Q(state=0), fields=['date_requested'], name='exchange_requested_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookexchange',
+            constraint=models.UniqueConstraint(condition=models.Q(state__in=[0, 2, 3, 6]), fields=('book',), name='exchange_active_book_uniq'),
+        ),
+    ]
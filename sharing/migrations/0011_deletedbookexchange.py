@@ -0,0 +1,36 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:49
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sharing', '0010_exchange_scheduler_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedBookExchange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.CharField(max_length=30)),
+                ('borrower_id', models.IntegerField()),
+                ('lender_id', models.IntegerField(null=True)),
+                ('date_deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date deleted')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='deletedbookexchange',
+            index=models.Index(fields=['borrower_id', 'date_deleted'], name='deletedexchange_borrower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedbookexchange',
+            index=models.Index(fields=['lender_id', 'date_deleted'], name='deletedexchange_lender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedbookexchange',
+            index=models.Index(fields=['date_deleted'], name='deletedexchange_date_idx'),
+        ),
+    ]
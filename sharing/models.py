@@ -4,11 +4,15 @@ from uuid import uuid4
 from django.core.exceptions import ValidationError
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Extract, Floor
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
 from account.models import User
 from book.models import Book
+from sharing.ratings import add_borrower, add_rating
 
 
 def calculate_duration(start_date, end_date):
@@ -35,6 +39,34 @@ def calculate_duration(start_date, end_date):
         return "{0} year{1} ago".format(years_passed, 's' * (years_passed > 1))
 
 
+def duration_rank(start_field, end_date):
+    """ an expression of the rank of calculate_duration(start_field, end_date) in the database: it grows
+        exactly when the text of the duration changes (so the sum of the ranks of rows changes if any of them does) """
+    seconds = Extract(
+        models.ExpressionWrapper(
+            models.Value(end_date, output_field=models.DateTimeField()) - models.F(start_field),
+            output_field=models.DurationField(),
+        ),
+        'epoch',
+    )
+    days = Floor(seconds / 86400)
+    return models.Case(
+        models.When(models.Q(**{start_field + '__gt': end_date - timedelta(hours=1)}), then=Floor(seconds / 60)),
+        models.When(models.Q(**{start_field + '__gt': end_date - timedelta(hours=24)}), then=60 + Floor(seconds / 3600)),
+        models.When(models.Q(**{start_field + '__gt': end_date - timedelta(days=31)}), then=100 + days),
+        models.When(models.Q(**{start_field + '__gt': end_date - timedelta(days=365)}), then=200 + Floor(days / 31)),
+        default=300 + Floor(days / 365),
+        output_field=models.IntegerField(),
+    )
+
+
+def lock_and_reload(instance):
+    """ locks the row of a model instance until the end of the transaction, and reloads its fields """
+    locked_instance = type(instance)._base_manager.select_for_update().get(pk=instance.pk)
+    for field in instance._meta.concrete_fields:
+        setattr(instance, field.attname, getattr(locked_instance, field.attname))
+
+
 phone_number_regex_validator = RegexValidator(regex=r'^\+?1?\d{9,15}$', message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.")
 
 
@@ -48,9 +80,15 @@ BOOK_EXCHANGE_STATES = (
     (6, 'Overdue'),
 )
 
+# the states in which the book is not available to others (requested, started, delivered & overdue):
+ACTIVE_BOOK_EXCHANGE_STATES = [0, 2, 3, 6]
+
+# the order of the borrow & lend lists: first by "time" (newest/largest first), then by "state" (least first):
+BOOK_EXCHANGE_LIST_ORDERING = ['-date_last_changed', 'state', 'slug']
+
 
 class BookExchange(models.Model): 
-    # notice: each book can currently be in only one exchange
+    # notice: each book can currently be in only one exchange (see exchange_active_book_uniq)
     book =                      models.ForeignKey(Book, on_delete=models.CASCADE)
     borrower =                  models.ForeignKey(User, on_delete=models.CASCADE, related_name='borrow_exchange')
     lender =                    models.ForeignKey(User, on_delete=models.CASCADE, related_name='lend_exchange', null=True)
@@ -98,6 +136,21 @@ class BookExchange(models.Model):
     has_lender_rated =          models.BooleanField(default=False)
     has_borrower_rated =        models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # each book can be in only one active exchange (this also finds the active exchange of a book,
+            # e.g. for the "available" search filter):
+            models.UniqueConstraint(fields=['book'], name='exchange_active_book_uniq', condition=models.Q(state__in=ACTIVE_BOOK_EXCHANGE_STATES)),
+        ]
+        indexes = [
+            # for the exchange scheduler (the delivered exchanges which are overdue, and the requests which expire):
+            models.Index(fields=['date_delivered'], name='exchange_delivered_idx', condition=models.Q(state=3)),
+            models.Index(fields=['date_requested'], name='exchange_requested_idx', condition=models.Q(state=0)),
+            # for the (sorted & paginated) borrow & lend lists:
+            models.Index(fields=['borrower'] + BOOK_EXCHANGE_LIST_ORDERING, name='exchange_borrower_list_idx'),
+            models.Index(fields=['lender'] + BOOK_EXCHANGE_LIST_ORDERING, name='exchange_lender_list_idx'),
+        ]
+
     @property
     def response_meeting_time(self):
         return  self.response_meeting_year + '/' +\
@@ -166,13 +219,18 @@ class BookExchange(models.Model):
     @property
     def is_ended(self):
         return self.state == 4
+    @property
+    def is_overdue(self):
+        return self.state == 6
 
+    # every transition runs in a transaction, on the locked (and reloaded) exchange, so it is decided on its current
+    # state; and the counters & ratings of its book, lender & borrower are updated by the database (see sharing.ratings).
 
-    # when the borrower sends a borrow request
+    # when the borrower sends a borrow request (the exchange is created, with a single INSERT)
     ### then HIS EMAIL WILL BE SEEN by the lender/owner of the book
     def request(self, request_message, phone_number):
         # it returns the result: success or not
-        if self.state == 0:
+        if self._state.adding and self.state == 0:
             self.date_requested = timezone.now()
             self.date_last_changed = self.date_requested
             self.sorted_date = self.date_requested
@@ -181,7 +239,8 @@ class BookExchange(models.Model):
             self.request_message = request_message
             self.request_phone_number = phone_number
             try:
-                self.clean_fields()
+                # (the slug is generated while saving, and the relations are checked by the database):
+                self.clean_fields(exclude=['slug', 'book', 'borrower', 'lender'])
                 self.save()
             except ValidationError as ve:
                 return {k:list(map(str, ve.error_dict[k][0])) for k in ve.error_dict}
@@ -192,8 +251,10 @@ class BookExchange(models.Model):
 
     # when the lender accept & the lending period starts
     ### then HIS EMAIL WILL BE SEEN by the borrower/requester of the book
+    @transaction.atomic
     def accept(self, response_message, meeting_address, meeting_year, meeting_month, meeting_day, meeting_hour, meeting_minute):
         # it returns the result: success or not
+        lock_and_reload(self)
         if self.is_requested:
             self.state = 2
             self.date_started = timezone.now()
@@ -219,8 +280,10 @@ class BookExchange(models.Model):
             return False
 
     # when the lender rejects the request
+    @transaction.atomic
     def reject(self):
         # it returns the result: success or not
+        lock_and_reload(self)
         if self.is_requested:
             self.state = 1
             self.date_rejected = timezone.now()
@@ -234,18 +297,16 @@ class BookExchange(models.Model):
             return False
         
     # when the lender delivers the book to the borrower
+    @transaction.atomic
     def deliver(self, meeting_address, meeting_year, meeting_month, meeting_day, meeting_hour, meeting_minute):
         # it returns the result: success or not
+        lock_and_reload(self)
         if self.is_started: 
             self.state = 3
             self.date_delivered = timezone.now()
             self.date_last_changed = self.date_delivered
             self.sorted_date = self.date_delivered
 
-            self.book.num_borrowers += 1
-            self.lender.num_borrowers += 1
-            self.borrower.num_lenders += 1
-
             self.return_meeting_address = meeting_address
             self.return_meeting_year = meeting_year
             self.return_meeting_month = meeting_month
@@ -253,14 +314,9 @@ class BookExchange(models.Model):
             self.return_meeting_hour = meeting_hour
             self.return_meeting_minute = meeting_minute.zfill(2)
             try:
-                self.book.clean_fields(exclude=['edition', 'pub_year', 'category_1', 'category_2', 'category_3', 'image'])
-                self.lender.clean_fields(exclude=['first_name', 'last_name', 'password', 'username', 'image', 'last_retrieval'])
-                self.borrower.clean_fields(exclude=['first_name', 'last_name', 'password', 'username', 'image', 'last_retrieval'])
                 self.clean_fields()
-                self.book.save()
-                self.lender.save()
-                self.borrower.save()
                 self.save()
+                add_borrower(self.book, self.lender, self.borrower)
             except ValidationError as ve:
                 return {k:list(map(str, ve.error_dict[k][0])) for k in ve.error_dict}
 
@@ -269,10 +325,12 @@ class BookExchange(models.Model):
             return False
 
     # when the borrower returns the book to the lender (its owner)
+    @transaction.atomic
     def end(self, lender_rating: int, book_rating: int, book_comment=""):
         # it returns the result: success or not
-        if self.is_delivered or self.is_ended:
-            self.state += 1
+        lock_and_reload(self)
+        if (self.is_delivered or self.is_overdue or self.is_ended) and not self.has_borrower_rated:
+            self.state = 5 if self.is_ended else 4
             self.date_ended = timezone.now()
             self.date_last_changed = self.date_ended
             self.sorted_date = self.date_ended
@@ -281,22 +339,17 @@ class BookExchange(models.Model):
             self.book_rating = book_rating
             self.has_borrower_rated = True
 
-            self.lender.num_rates += 1
-            self.book.num_rates += 1
-            self.lender.rating = ((self.lender.rating * (self.lender.num_rates - 1)) + lender_rating) / self.lender.num_rates
-            self.book.rating = ((self.book.rating * (self.book.num_rates - 1)) + book_rating) / self.book.num_rates
             if book_comment:
                 new_comment = Comment(book_exchange=self, text=book_comment)
             try:
+                # (the ratings are validated here, so the means of the ratings are valid too):
                 self.clean_fields()
-                self.lender.clean_fields(exclude=['first_name', 'last_name', 'password', 'username', 'image', 'last_retrieval'])
-                self.book.clean_fields(exclude=['edition', 'pub_year', 'category_1', 'category_2', 'category_3', 'image'])
                 if book_comment:
                     new_comment.clean_fields()
 
                 self.save()
-                self.lender.save()
-                self.book.save()
+                add_rating(self.lender, self.lender_rating)
+                add_rating(self.book, self.book_rating)
                 if book_comment:
                     new_comment.save()
             except ValidationError as ve:
@@ -307,10 +360,12 @@ class BookExchange(models.Model):
             return False
 
     # when the lender rates the borrower:
+    @transaction.atomic
     def rate_borrower(self, borrower_rating: int):
         # it returns the result: success or not
-        if self.is_delivered or self.is_ended: 
-            self.state += 1
+        lock_and_reload(self)
+        if (self.is_delivered or self.is_overdue or self.is_ended) and not self.has_lender_rated:
+            self.state = 5 if self.is_ended else 4
             self.date_closed = timezone.now()
             self.date_last_changed = self.date_closed
             self.sorted_date = self.date_closed
@@ -318,13 +373,10 @@ class BookExchange(models.Model):
             self.borrower_rating = borrower_rating
             self.has_lender_rated = True
 
-            self.borrower.num_rates += 1
-            self.borrower.rating = ((self.borrower.rating * (self.borrower.num_rates - 1)) + borrower_rating) / self.borrower.num_rates
             try:
-                self.borrower.clean_fields(exclude=['first_name', 'last_name', 'password', 'username', 'image', 'last_retrieval'])
                 self.clean_fields()
-                self.borrower.save()
                 self.save()
+                add_rating(self.borrower, self.borrower_rating)
             except ValidationError as ve:
                 return {k:list(map(str, ve.error_dict[k][0])) for k in ve.error_dict}
 
@@ -333,24 +385,29 @@ class BookExchange(models.Model):
             return False
 
 
-    def generate_unique_slug(self):
-        if not self.slug:
-            new_slug = uuid4().hex[22:] + "x" + uuid4().hex[23:]
-            while BookExchange.objects.filter(slug=new_slug).exists():
-                new_slug = uuid4().hex[22:] + "x" + uuid4().hex[23:]
-            self.slug = new_slug
-            return new_slug
+    @staticmethod
+    def generate_slug():
+        return uuid4().hex[22:] + "x" + uuid4().hex[23:]
 
     def save(self, *args, **kwargs):
-        is_first_time = not(self.slug)
-        if is_first_time:
-            self.generate_unique_slug()
-
-        super(BookExchange, self).save(*args, **kwargs)
-
-        if is_first_time:
-            self.lender = self.book.owner
-            self.save()
+        if self.slug:
+            super(BookExchange, self).save(*args, **kwargs)
+            return
+
+        # the first time, the exchange (with its lender) is inserted at once; with another slug, if its slug is taken:
+        if self.book_id is not None:
+            self.lender_id = self.book.owner_id
+        kwargs['force_insert'] = True
+        while True:
+            self.slug = self.generate_slug()
+            try:
+                with transaction.atomic():
+                    super(BookExchange, self).save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if not BookExchange.objects.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
 
     def __str__(self):
         return self.book_title + " - BORROWED BY: " + self.borrower_username + " - FROM: " + self.lender_username
@@ -379,3 +436,24 @@ class Comment(models.Model):
         self.book = self.book_exchange.book
 
         super(Comment, self).save(*args, **kwargs)
+
+
+class DeletedBookExchange(models.Model):
+    # a deleted exchange (e.g. with its book or its borrower), for the incremental syncs of the borrow & lend lists;
+    # removed by the exchange scheduler after EXCHANGE_DELETION_RETENTION days:
+    slug =                      models.CharField(max_length=30)
+    borrower_id =               models.IntegerField()
+    lender_id =                 models.IntegerField(null=True)
+    date_deleted =              models.DateTimeField(verbose_name='date deleted', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['borrower_id', 'date_deleted'], name='deletedexchange_borrower_idx'),
+            models.Index(fields=['lender_id', 'date_deleted'], name='deletedexchange_lender_idx'),
+            models.Index(fields=['date_deleted'], name='deletedexchange_date_idx'),
+        ]
+
+
+@receiver(post_delete, sender=BookExchange)
+def remember_deleted_exchange(sender, instance, **kwargs):
+    DeletedBookExchange.objects.create(slug=instance.slug, borrower_id=instance.borrower_id, lender_id=instance.lender_id)
@@ -0,0 +1,65 @@
+import json
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from search.pagination import InvalidPageError
+
+
+def parse_date(date):
+    """ returns the (aware) datetime of an ISO 8601 string """
+    try:
+        parsed_date = parse_datetime(date)
+    except (TypeError, ValueError):
+        parsed_date = None
+    if parsed_date is None:
+        raise InvalidPageError('invalid date')
+    if timezone.is_naive(parsed_date):
+        parsed_date = timezone.make_aware(parsed_date)
+    return parsed_date
+
+
+def encode_cursor(book_exchange):
+    return urlsafe_base64_encode(force_bytes(json.dumps(
+        [book_exchange.date_last_changed.isoformat(), book_exchange.state, book_exchange.slug]
+    )))
+
+
+def decode_cursor(cursor):
+    """ returns the (date_last_changed, state, slug) of the last exchange of the previous page """
+    try:
+        date_last_changed, state, slug = json.loads(force_text(urlsafe_base64_decode(cursor)))
+        return parse_date(date_last_changed), int(state), str(slug)
+    except (TypeError, ValueError):
+        raise InvalidPageError('invalid cursor')
+
+
+def paginate(queryset, limit, cursor=None, since=None):
+    """ returns (page, next_cursor) of a queryset of BookExchanges sorted by BOOK_EXCHANGE_LIST_ORDERING
+        (keyset pagination on (date_last_changed, state, slug)); if since is given, only the exchanges
+        changed after it are returned. """
+
+    if since is not None:
+        queryset = queryset.filter(date_last_changed__gt=since)
+
+    if cursor:
+        last_date, last_state, last_slug = decode_cursor(cursor)
+        # the date is descending but the state & slug are ascending, so the rows after the cursor are
+        # the older ones, and the ones of the same date after it (the first condition bounds the index scan):
+        queryset = queryset.filter(date_last_changed__lte=last_date).filter(
+            Q(date_last_changed__lt=last_date) |
+            Q(date_last_changed=last_date, state__gt=last_state) |
+            Q(date_last_changed=last_date, state=last_state, slug__gt=last_slug)
+        )
+
+    # fetching one more row to see if there is a next page:
+    page = list(queryset[:limit + 1])
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
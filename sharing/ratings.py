@@ -0,0 +1,27 @@
+from django.db.models import ExpressionWrapper, F, FloatField
+
+
+def add_rating(instance, rating):
+    """ adds a rating to a user or a book: its rating (the mean of its ratings) & num_rates are updated
+        by the database, from their current values, in one UPDATE (of only these fields), and reloaded """
+    instance.rating = ExpressionWrapper(
+        (F('rating') * F('num_rates') + rating) / (F('num_rates') + 1), output_field=FloatField(),
+    )
+    instance.num_rates = F('num_rates') + 1
+    instance.save(update_fields=['rating', 'num_rates', 'date_updated'])
+    instance.refresh_from_db(fields=['rating', 'num_rates'])
+
+
+def add_borrower(book, lender, borrower):
+    """ counts a (delivered) exchange in the number of borrowers (of the book & the lender) & lenders (of the borrower);
+        the rows are updated in the order of (model, primary key), so two exchanges (e.g. A lending to B, while B
+        lends to A) wait for each other's rows instead of deadlocking """
+    counters = sorted(
+        [(book, 'num_borrowers'), (lender, 'num_borrowers'), (borrower, 'num_lenders')],
+        key=lambda counter: (counter[0]._meta.label, counter[0].pk),
+    )
+    for instance, field in counters:
+        setattr(instance, field, F(field) + 1)
+        instance.save(update_fields=[field, 'date_updated'])
+    for instance, field in counters:
+        instance.refresh_from_db(fields=[field])
@@ -0,0 +1,74 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bookshare.settings import (EXCHANGE_DELETION_RETENTION,
+                                EXCHANGE_LOAN_PERIOD, EXCHANGE_REQUEST_EXPIRY,
+                                EXCHANGE_SCHEDULER_BATCH_SIZE)
+from search.cache import bump_generation
+from sharing.models import BookExchange, DeletedBookExchange
+
+logger = logging.getLogger(__name__)
+
+
+def update_in_batches(exchanges, batch_size, invalidate_search=False, **changes):
+    """ applies the changes (which take the exchanges out of the queryset) to the exchanges, in bulk UPDATEs of
+        (at most) batch_size exchanges, by primary key order; the exchanges being changed by the users (locked) are
+        skipped, and any exchange changed in the meantime is not in the queryset anymore. returns the number of
+        updated exchanges. (the bulk UPDATEs do not send the signals, so if the changes affect the search results,
+        invalidate_search should be set to invalidate the search cache here) """
+    num_updated = 0
+    while True:
+        with transaction.atomic():
+            slugs = list(
+                exchanges.select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not slugs:
+                return num_updated
+            batch_updated = BookExchange.objects.filter(pk__in=slugs).update(**changes)
+            if batch_updated and invalidate_search:
+                transaction.on_commit(bump_generation)
+            num_updated += batch_updated
+
+
+def mark_overdue_exchanges(now=None, batch_size=EXCHANGE_SCHEDULER_BATCH_SIZE):
+    """ the delivered exchanges, EXCHANGE_LOAN_PERIOD days after their delivery, are overdue (their books stay
+        unavailable, so the search results do not change) """
+    now = now or timezone.now()
+    return update_in_batches(
+        BookExchange.objects.filter(state=3, date_delivered__lt=now - timedelta(days=EXCHANGE_LOAN_PERIOD)),
+        batch_size, state=6, date_last_changed=now,
+    )
+
+
+def expire_requests(now=None, batch_size=EXCHANGE_SCHEDULER_BATCH_SIZE):
+    """ the requests which are not responded for EXCHANGE_REQUEST_EXPIRY days are rejected (so their books are available) """
+    now = now or timezone.now()
+    return update_in_batches(
+        BookExchange.objects.filter(state=0, date_requested__lt=now - timedelta(days=EXCHANGE_REQUEST_EXPIRY)),
+        batch_size, invalidate_search=True, state=1, date_last_changed=now,
+    )
+
+
+def purge_deleted_exchanges(now=None):
+    """ removes the deleted exchanges kept for EXCHANGE_DELETION_RETENTION days; returns their number """
+    now = now or timezone.now()
+    return DeletedBookExchange.objects.filter(date_deleted__lt=now - timedelta(days=EXCHANGE_DELETION_RETENTION)).delete()[0]
+
+
+def run_scheduler(interval):
+    """ checks the exchanges every interval seconds, forever """
+    while True:
+        try:
+            mark_overdue_exchanges()
+            expire_requests()
+            purge_deleted_exchanges()
+        except Exception:
+            # (e.g. the database is restarting; retried after the interval):
+            logger.exception("checking the exchanges failed")
+        finally:
+            connection.close()
+        time.sleep(interval)
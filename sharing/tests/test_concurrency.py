@@ -0,0 +1,188 @@
+import threading
+
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from account.models import User
+from book.models import Book
+from sharing.models import BookExchange
+
+NUM_THREADS = 8
+
+
+def run_concurrently(functions):
+    """ runs the functions at the same time (each in a thread, with its own database connection);
+        returns their results """
+    results = [None] * len(functions)
+    errors = []
+    barrier = threading.Barrier(len(functions))
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = functions[i]()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(functions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class ConcurrentBookExchangeAPITestCase(APITransactionTestCase):
+
+    def setUp(self):
+        self.lender = User.objects.create(username="lender", email="lender@alaki.com")
+        self.borrowers = [
+            User.objects.create(username="borrower" + str(i), email="borrower{0}@alaki.com".format(i))
+            for i in range(NUM_THREADS)
+        ]
+        self.books = [
+            Book.objects.create(title='book ' + str(i), description='nothing', page_num=100, category_1=0, owner=self.lender)
+            for i in range(NUM_THREADS)
+        ]
+
+        self.accept_response_data = {
+            'response_result': 'accept',
+            'response_message': 'test response message',
+            'response_meeting_address': 'test response address 1',
+            'response_meeting_year': '1399',
+            'response_meeting_month': '3',
+            'response_meeting_day': '16',
+            'response_meeting_hour': '19',
+            'response_meeting_minute': '5',
+        }
+        self.delivery_data = {
+            'return_meeting_address': 'test response address 2',
+            'return_meeting_year': '1399',
+            'return_meeting_month': '6',
+            'return_meeting_day': '16',
+            'return_meeting_hour': '19',
+            'return_meeting_minute': '5',
+        }
+
+        return super().setUp()
+
+    def get_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def put(self, user, api, exchange_slug, data):
+        return self.get_client(user).put(reverse(api, kwargs={'exchange_slug': exchange_slug}), data=data, format='json')
+
+    def deliver_book(self, book, borrower):
+        """ returns the slug of a (requested, accepted &) delivered exchange of the book """
+        response = self.get_client(borrower).post(
+            reverse('sharing_api:send_borrow_request', kwargs={'book_slug': book.slug}), data={}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        exchange_slug = BookExchange.objects.get(book=book, state=0).slug
+
+        response = self.put(self.lender, 'sharing_api:send_borrow_response', exchange_slug, self.accept_response_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.put(self.lender, 'sharing_api:deliver_book_to_borrower', exchange_slug, self.delivery_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return exchange_slug
+
+    def test_concurrent_borrow_requests(self):
+        book = self.books[0]
+        responses = run_concurrently([
+            lambda borrower=borrower: self.get_client(borrower).post(
+                reverse('sharing_api:send_borrow_request', kwargs={'book_slug': book.slug}), data={}, format='json',
+            )
+            for borrower in self.borrowers
+        ])
+
+        status_codes = sorted(response.status_code for response in responses)
+        self.assertEqual(status_codes, [status.HTTP_200_OK] + [status.HTTP_400_BAD_REQUEST] * (NUM_THREADS - 1))
+        self.assertEqual(BookExchange.objects.filter(book=book).count(), 1)
+
+    def test_concurrent_responses(self):
+        exchange = BookExchange.objects.create(book=self.books[0], borrower=self.borrowers[0])
+        responses = run_concurrently([
+            lambda i=i: self.put(
+                self.lender, 'sharing_api:send_borrow_response', exchange.slug,
+                self.accept_response_data if i % 2 else {'response_result': 'reject'},
+            )
+            for i in range(NUM_THREADS)
+        ])
+
+        # only one of the responses is applied:
+        self.assertEqual([response.status_code for response in responses].count(status.HTTP_200_OK), 1)
+        self.assertIn(BookExchange.objects.get(pk=exchange.pk).state, [1, 2])
+
+    def test_concurrent_return_and_rating(self):
+        exchange_slug = self.deliver_book(self.books[0], self.borrowers[0])
+        responses = run_concurrently([
+            lambda: self.put(self.borrowers[0], 'sharing_api:return_book', exchange_slug, {'lender_rating': 8, 'book_rating': 4}),
+            lambda: self.put(self.lender, 'sharing_api:rate_borrower', exchange_slug, {'borrower_rating': 6}),
+        ])
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * 2)
+
+        exchange = BookExchange.objects.get(pk=exchange_slug)
+        self.assertEqual(exchange.state, 5)
+        self.assertTrue(exchange.has_borrower_rated and exchange.has_lender_rated)
+        self.assertEqual((exchange.lender.num_rates, exchange.book.num_rates, exchange.borrower.num_rates), (1, 1, 1))
+
+    def test_repeated_returns_rate_once(self):
+        exchange_slug = self.deliver_book(self.books[0], self.borrowers[0])
+        responses = run_concurrently([
+            lambda: self.put(self.borrowers[0], 'sharing_api:return_book', exchange_slug, {'lender_rating': 8, 'book_rating': 4})
+            for i in range(NUM_THREADS)
+        ])
+
+        self.assertEqual([response.status_code for response in responses].count(status.HTTP_200_OK), 1)
+        exchange = BookExchange.objects.get(pk=exchange_slug)
+        self.assertEqual(exchange.state, 4)
+        self.assertEqual((exchange.lender.num_rates, exchange.book.num_rates), (1, 1))
+
+    def test_concurrent_ratings_of_a_user(self):
+        exchange_slugs = [self.deliver_book(book, borrower) for book, borrower in zip(self.books, self.borrowers)]
+        lender_ratings = [i % 11 for i in range(NUM_THREADS)]
+        responses = run_concurrently([
+            lambda i=i: self.put(
+                self.borrowers[i], 'sharing_api:return_book', exchange_slugs[i], {'lender_rating': lender_ratings[i], 'book_rating': 3},
+            )
+            for i in range(NUM_THREADS)
+        ])
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * NUM_THREADS)
+
+        # no rating (or number of borrowers) is lost:
+        lender = User.objects.get(pk=self.lender.pk)
+        self.assertEqual(lender.num_rates, NUM_THREADS)
+        self.assertAlmostEqual(lender.rating, sum(lender_ratings) / NUM_THREADS, places=4)
+        self.assertEqual(lender.num_borrowers, NUM_THREADS)
+
+    def test_crossed_deliveries(self):
+        # A lends a book to B, while B lends a book to A (and to the others):
+        users = [self.lender] + self.borrowers[:NUM_THREADS - 1]
+        books = [
+            Book.objects.create(title='crossed book ' + str(i), description='nothing', page_num=100, category_1=0, owner=user)
+            for i, user in enumerate(users)
+        ]
+        exchange_slugs = []
+        for i, book in enumerate(books):
+            exchange = BookExchange.objects.create(book=book, borrower=users[(i + 1) % len(users)], state=2)
+            exchange_slugs.append(exchange.slug)
+
+        responses = run_concurrently([
+            lambda user=user, exchange_slug=exchange_slug: self.put(
+                user, 'sharing_api:deliver_book_to_borrower', exchange_slug, self.delivery_data,
+            )
+            for user, exchange_slug in zip(users, exchange_slugs)
+        ])
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * len(users))
+
+        for user in users:
+            user = User.objects.get(pk=user.pk)
+            self.assertEqual((user.num_borrowers, user.num_lenders), (1, 1))
@@ -2,10 +2,11 @@ from django.db import IntegrityError
 from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from datetime import timedelta
+from unittest import mock
 
 from account.models import User
 from book.models import Author, Book
-from sharing.models import BookExchange, calculate_duration
+from sharing.models import BookExchange, calculate_duration, duration_rank
 
 
 class BookExchangeTransactionTestCase(TransactionTestCase):
@@ -22,6 +23,23 @@ class BookExchangeTransactionTestCase(TransactionTestCase):
         with self.assertRaises(IntegrityError):
             test_book_exchange = BookExchange.objects.create(borrower=test_borrower)
 
+    def test_one_active_book_exchange_per_book(self):
+        test_lender = User.objects.create(username="lender", email="lender@alaki.com")
+        test_book = Book.objects.create(title='test_title', description='test_description', page_num=100, category_1=0, owner=test_lender)
+        test_borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+
+        test_book_exchange = BookExchange.objects.create(book=test_book, borrower=test_borrower)
+        for state in [0, 2, 3]:
+            BookExchange.objects.filter(pk=test_book_exchange.pk).update(state=state)
+            with self.assertRaises(IntegrityError):
+                BookExchange.objects.create(book=test_book, borrower=test_borrower)
+
+        # the ended, closed & rejected exchanges are not active:
+        for state in [1, 4, 5]:
+            BookExchange.objects.filter(pk=test_book_exchange.pk).update(state=state)
+            BookExchange.objects.create(book=test_book, borrower=test_borrower, state=state)
+        self.assertEqual(BookExchange.objects.filter(book=test_book).count(), 4)
+
 
 class BookExchangeTestCase(TestCase):
 
@@ -69,6 +87,37 @@ class BookExchangeTestCase(TestCase):
         self.assertEqual(when_365_days, '1 year ago')
         self.assertEqual(when_750_days, '2 years ago')
 
+    def test_duration_rank(self):
+        now = timezone.now()
+        ages = [
+            timedelta(minutes=2), timedelta(minutes=2, seconds=59), timedelta(minutes=3), timedelta(minutes=59, seconds=59),
+            timedelta(hours=1), timedelta(hours=1, minutes=59), timedelta(hours=2), timedelta(hours=23, minutes=59),
+            timedelta(days=1), timedelta(days=1, hours=23), timedelta(days=2), timedelta(days=30, hours=23),
+            timedelta(days=31), timedelta(days=61), timedelta(days=62), timedelta(days=364),
+            timedelta(days=365), timedelta(days=729), timedelta(days=730),
+        ]
+
+        durations, ranks = [], []
+        for age in ages:
+            BookExchange.objects.filter(pk=self.test_book_exchange.pk).update(date_last_changed=now - age)
+            durations.append(calculate_duration(now - age, now))
+            ranks.append(BookExchange.objects.annotate(rank=duration_rank('date_last_changed', now)).get().rank)
+
+        # the rank grows exactly when the text of the duration changes:
+        for i in range(1, len(ages)):
+            self.assertGreaterEqual(ranks[i], ranks[i - 1])
+            self.assertEqual(ranks[i] != ranks[i - 1], durations[i] != durations[i - 1], (ages[i], durations[i]))
+
+    def test_slug_collision(self):
+        taken_slug = self.test_book_exchange.slug
+        other_book = Book.objects.create(title='other_title', description='test_description', page_num=100, category_1=0, owner=self.test_lender)
+        with mock.patch.object(BookExchange, 'generate_slug', side_effect=[taken_slug, taken_slug, 'newxslug']):
+            other_book_exchange = BookExchange.objects.create(borrower=self.test_borrower, book=other_book)
+
+        self.assertEqual(other_book_exchange.slug, 'newxslug')
+        self.assertEqual(BookExchange.objects.get(slug='newxslug').lender, self.test_lender)
+        self.assertEqual(BookExchange.objects.get(slug=taken_slug).book, self.test_book)
+
     def test_other_custom_fields(self):
         test_book_exchange = self.test_book_exchange
 
@@ -0,0 +1,60 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from account.models import User
+from book.models import Book
+from sharing.ratings import add_borrower, add_rating
+
+
+class RatingTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="user", email="user@alaki.com", first_name="test")
+        self.book = Book.objects.create(title='test_title', description='test_description', page_num=100, category_1=0, owner=self.user)
+
+    def test_add_rating_from_current_values(self):
+        # a stale copy of the user (e.g. loaded before another rating):
+        stale_user = User.objects.get(pk=self.user.pk)
+        add_rating(self.user, 4)
+        add_rating(stale_user, 9)
+
+        self.assertEqual(stale_user.num_rates, 2)
+        self.assertAlmostEqual(stale_user.rating, 6.5)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.num_rates, user.rating), (2, 6.5))
+
+        add_rating(self.book, 5)
+        add_rating(self.book, 2)
+        self.assertEqual((self.book.num_rates, self.book.rating), (2, 3.5))
+
+    def test_add_rating_updates_only_the_rating(self):
+        self.user.first_name = "changed"
+        with CaptureQueriesContext(connection) as queries:
+            add_rating(self.user, 4)
+        update_sql = queries.captured_queries[0]['sql']
+        self.assertTrue(update_sql.startswith('UPDATE'))
+        self.assertNotIn('first_name', update_sql)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, "test")
+
+    def test_add_borrower(self):
+        borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+        add_borrower(self.book, self.user, borrower)
+        add_borrower(Book.objects.get(pk=self.book.pk), User.objects.get(pk=self.user.pk), User.objects.get(pk=borrower.pk))
+
+        self.assertEqual(Book.objects.get(pk=self.book.pk).num_borrowers, 2)
+        self.assertEqual(User.objects.get(pk=self.user.pk).num_borrowers, 2)
+        self.assertEqual(User.objects.get(pk=borrower.pk).num_lenders, 2)
+        self.assertEqual(self.book.num_borrowers, 1)
+
+    def test_add_borrower_update_order(self):
+        # (the borrower is created before the lender, so its row comes first):
+        borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+        lender = User.objects.create(username="lender", email="lender@alaki.com")
+        with CaptureQueriesContext(connection) as queries:
+            add_borrower(self.book, lender, borrower)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertIn('"num_lenders"', updates[0])
+        self.assertIn('"account_user"', updates[1])
+        self.assertIn('"book_book"', updates[2])
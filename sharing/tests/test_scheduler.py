@@ -0,0 +1,144 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account.models import User
+from book.models import Book
+from bookshare.settings import (EXCHANGE_DELETION_RETENTION, EXCHANGE_LOAN_PERIOD,
+                                EXCHANGE_REQUEST_EXPIRY)
+from search.cache import get_stats
+from sharing.models import BookExchange, DeletedBookExchange
+from sharing.scheduler import (expire_requests, mark_overdue_exchanges,
+                               purge_deleted_exchanges, run_scheduler)
+
+
+class ExchangeSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.lender = User.objects.create(username="lender", email="lender@alaki.com")
+        self.borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+        self.now = timezone.now()
+
+    def create_exchange(self, state, days_ago):
+        book = Book.objects.create(title='test_title', description='test_description', page_num=100, category_1=0, owner=self.lender)
+        date = self.now - timedelta(days=days_ago)
+        return BookExchange.objects.create(
+            book=book, borrower=self.borrower, state=state, date_requested=date, date_delivered=date, date_last_changed=date,
+        )
+
+    def get_state(self, exchange):
+        return BookExchange.objects.get(pk=exchange.pk).state
+
+    def test_overdue_exchanges(self):
+        overdue_exchanges = [self.create_exchange(3, EXCHANGE_LOAN_PERIOD + 1) for i in range(5)]
+        delivered_exchange = self.create_exchange(3, EXCHANGE_LOAN_PERIOD - 1)
+        ended_exchange = self.create_exchange(4, EXCHANGE_LOAN_PERIOD + 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(mark_overdue_exchanges(self.now, batch_size=2), 5)
+        # (in 3 batches of at most 2 exchanges):
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]), 3)
+
+        for exchange in overdue_exchanges:
+            exchange = BookExchange.objects.get(pk=exchange.pk)
+            self.assertEqual(exchange.state, 6)
+            self.assertEqual(exchange.date_last_changed, self.now)
+        self.assertEqual(self.get_state(delivered_exchange), 3)
+        self.assertEqual(self.get_state(ended_exchange), 4)
+
+        # nothing is left:
+        self.assertEqual(mark_overdue_exchanges(self.now), 0)
+
+    def test_overdue_books_are_unavailable_until_returned(self):
+        exchange = self.create_exchange(3, EXCHANGE_LOAN_PERIOD + 1)
+        mark_overdue_exchanges(self.now)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BookExchange.objects.create(book=exchange.book, borrower=self.borrower)
+
+        exchange = BookExchange.objects.get(pk=exchange.pk)
+        self.assertEqual(exchange.end(lender_rating=5, book_rating=3), True)
+        self.assertEqual(self.get_state(exchange), 4)
+        self.assertEqual(exchange.rate_borrower(borrower_rating=7), True)
+        self.assertEqual(self.get_state(exchange), 5)
+
+    def test_expire_requests(self):
+        old_requests = [self.create_exchange(0, EXCHANGE_REQUEST_EXPIRY + 1) for i in range(3)]
+        new_request = self.create_exchange(0, EXCHANGE_REQUEST_EXPIRY - 1)
+        started_exchange = self.create_exchange(2, EXCHANGE_REQUEST_EXPIRY + 1)
+
+        self.assertEqual(expire_requests(self.now), 3)
+        for exchange in old_requests:
+            self.assertEqual(self.get_state(exchange), 1)
+        self.assertEqual(self.get_state(new_request), 0)
+        self.assertEqual(self.get_state(started_exchange), 2)
+
+        # the books of the expired requests are available again:
+        BookExchange.objects.create(book=old_requests[0].book, borrower=self.borrower)
+
+    def test_purge_deleted_exchanges(self):
+        old_slug, new_slug = self.create_exchange(0, 1).slug, self.create_exchange(0, 1).slug
+        BookExchange.objects.filter(slug__in=[old_slug, new_slug]).delete()
+        DeletedBookExchange.objects.filter(slug=old_slug).update(
+            date_deleted=self.now - timedelta(days=EXCHANGE_DELETION_RETENTION + 1),
+        )
+
+        self.assertEqual(purge_deleted_exchanges(self.now), 1)
+        self.assertEqual(list(DeletedBookExchange.objects.values_list('slug', flat=True)), [new_slug])
+
+    def test_run_exchange_scheduler_command(self):
+        self.create_exchange(3, EXCHANGE_LOAN_PERIOD + 1)
+        self.create_exchange(0, EXCHANGE_REQUEST_EXPIRY + 1)
+
+        out = StringIO()
+        call_command('run_exchange_scheduler', stdout=out)
+        self.assertIn("1 exchanges are overdue, and 1 requests were expired.", out.getvalue())
+
+
+class ExchangeSchedulerTransactionTestCase(TransactionTestCase):
+
+    def test_search_cache_invalidated(self):
+        lender = User.objects.create(username="lender", email="lender@alaki.com")
+        borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+        book = Book.objects.create(title='test_title', description='test_description', page_num=100, category_1=0, owner=lender)
+        date = timezone.now() - timedelta(days=EXCHANGE_REQUEST_EXPIRY + 1)
+        BookExchange.objects.create(book=book, borrower=borrower, date_requested=date)
+        BookExchange.objects.create(
+            book=Book.objects.create(title='test_title', description='test_description', page_num=100, category_1=0, owner=lender),
+            borrower=borrower, state=3, date_delivered=timezone.now() - timedelta(days=EXCHANGE_LOAN_PERIOD + 1),
+        )
+
+        # (an overdue book is still unavailable):
+        generation = get_stats()['generation']
+        self.assertEqual(mark_overdue_exchanges(), 1)
+        self.assertEqual(get_stats()['generation'], generation)
+
+        # (the book is available again, after the commit of the batch):
+        generation = get_stats()['generation']
+        self.assertEqual(expire_requests(), 1)
+        self.assertNotEqual(get_stats()['generation'], generation)
+
+        # nothing is changed:
+        generation = get_stats()['generation']
+        self.assertEqual(expire_requests(), 0)
+        self.assertEqual(get_stats()['generation'], generation)
+
+    def test_run_scheduler_survives_errors(self):
+        class StopScheduler(Exception):
+            pass
+
+        # the failed checks are logged (and the connection closed), and retried after the interval:
+        with mock.patch('sharing.scheduler.mark_overdue_exchanges', side_effect=[IntegrityError, 0]) as mock_mark, \
+                mock.patch('sharing.scheduler.time.sleep', side_effect=[None, StopScheduler]), \
+                mock.patch('sharing.scheduler.connection.close') as mock_close, \
+                self.assertLogs('sharing.scheduler', level='ERROR'):
+            with self.assertRaises(StopScheduler):
+                run_scheduler(60)
+        self.assertEqual(mock_mark.call_count, 2)
+        self.assertEqual(mock_close.call_count, 2)
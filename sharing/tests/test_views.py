@@ -1,9 +1,11 @@
 import json
 import os
 import tempfile
+from datetime import timedelta
 
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from PIL import Image
@@ -12,7 +14,8 @@ from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 
 from account.models import User
 from book.models import Book
-from bookshare.settings import DEFAULT_BOOK_IMAGE, MEDIA_ROOT
+from bookshare.settings import DEFAULT_BOOK_IMAGE, EXCHANGE_DELETION_RETENTION, MEDIA_ROOT
+from sharing.api.views import MSG_BOOK_UNAVAILABLE
 from sharing.models import BookExchange
 
 
@@ -82,6 +85,54 @@ class RegisterBookBorrowRequestAPITestCase(APITestCase):
         # response status code:
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_post_borrow_request_single_insert(self):
+        client = APIClient()
+        client.force_authenticate(self.test_borrower)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                reverse('sharing_api:send_borrow_request', kwargs={'book_slug': self.test_book.slug}),
+                data={
+                    'request_message': self.test_message,
+                    'request_phone_number': self.test_phone_number,
+                },
+                format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the book is read, and the exchange is inserted (without any other query):
+        exchange_queries = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(exchange_queries), 2)
+        self.assertTrue(exchange_queries[1].startswith('INSERT INTO "sharing_bookexchange"'))
+
+        book_exchange = BookExchange.objects.get(book=self.test_book.pk)
+        self.assertEqual(book_exchange.lender, self.test_lender)
+        self.assertEqual(book_exchange.request_email, self.test_borrower.email)
+        self.assertEqual(book_exchange.date_last_changed, book_exchange.date_requested)
+
+    def test_post_borrow_request_of_unavailable_book(self):
+        other_borrower = User.objects.create(username="other_borrower", email="other_borrower@alaki.com")
+        BookExchange.objects.create(book=self.test_book, borrower=other_borrower)
+
+        client = APIClient()
+        client.force_authenticate(self.test_borrower)
+        response = client.post(
+            reverse('sharing_api:send_borrow_request', kwargs={'book_slug': self.test_book.slug}),
+            data={
+                'request_message': self.test_message,
+                'request_phone_number': self.test_phone_number,
+            },
+            format='json'
+        )
+
+        if response.status_code != status.HTTP_400_BAD_REQUEST:
+            print("response json:", response.data)
+
+        # response status code:
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], MSG_BOOK_UNAVAILABLE)
+        self.assertEqual(BookExchange.objects.filter(book=self.test_book).count(), 1)
+
 
 class AddBookBorrowResponseAPITestCase(APITestCase):
 
@@ -463,6 +514,110 @@ class SortedUserBorrowListAPITestCase(APITestCase):
         self.assertEqual(borrow_list[5]["book_title"], "test_title3")
 
 
+class PaginatedUserExchangeListAPITestCase(APITestCase):
+
+    urls = 'sharing.api.urls'
+
+    def setUp(self):
+        self.test_lender = User.objects.create(username="lender", email="lender@alaki.com")
+        self.test_borrower = User.objects.create(username="borrower", email="borrower@alaki.com")
+
+        # 7 exchanges, some of them changed at the same time (ordered by state, then slug):
+        now = timezone.now()
+        self.changes = [(now, 4), (now, 0), (now, 0), (now - timedelta(days=1), 2),
+                        (now - timedelta(days=2), 5), (now - timedelta(days=2), 1), (now - timedelta(days=3), 0)]
+        for i, (date_last_changed, state) in enumerate(self.changes):
+            test_book = Book.objects.create(title='test_title' + str(i), description='test_description', page_num=100, category_1=0, owner=self.test_lender)
+            BookExchange.objects.create(
+                slug='exchange' + str(i), book=test_book, borrower=self.test_borrower, lender=self.test_lender,
+                state=state, date_last_changed=date_last_changed,
+            )
+
+        self.borrower_client = APIClient()
+        self.borrower_client.force_authenticate(self.test_borrower)
+        self.lender_client = APIClient()
+        self.lender_client.force_authenticate(self.test_lender)
+
+        return super().setUp()
+
+    def get_all_pages(self, client, url_name, list_name, limit, since=None):
+        exchanges_list, cursor = [], None
+        while True:
+            params = {'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            if since:
+                params['since'] = since
+            response = client.get(reverse(url_name), params)
+            if response.status_code != status.HTTP_200_OK:
+                print("response json:", response.data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data[list_name]), limit)
+
+            exchanges_list += response.data[list_name]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return exchanges_list, response.data['sync_time']
+
+    def test_paginated_borrow_and_lend_lists(self):
+        expected_slugs = ['exchange1', 'exchange2', 'exchange0', 'exchange3', 'exchange5', 'exchange4', 'exchange6']
+
+        for limit in [1, 2, 3, 7, 10]:
+            borrow_list, sync_time = self.get_all_pages(self.borrower_client, 'sharing_api:get_borrow_list', 'borrow_list_to_show', limit)
+            self.assertEqual([borrow['slug'] for borrow in borrow_list], expected_slugs)
+
+            lend_list, sync_time = self.get_all_pages(self.lender_client, 'sharing_api:get_lend_list', 'lend_list_to_show', limit)
+            self.assertEqual([lend['slug'] for lend in lend_list], expected_slugs)
+
+    def get_sync(self, client, url_name, since):
+        response = client.get(reverse(url_name), {'since': since})
+        if response.status_code != status.HTTP_200_OK:
+            print("response json:", response.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_borrow_list_since_last_sync(self):
+        borrow_list, sync_time = self.get_all_pages(self.borrower_client, 'sharing_api:get_borrow_list', 'borrow_list_to_show', 3)
+
+        # only the exchanges changed in the last MAX_TRANSACTION_TIME seconds (maybe committed after the sync) are sent again:
+        borrow_list, last_sync_time = self.get_all_pages(self.borrower_client, 'sharing_api:get_borrow_list', 'borrow_list_to_show', 3, since=sync_time.isoformat())
+        self.assertEqual([borrow['slug'] for borrow in borrow_list], ['exchange1', 'exchange2', 'exchange0'])
+
+        # changing an exchange:
+        BookExchange.objects.filter(slug='exchange6').update(state=1, date_last_changed=timezone.now())
+        borrow_list, last_sync_time = self.get_all_pages(self.borrower_client, 'sharing_api:get_borrow_list', 'borrow_list_to_show', 3, since=sync_time.isoformat())
+        self.assertEqual([(borrow['slug'], borrow['state']) for borrow in borrow_list][0], ('exchange6', 1))
+
+    def test_late_commits_are_synced(self):
+        sync_time = self.get_sync(self.borrower_client, 'sharing_api:get_borrow_list', '')['sync_time']
+
+        # a change stamped before the sync, but committed after it:
+        BookExchange.objects.filter(slug='exchange6').update(state=1, date_last_changed=timezone.now() - timedelta(seconds=5))
+        borrow_list = self.get_sync(self.borrower_client, 'sharing_api:get_borrow_list', sync_time.isoformat())['borrow_list_to_show']
+        self.assertIn(('exchange6', 1), [(borrow['slug'], borrow['state']) for borrow in borrow_list])
+
+    def test_deleted_exchanges_are_synced(self):
+        sync_time = self.get_sync(self.lender_client, 'sharing_api:get_lend_list', '')['sync_time']
+        self.assertEqual(self.get_sync(self.lender_client, 'sharing_api:get_lend_list', sync_time.isoformat())['deleted'], [])
+
+        # (with its book):
+        Book.objects.get(title='test_title3').delete()
+        for client, url_name in [(self.lender_client, 'sharing_api:get_lend_list'), (self.borrower_client, 'sharing_api:get_borrow_list')]:
+            response_data = self.get_sync(client, url_name, sync_time.isoformat())
+            self.assertEqual(response_data['deleted'], ['exchange3'])
+        self.assertEqual(self.get_sync(self.lender_client, 'sharing_api:get_lend_list', '')['deleted'], [])
+
+        # the deletions are kept for EXCHANGE_DELETION_RETENTION days:
+        old_since = (timezone.now() - timedelta(days=EXCHANGE_DELETION_RETENTION + 1)).isoformat()
+        response = self.lender_client.get(reverse('sharing_api:get_lend_list'), {'since': old_since})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_page(self):
+        for invalid_params in [{'limit': 0}, {'cursor': 'not a cursor'}, {'since': 'yesterday'}]:
+            response = self.borrower_client.get(reverse('sharing_api:get_borrow_list'), invalid_params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class GetUserLendListAPITestCase(APITestCase):
 
     urls = 'sharing.api.urls'
@@ -674,6 +829,43 @@ class GetExchangePropertiesAPITestCase(APITestCase):
         self.assertEqual(response_data['state'], 2)
 
 
+    def test_get_exchange_properties_etag(self):
+        borrower_client = APIClient()
+        borrower_client.force_authenticate(self.test_borrower)
+        borrower_client.post(
+            reverse('sharing_api:send_borrow_request', kwargs={'book_slug': self.test_book.slug}),
+            data={
+                'request_message': self.test_message,
+                'request_phone_number': self.test_phone_number,
+            },
+            format='json'
+        )
+        borrow_request = BookExchange.objects.all()[0]
+        url = reverse('sharing_api:get_exchange_properties', kwargs={'exchange_slug': borrow_request.slug})
+
+        response = borrower_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # not modified, without loading the authors & the comment:
+        with self.assertNumQueries(1):
+            response = borrower_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # accepting the request:
+        lender_client = APIClient()
+        lender_client.force_authenticate(self.test_lender)
+        lender_client.put(
+            reverse('sharing_api:send_borrow_response', kwargs={'exchange_slug': borrow_request.slug}),
+            data=self.accept_response_data,
+            format='json'
+        )
+        response = borrower_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+
 class DeliverBookToBorrowerAPITestCase(APITestCase):
 
     urls = 'sharing.api.urls'